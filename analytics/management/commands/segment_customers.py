@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from analytics.models import CustomerSegment
+from analytics.rfm import CHUNK_SIZE, run_segmentation
+
+
+class Command(BaseCommand):
+    help = "Segmentation RFM des clients (incrémentale par défaut, à planifier en cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Relire toutes les commandes')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        run = run_segmentation(full=options['full'], chunk_size=options['chunk_size'])
+        mode = 'complète' if run.full else 'incrémentale'
+        self.stdout.write(self.style.SUCCESS(
+            f"Segmentation {mode} : {run.orders_scanned} commandes lues, "
+            f"{run.customers_updated} clients mis à jour en {run.duration_ms} ms"
+        ))
+        labels = dict(CustomerSegment.SEGMENTS)
+        counts = CustomerSegment.objects.values_list('segment').order_by('segment')
+        for code, customers in counts.annotate(customers=Count('pk')):
+            self.stdout.write(f"  {labels.get(code, code):<25} {customers:>8}")
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full', models.BooleanField(default=False, verbose_name='Recalcul complet')),
+                ('started_at', models.DateTimeField(verbose_name='Début')),
+                ('synced_until', models.DateTimeField(verbose_name="Commandes lues jusqu'au")),
+                ('orders_scanned', models.PositiveIntegerField(default=0, verbose_name='Commandes lues')),
+                ('customers_updated', models.PositiveIntegerField(default=0, verbose_name='Clients mis à jour')),
+                ('duration_ms', models.PositiveIntegerField(default=0, verbose_name='Durée (ms)')),
+            ],
+            options={
+                'verbose_name': 'Segmentation RFM',
+                'verbose_name_plural': 'Segmentations RFM',
+                'ordering': ['-started_at'],
+                'get_latest_by': 'started_at',
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerSegment',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='customer_segment', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+                ('first_order_at', models.DateTimeField(verbose_name='Première commande')),
+                ('last_order_at', models.DateTimeField(verbose_name='Dernière commande')),
+                ('frequency', models.PositiveIntegerField(verbose_name='Nombre de commandes')),
+                ('monetary', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Montant total')),
+                ('recency_score', models.PositiveSmallIntegerField(default=1, verbose_name='Score de récence')),
+                ('frequency_score', models.PositiveSmallIntegerField(default=1, verbose_name='Score de fréquence')),
+                ('monetary_score', models.PositiveSmallIntegerField(default=1, verbose_name='Score de montant')),
+                ('segment', models.CharField(choices=[('champions', 'Champions'), ('loyal', 'Fidèles'), ('potential', 'Fidèles potentiels'), ('new', 'Nouveaux clients'), ('promising', 'Prometteurs'), ('need_attention', 'À surveiller'), ('about_to_sleep', 'Sur le point de partir'), ('at_risk', 'À risque'), ('cant_lose', 'À ne pas perdre'), ('hibernating', 'En sommeil'), ('lost', 'Perdus')], default='new', max_length=20, verbose_name='Segment')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Segment client',
+                'verbose_name_plural': 'Segments clients',
+                'indexes': [models.Index(fields=['segment', '-monetary_score'], name='customer_segment_idx')],
+            },
+        ),
+    ]
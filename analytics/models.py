@@ -1,3 +1,69 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class CustomerSegment(models.Model):
+    """
+    Segment RFM d'un client (récence, fréquence, montant)
+
+    Recalculé par analytics.rfm à partir des commandes comptées dans les
+    statistiques client ; indexé par segment pour le ciblage.
+    """
+    SEGMENTS = [
+        ('champions', 'Champions'),
+        ('loyal', 'Fidèles'),
+        ('potential', 'Fidèles potentiels'),
+        ('new', 'Nouveaux clients'),
+        ('promising', 'Prometteurs'),
+        ('need_attention', 'À surveiller'),
+        ('about_to_sleep', 'Sur le point de partir'),
+        ('at_risk', 'À risque'),
+        ('cant_lose', 'À ne pas perdre'),
+        ('hibernating', 'En sommeil'),
+        ('lost', 'Perdus'),
+    ]
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='customer_segment', verbose_name="Utilisateur")
+    first_order_at = models.DateTimeField(verbose_name="Première commande")
+    last_order_at = models.DateTimeField(verbose_name="Dernière commande")
+    frequency = models.PositiveIntegerField(verbose_name="Nombre de commandes")
+    monetary = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Montant total")
+    recency_score = models.PositiveSmallIntegerField(default=1, verbose_name="Score de récence")
+    frequency_score = models.PositiveSmallIntegerField(default=1, verbose_name="Score de fréquence")
+    monetary_score = models.PositiveSmallIntegerField(default=1, verbose_name="Score de montant")
+    segment = models.CharField(max_length=20, choices=SEGMENTS, default='new', verbose_name="Segment")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Segment client"
+        verbose_name_plural = "Segments clients"
+        indexes = [
+            models.Index(fields=['segment', '-monetary_score'], name='customer_segment_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} : {self.get_segment_display()}"
+
+    @property
+    def rfm_code(self):
+        return f"{self.recency_score}{self.frequency_score}{self.monetary_score}"
+
+
+class SegmentationRun(models.Model):
+    """Exécution de la segmentation RFM (sert aussi de curseur aux exécutions incrémentales)"""
+    full = models.BooleanField(default=False, verbose_name="Recalcul complet")
+    started_at = models.DateTimeField(verbose_name="Début")
+    synced_until = models.DateTimeField(verbose_name="Commandes lues jusqu'au")
+    orders_scanned = models.PositiveIntegerField(default=0, verbose_name="Commandes lues")
+    customers_updated = models.PositiveIntegerField(default=0, verbose_name="Clients mis à jour")
+    duration_ms = models.PositiveIntegerField(default=0, verbose_name="Durée (ms)")
+
+    class Meta:
+        verbose_name = "Segmentation RFM"
+        verbose_name_plural = "Segmentations RFM"
+        ordering = ['-started_at']
+        get_latest_by = 'started_at'
+
+    def __str__(self):
+        return f"Segmentation du {self.started_at:%d/%m/%Y %H:%M}"
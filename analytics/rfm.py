@@ -0,0 +1,287 @@
+"""
+Segmentation RFM des clients (récence, fréquence, montant)
+
+Les commandes comptées dans les statistiques client sont lues en flux
+(``.iterator()``) par paquets convertis en tableaux NumPy et réduits par
+client au fil de la lecture : la mémoire dépend du nombre de clients, pas
+du nombre de commandes. Les scores de 1 à 5 sont attribués par quantiles
+sur toute la clientèle, le segment est lu dans une grille récence x
+fréquence, et les lignes modifiées sont écrites par upsert groupé.
+
+Une exécution incrémentale ne relit que les commandes des clients dont une
+commande a changé depuis la précédente (index sur updated_at) ; les scores
+de tous les clients sont ensuite recalculés à partir des agrégats déjà
+stockés, sans relire leurs commandes. Un recalcul complet (--full) reste
+nécessaire après une correction hors du flux normal (rebuild_order_stats,
+suppression de commandes).
+"""
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from checkout.models import Order
+from .models import CustomerSegment, SegmentationRun
+
+
+CHUNK_SIZE = getattr(settings, 'RFM_CHUNK_SIZE', 20000)
+WRITE_BATCH_SIZE = 1000
+# Recouvrement avec l'exécution précédente : commandes validées pendant qu'elle lisait
+CURSOR_OVERLAP = timedelta(minutes=getattr(settings, 'RFM_CURSOR_OVERLAP_MINUTES', 10))
+QUANTILES = (0.2, 0.4, 0.6, 0.8)
+
+SEGMENT_CODES = [value for value, _ in CustomerSegment.SEGMENTS]
+
+# Segment par score de récence (lignes 1 à 5) et de fréquence (colonnes 1 à 5)
+SEGMENT_GRID = np.array([
+    [SEGMENT_CODES.index(name) for name in row]
+    for row in [
+        ['lost', 'hibernating', 'at_risk', 'at_risk', 'cant_lose'],
+        ['hibernating', 'hibernating', 'at_risk', 'at_risk', 'cant_lose'],
+        ['about_to_sleep', 'about_to_sleep', 'need_attention', 'loyal', 'loyal'],
+        ['promising', 'potential', 'potential', 'loyal', 'champions'],
+        ['new', 'potential', 'potential', 'champions', 'champions'],
+    ]
+], dtype=np.int64)
+
+
+def _chunks(queryset, fields, chunk_size):
+    """Lignes de la requête par paquets de `chunk_size`, colonne par colonne"""
+    rows = queryset.order_by().values_list(*fields).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield len(chunk), list(zip(*chunk))
+
+
+def _reduce(users, first, last, count, cents):
+    """Regrouper par client : première et dernière commande, nombre et montant"""
+    if not len(users):
+        return users, first, last, count, cents
+    order = np.argsort(users, kind='stable')
+    users = users[order]
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    return (
+        users[starts],
+        np.minimum.reduceat(first[order], starts),
+        np.maximum.reduceat(last[order], starts),
+        np.add.reduceat(count[order], starts),
+        np.add.reduceat(cents[order], starts),
+    )
+
+
+def _concat_reduce(parts):
+    return _reduce(*(np.concatenate(column) for column in zip(*parts)))
+
+
+def _empty_aggregates():
+    return (np.zeros(0, np.int64), np.zeros(0), np.zeros(0), np.zeros(0, np.int64), np.zeros(0, np.int64))
+
+
+def aggregate_orders(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Agréger les commandes par client, en flux
+
+    Returns:
+        tuple: ((clients, première commande, dernière commande, nombre,
+                 montant en centimes) en tableaux triés par client,
+                nombre de commandes lues)
+    """
+    parts = []
+    scanned = 0
+    for n, (users, created, totals) in _chunks(queryset, ('user_id', 'created_at', 'total'), chunk_size):
+        timestamps = np.fromiter((value.timestamp() for value in created), np.float64, n)
+        parts.append(_reduce(
+            np.fromiter(users, np.int64, n),
+            timestamps,
+            timestamps,
+            np.ones(n, np.int64),
+            np.rint(np.fromiter(totals, np.float64, n) * 100).astype(np.int64),
+        ))
+        scanned += n
+        # Réduction intermédiaire : les clients revenant d'un paquet à l'autre ne s'accumulent pas
+        if len(parts) >= 16:
+            parts = [_concat_reduce(parts)]
+    if not parts:
+        return _empty_aggregates(), 0
+    return _concat_reduce(parts), scanned
+
+
+def load_segments(chunk_size=CHUNK_SIZE):
+    """
+    Agrégats et scores déjà stockés
+
+    Returns:
+        tuple: (agrégats comme aggregate_orders, scores n x 4 : récence,
+                fréquence, montant, indice du segment)
+    """
+    segment_index = {code: index for index, code in enumerate(SEGMENT_CODES)}
+    parts, scores = [], []
+    fields = ('user_id', 'first_order_at', 'last_order_at', 'frequency', 'monetary',
+              'recency_score', 'frequency_score', 'monetary_score', 'segment')
+    for n, columns in _chunks(CustomerSegment.objects.all(), fields, chunk_size):
+        users, first, last, frequency, monetary, recency_score, frequency_score, monetary_score, segment = columns
+        parts.append((
+            np.fromiter(users, np.int64, n),
+            np.fromiter((value.timestamp() for value in first), np.float64, n),
+            np.fromiter((value.timestamp() for value in last), np.float64, n),
+            np.fromiter(frequency, np.int64, n),
+            np.rint(np.fromiter(monetary, np.float64, n) * 100).astype(np.int64),
+        ))
+        scores.append(np.column_stack((
+            np.fromiter(recency_score, np.int64, n),
+            np.fromiter(frequency_score, np.int64, n),
+            np.fromiter(monetary_score, np.int64, n),
+            np.fromiter((segment_index.get(code, 0) for code in segment), np.int64, n),
+        )))
+    if not parts:
+        return _empty_aggregates(), np.zeros((0, 4), np.int64)
+    # Lignes lues dans l'ordre des clés primaires (user_id) : déjà triées
+    return tuple(np.concatenate(column) for column in zip(*parts)), np.concatenate(scores)
+
+
+def quantile_scores(values, higher_is_better=True):
+    """
+    Score de 1 à 5 par quintile
+
+    Les valeurs égales à une borne restent dans le quintile inférieur : avec
+    beaucoup de clients à une seule commande, ceux-ci ont tous le score 1 en
+    fréquence au lieu d'être répartis arbitrairement.
+    """
+    if not len(values):
+        return np.zeros(0, np.int64)
+    ranks = np.searchsorted(np.quantile(values, QUANTILES), values, side='left')
+    return ranks + 1 if higher_is_better else len(QUANTILES) + 1 - ranks
+
+
+def score_customers(last, frequency, cents, now):
+    """
+    Scores RFM et segment de chaque client
+
+    Returns:
+        numpy.ndarray: n x 4 (récence, fréquence, montant, indice du segment)
+    """
+    recency_days = (now.timestamp() - last) / 86400
+    recency = quantile_scores(recency_days, higher_is_better=False)
+    frequency = quantile_scores(frequency)
+    monetary = quantile_scores(cents)
+    if not len(recency):
+        return np.zeros((0, 4), np.int64)
+    return np.column_stack((recency, frequency, monetary, SEGMENT_GRID[recency - 1, frequency - 1]))
+
+
+def _write_segments(users, first, last, frequency, cents, scores):
+    """Upsert des segments, par lots"""
+    written = 0
+    for start in range(0, len(users), WRITE_BATCH_SIZE):
+        end = start + WRITE_BATCH_SIZE
+        batch = zip(
+            users[start:end].tolist(), first[start:end].tolist(), last[start:end].tolist(),
+            frequency[start:end].tolist(), cents[start:end].tolist(), scores[start:end].tolist(),
+        )
+        written += len(CustomerSegment.objects.bulk_create(
+            [
+                CustomerSegment(
+                    user_id=user_id,
+                    first_order_at=datetime.fromtimestamp(first_ts, tz=dt_timezone.utc),
+                    last_order_at=datetime.fromtimestamp(last_ts, tz=dt_timezone.utc),
+                    frequency=count,
+                    monetary=Decimal(amount).scaleb(-2),
+                    recency_score=recency,
+                    frequency_score=frequency_score,
+                    monetary_score=monetary,
+                    segment=SEGMENT_CODES[segment],
+                )
+                for user_id, first_ts, last_ts, count, amount, (recency, frequency_score, monetary, segment) in batch
+            ],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=[
+                'first_order_at', 'last_order_at', 'frequency', 'monetary',
+                'recency_score', 'frequency_score', 'monetary_score', 'segment', 'updated_at',
+            ],
+        ))
+    return written
+
+
+def _delete_segments(user_ids):
+    for start in range(0, len(user_ids), WRITE_BATCH_SIZE):
+        CustomerSegment.objects.filter(pk__in=user_ids[start:start + WRITE_BATCH_SIZE].tolist()).delete()
+
+
+def _changed_customers(since, chunk_size):
+    """Clients dont une commande a été créée ou modifiée depuis `since`"""
+    parts = [
+        np.unique(np.fromiter(users, np.int64, n))
+        for n, (users,) in _chunks(Order.objects.filter(updated_at__gte=since), ('user_id',), chunk_size)
+    ]
+    return np.unique(np.concatenate(parts)) if parts else np.zeros(0, np.int64)
+
+
+def run_segmentation(full=False, chunk_size=CHUNK_SIZE, now=None):
+    """
+    Recalculer les segments RFM
+
+    Sans exécution précédente, le recalcul est complet. Sinon seules les
+    commandes des clients concernés depuis la dernière exécution sont
+    relues ; leurs agrégats remplacent les anciens, puis toute la clientèle
+    est notée à nouveau (les quintiles et la récence évoluent) et seules les
+    lignes dont le résultat change sont écrites.
+
+    Returns:
+        SegmentationRun: Exécution enregistrée
+    """
+    started = time.monotonic()
+    now = now or timezone.now()
+    last_run = None if full else SegmentationRun.objects.order_by('-started_at').first()
+    counted = Order.objects.filter(in_customer_stats=True)
+
+    if last_run is None:
+        aggregates, scanned = aggregate_orders(counted, chunk_size)
+        stored, stored_scores = load_segments(chunk_size)
+        removed = np.setdiff1d(stored[0], aggregates[0], assume_unique=True)
+        population = aggregates
+        # Recalcul complet : toutes les lignes sont réécrites
+        write = np.ones(len(aggregates[0]), dtype=bool)
+        previous_scores = None
+    else:
+        changed = _changed_customers(last_run.synced_until - CURSOR_OVERLAP, chunk_size)
+        parts, scanned = [], 0
+        for start in range(0, len(changed), WRITE_BATCH_SIZE):
+            part, n = aggregate_orders(counted.filter(user_id__in=changed[start:start + WRITE_BATCH_SIZE].tolist()),
+                                       chunk_size)
+            parts.append(part)
+            scanned += n
+        aggregates = _concat_reduce(parts) if parts else _empty_aggregates()
+        stored, stored_scores = load_segments(chunk_size)
+        # Clients qui n'ont plus de commande comptée (remboursement, annulation)
+        removed = np.intersect1d(np.setdiff1d(changed, aggregates[0], assume_unique=True), stored[0],
+                                 assume_unique=True)
+        keep = ~np.isin(stored[0], changed, assume_unique=True)
+        population = tuple(np.concatenate((old[keep], new)) for old, new in zip(stored, aggregates))
+        write = np.r_[np.zeros(keep.sum(), dtype=bool), np.ones(len(aggregates[0]), dtype=bool)]
+        previous_scores = stored_scores[keep]
+
+    users, first, last, frequency, cents = population
+    scores = score_customers(last, frequency, cents, now)
+    if previous_scores is not None:
+        # Clients non relus : écrits seulement si leur note ou leur segment change
+        write[:len(previous_scores)] = (scores[:len(previous_scores)] != previous_scores).any(axis=1)
+
+    with transaction.atomic():
+        _delete_segments(removed)
+        updated = _write_segments(*(column[write] for column in (users, first, last, frequency, cents, scores)))
+        return SegmentationRun.objects.create(
+            full=last_run is None,
+            started_at=now,
+            synced_until=now,
+            orders_scanned=scanned,
+            customers_updated=updated + len(removed),
+            duration_ms=int((time.monotonic() - started) * 1000),
+        )
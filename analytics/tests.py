@@ -1,3 +1,62 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+
+from checkout.models import Address, Order
+from .models import CustomerSegment, SegmentationRun
+from .rfm import run_segmentation
+
+
+class IncrementalSegmentationTest(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.users = [User.objects.create_user(f'client{index}', f'client{index}@example.com', 'password')
+                      for index in range(4)]
+        for index, user in enumerate(self.users):
+            for days in range(index + 1):
+                self.order(user, total=Decimal(20 * (index + 1)), days_ago=10 * (days + 1))
+        # Commandes déjà anciennes : seules celles modifiées ensuite sont relues
+        Order.objects.update(updated_at=self.now - timedelta(days=1))
+
+    def order(self, user, total, days_ago=0):
+        address, _ = Address.objects.get_or_create(
+            user=user, first_name='Client', last_name='Test', address_line_1='1 rue des Glaces',
+            city='Casablanca', postal_code='20000',
+        )
+        order = Order.objects.create(
+            order_number=f'T{Order.objects.count():06d}', user=user, shipping_address=address,
+            billing_address=address, subtotal=total, shipping_cost=0, total=total,
+            payment_status='paid', order_status='confirmed', in_customer_stats=True,
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=self.now - timedelta(days=days_ago))
+        return order
+
+    def segments(self):
+        return {
+            segment.user_id: (segment.frequency, segment.monetary, segment.rfm_code, segment.segment)
+            for segment in CustomerSegment.objects.all()
+        }
+
+    def test_incremental_run_matches_a_full_run(self):
+        first = run_segmentation(now=self.now)
+        self.assertTrue(first.full)
+        self.assertEqual(first.orders_scanned, 10)
+
+        later = self.now + timedelta(hours=1)
+        self.order(self.users[0], total=Decimal('500.00'))
+        # Commandes du client 1 sorties du périmètre (remboursées)
+        Order.objects.filter(user=self.users[1]).update(in_customer_stats=False, updated_at=later)
+
+        run = run_segmentation(now=later)
+        self.assertFalse(run.full)
+        self.assertEqual(run.orders_scanned, 2)
+        incremental = self.segments()
+        self.assertNotIn(self.users[1].pk, incremental)
+        self.assertEqual(incremental[self.users[0].pk][:2], (2, Decimal('520.00')))
 
-# Create your tests here.
+        run_segmentation(full=True, now=later)
+        self.assertEqual(self.segments(), incremental)
+        self.assertEqual(SegmentationRun.objects.count(), 3)
@@ -1,6 +1,9 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Avg, Count, Sum
+
+from .models import CustomerSegment, SegmentationRun
 
 @staff_member_required
 def dashboard_view(request):
@@ -19,5 +22,32 @@ def products_analytics(request):
 
 @staff_member_required
 def customers_analytics(request):
-    """Analytics des clients"""
-    return render(request, 'analytics/customers.html')
+    """Analytics des clients : répartition par segment RFM"""
+    labels = dict(CustomerSegment.SEGMENTS)
+    rows = {
+        row['segment']: row
+        for row in CustomerSegment.objects.values('segment').order_by().annotate(
+            customers=Count('pk'),
+            revenue=Sum('monetary'),
+            avg_frequency=Avg('frequency'),
+            avg_monetary=Avg('monetary'),
+        )
+    }
+    total = sum(row['customers'] for row in rows.values())
+    segments = [
+        {
+            'code': code,
+            'label': labels[code],
+            'customers': rows.get(code, {}).get('customers', 0),
+            'share': 100 * rows[code]['customers'] / total if code in rows else 0,
+            'revenue': rows.get(code, {}).get('revenue') or 0,
+            'avg_frequency': rows.get(code, {}).get('avg_frequency') or 0,
+            'avg_monetary': rows.get(code, {}).get('avg_monetary') or 0,
+        }
+        for code, _ in CustomerSegment.SEGMENTS
+    ]
+    return render(request, 'analytics/customers.html', {
+        'segments': segments,
+        'total_customers': total,
+        'last_run': SegmentationRun.objects.order_by('-started_at').first(),
+    })
@@ -3,6 +3,10 @@ ASGI config for caravela project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Le flux temps réel /users/events/ (SSE, voir caravela.push) doit être servi
+par ce point d'entrée (gunicorn -k uvicorn.workers.UvicornWorker) : sous
+WSGI chaque connexion ouverte bloquerait un worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
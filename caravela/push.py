@@ -0,0 +1,167 @@
+"""
+Diffusion temps réel vers les navigateurs connectés (flux SSE)
+
+Le hub garde, par processus ASGI, une file asyncio par connexion ouverte.
+Les publications passent par un broker interchangeable (PUSH_BROKER) :
+LocalBroker livre dans le processus courant, RedisBroker relaie entre
+processus (workers Stripe, admin, serveurs ASGI) via Redis Pub/Sub.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+REDIS_CHANNEL = 'caravela:push'
+
+
+def _put(queue, event):
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        # Client trop lent : l'événement est abandonné, il se resynchronisera à la reconnexion
+        logger.debug("File de diffusion pleine, événement abandonné")
+
+
+class PushHub:
+    """
+    Abonnements des connexions ouvertes dans ce processus
+
+    Une connexion inactive ne coûte qu'une file et une coroutine en attente :
+    aucun thread, aucune requête en base. deliver() peut être appelé depuis
+    n'importe quel thread.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        entry = (asyncio.get_running_loop(), asyncio.Queue(QUEUE_SIZE))
+        get_broker().listen()
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                entries = self._subscribers.get(user_id)
+                if entries is not None:
+                    entries.discard(entry)
+                    if not entries:
+                        del self._subscribers[user_id]
+
+    def deliver(self, user_ids, event):
+        with self._lock:
+            entries = [
+                entry
+                for user_id in user_ids
+                for entry in self._subscribers.get(user_id, ())
+            ]
+        for loop, queue in entries:
+            try:
+                loop.call_soon_threadsafe(_put, queue, event)
+            except RuntimeError:
+                # Boucle fermée (arrêt du serveur)
+                pass
+        return len(entries)
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(entries) for entries in self._subscribers.values())
+
+
+class LocalBroker:
+    """Livraison dans le processus courant uniquement (développement, serveur unique)"""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, user_ids, event):
+        self.hub.deliver(user_ids, event)
+
+    def listen(self):
+        pass
+
+
+class RedisBroker:
+    """
+    Relais entre processus par Redis Pub/Sub
+
+    Un seul canal : chaque message porte la liste des destinataires et
+    chaque serveur ASGI ne livre qu'à ses propres connexions. Le thread
+    d'écoute n'est démarré que dans les processus qui servent des flux.
+    """
+
+    def __init__(self, hub):
+        import redis
+
+        self.hub = hub
+        self.url = getattr(settings, 'PUSH_REDIS_URL', 'redis://127.0.0.1:6379/1')
+        self._client = redis.Redis.from_url(self.url)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+    def publish(self, user_ids, event):
+        self._client.publish(REDIS_CHANNEL, json.dumps({'user_ids': list(user_ids), 'event': event}))
+
+    def listen(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='push-listener', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(REDIS_CHANNEL)
+        for message in pubsub.listen():
+            try:
+                payload = json.loads(message['data'])
+                self.hub.deliver(payload['user_ids'], payload['event'])
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Message de diffusion invalide ignoré")
+
+
+hub = PushHub()
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(getattr(settings, 'PUSH_BROKER', 'caravela.push.LocalBroker'))
+                _broker = broker_class(hub)
+    return _broker
+
+
+def publish(user_ids, event_type, data):
+    """
+    Diffuser un événement aux utilisateurs connectés
+
+    À appeler une fois la transaction validée (transaction.on_commit) ; une
+    erreur du broker n'interrompt jamais l'appelant.
+    """
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if not user_ids:
+        return
+    try:
+        get_broker().publish(user_ids, {'type': event_type, 'data': data})
+    except Exception:
+        logger.exception(f"Diffusion de l'événement {event_type} impossible")
@@ -57,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'users.middleware.UserActivityMiddleware',
 ]
 
 ROOT_URLCONF = 'caravela.urls'
@@ -72,6 +73,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'users.context_processors.user_context',
             ],
         },
     },
@@ -188,11 +190,51 @@ ACCOUNT_LOGOUT_ON_GET = True
 # Email configuration
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # Change for production
 DEFAULT_FROM_EMAIL = 'contact@lacaravela.com'
+# À incrémenter lors d'un changement des templates d'email (cache des workers)
+EMAIL_TEMPLATES_VERSION = config('EMAIL_TEMPLATES_VERSION', default='1')
 
 # Stripe configuration
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+# Vide = API Stripe réelle ; http://127.0.0.1:12111 pour le faux serveur local
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='')
+STRIPE_CONNECT_TIMEOUT = config('STRIPE_CONNECT_TIMEOUT', default=2, cast=float)
+STRIPE_READ_TIMEOUT = config('STRIPE_READ_TIMEOUT', default=10, cast=float)
+STRIPE_MAX_RETRIES = config('STRIPE_MAX_RETRIES', default=2, cast=int)
+STRIPE_CIRCUIT_FAILURE_THRESHOLD = config('STRIPE_CIRCUIT_FAILURE_THRESHOLD', default=5, cast=int)
+STRIPE_CIRCUIT_RESET_TIMEOUT = config('STRIPE_CIRCUIT_RESET_TIMEOUT', default=30, cast=int)
+
+# Numérotation des commandes (taille des blocs réservés par worker)
+ORDER_NUMBER_BLOCK_SIZE = config('ORDER_NUMBER_BLOCK_SIZE', default=50, cast=int)
+
+# Créneaux de livraison (durée de réservation au checkout, fraîcheur de la grille)
+DELIVERY_SLOT_HOLD_MINUTES = config('DELIVERY_SLOT_HOLD_MINUTES', default=15, cast=int)
+DELIVERY_SLOT_GRID_TIMEOUT = config('DELIVERY_SLOT_GRID_TIMEOUT', default=30, cast=int)
+# Point de départ des tournées ; vide = barycentre des livraisons du jour
+DELIVERY_DEPOT_LATITUDE = config('DELIVERY_DEPOT_LATITUDE', default='')
+DELIVERY_DEPOT_LONGITUDE = config('DELIVERY_DEPOT_LONGITUDE', default='')
+
+# Fidélité (durée de validité des points gagnés)
+LOYALTY_POINTS_VALIDITY_DAYS = config('LOYALTY_POINTS_VALIDITY_DAYS', default=365, cast=int)
+
+# Journal d'activité (écritures groupées, partitions mensuelles et rétention)
+ACTIVITY_BUFFER_SIZE = config('ACTIVITY_BUFFER_SIZE', default=200, cast=int)
+ACTIVITY_FLUSH_INTERVAL_MS = config('ACTIVITY_FLUSH_INTERVAL_MS', default=2000, cast=int)
+ACTIVITY_RETENTION_MONTHS = config('ACTIVITY_RETENTION_MONTHS', default=6, cast=int)
+
+# Diffusion temps réel (flux SSE) : broker entre processus et durée des connexions
+PUSH_BROKER = config('PUSH_BROKER', default='caravela.push.LocalBroker' if DEBUG else 'caravela.push.RedisBroker')
+PUSH_REDIS_URL = config('REDIS_URL', default='redis://127.0.0.1:6379/1')
+PUSH_KEEPALIVE_SECONDS = config('PUSH_KEEPALIVE_SECONDS', default=25, cast=int)
+PUSH_STREAM_MAX_SECONDS = config('PUSH_STREAM_MAX_SECONDS', default=300, cast=int)
+
+# Segmentation RFM (taille des paquets lus en flux, recouvrement entre deux exécutions)
+RFM_CHUNK_SIZE = config('RFM_CHUNK_SIZE', default=20000, cast=int)
+RFM_CURSOR_OVERLAP_MINUTES = config('RFM_CURSOR_OVERLAP_MINUTES', default=10, cast=int)
+
+# Recommandations (fenêtre des ventes prises en compte dans la popularité)
+RECOMMENDATION_POPULARITY_DAYS = config('RECOMMENDATION_POPULARITY_DAYS', default=90, cast=int)
 
 # Klaviyo configuration
 KLAVIYO_API_KEY = config('KLAVIYO_API_KEY', default='')
@@ -1,15 +1,23 @@
 from django.shortcuts import render
 from django.http import HttpResponse
 from products.models import Product, Category
+from products.recommendations import exclude_restricted, recommended_products
 
 def home_view(request):
-    """Vue de la page d'accueil"""
-    featured_products = Product.objects.filter(is_active=True).order_by('-is_featured', '-created_at')[:4]
+    """Vue de la page d'accueil (sélection personnalisée pour les clients connectés)"""
+    featured_products = recommended_products(request.user, 4)
+    personalized = request.user.is_authenticated and bool(featured_products)
+    if not featured_products:
+        # Sélection générique, sans les produits contenant un allergène interdit au client
+        featured_products = exclude_restricted(
+            Product.objects.filter(is_active=True), request.user,
+        ).order_by('-is_featured', '-created_at')[:4]
     top_categories = Category.objects.filter(is_active=True).order_by('order', 'name')[:3]
     return render(request, 'home.html', {
         'title': 'La Caravela - Glaces Artisanales Premium',
         'message': 'Bienvenue chez La Caravela !',
         'featured_products': featured_products,
+        'personalized': personalized,
         'top_categories': top_categories,
     })
 
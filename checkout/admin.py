@@ -1,3 +1,81 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import DeliverySlot, DeliverySlotShard, Order, OrderItem, OrderStatusHistory, PickupPoint, ShippingRule
+from .order_status import bulk_transition
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    raw_id_fields = ['product', 'flavor']
+
+
+class OrderStatusHistoryInline(admin.TabularInline):
+    model = OrderStatusHistory
+    extra = 0
+    can_delete = False
+    readonly_fields = ['from_status', 'to_status', 'changed_by', 'note', 'created_at']
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+def make_transition_action(to_status, label):
+    def action(modeladmin, request, queryset):
+        updated = bulk_transition(queryset, to_status, changed_by=request.user, note="Action groupée (admin)")
+        modeladmin.message_user(request, f"{updated} commande(s) passée(s) au statut « {label} »")
+    action.__name__ = f'mark_{to_status}'
+    action.short_description = f"Passer au statut « {label} »"
+    return action
+
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ['order_number', 'user', 'order_status', 'payment_status', 'total', 'tracking_number', 'created_at']
+    list_filter = ['order_status', 'payment_status', 'shipping_method', 'created_at']
+    search_fields = ['order_number', 'user__username', 'user__email', 'tracking_number']
+    list_select_related = ['user']
+    raw_id_fields = ['user', 'shipping_address', 'billing_address', 'pickup_point']
+    readonly_fields = ['order_number', 'order_status', 'payment_status', 'stripe_payment_intent_id', 'created_at', 'updated_at']
+    inlines = [OrderItemInline, OrderStatusHistoryInline]
+    actions = [
+        make_transition_action(status, label)
+        for status, label in Order.ORDER_STATUS
+        if status in ('confirmed', 'processing', 'shipped', 'delivered', 'cancelled')
+    ]
+
+
+@admin.register(ShippingRule)
+class ShippingRuleAdmin(admin.ModelAdmin):
+    list_display = ['name', 'method', 'postal_code_prefix', 'min_weight_grams', 'max_weight_grams',
+                    'base_cost', 'cost_per_kg', 'free_shipping_threshold', 'priority', 'is_active']
+    list_filter = ['method', 'is_active']
+    search_fields = ['name', 'postal_code_prefix']
+    list_editable = ['base_cost', 'free_shipping_threshold', 'priority', 'is_active']
+
+
+@admin.register(PickupPoint)
+class PickupPointAdmin(admin.ModelAdmin):
+    list_display = ['name', 'code', 'city', 'postal_code', 'opening_hours', 'is_active']
+    list_filter = ['is_active', 'city']
+    search_fields = ['name', 'code', 'city', 'postal_code']
+    list_editable = ['is_active']
+
+
+class DeliverySlotShardInline(admin.TabularInline):
+    model = DeliverySlotShard
+    extra = 0
+    can_delete = False
+    readonly_fields = ['index', 'capacity', 'claimed']
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DeliverySlot)
+class DeliverySlotAdmin(admin.ModelAdmin):
+    list_display = ['date', 'start_time', 'end_time', 'shipping_method', 'capacity', 'shard_count', 'is_active']
+    list_filter = ['shipping_method', 'is_active', 'date']
+    list_editable = ['capacity', 'shard_count', 'is_active']
+    date_hierarchy = 'date'
+    inlines = [DeliverySlotShardInline]
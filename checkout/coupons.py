@@ -0,0 +1,121 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Coupon, CouponRedemption
+
+
+ACTIVE_CODES_CACHE_KEY = 'coupons:active_codes'
+COUPON_CACHE_KEY = 'coupons:code:{}'
+ACTIVE_CODES_TIMEOUT = 60
+COUPON_TIMEOUT = 60
+
+
+class CouponError(Exception):
+    """Coupon inconnu, expiré, épuisé ou non applicable"""
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+def get_active_codes():
+    """
+    Ensemble des codes actifs, en cache pour une courte durée
+
+    Sert de cache négatif : un code absent de l'ensemble est rejeté sans
+    requête, ce qui rend inoffensif le test de codes au hasard au checkout.
+    """
+    codes = cache.get(ACTIVE_CODES_CACHE_KEY)
+    if codes is None:
+        now = timezone.now()
+        codes = frozenset(
+            normalize_code(code) for code in Coupon.objects.filter(
+                is_active=True, valid_until__gte=now,
+            ).values_list('code', flat=True)
+        )
+        cache.set(ACTIVE_CODES_CACHE_KEY, codes, ACTIVE_CODES_TIMEOUT)
+    return codes
+
+
+def get_coupon(code):
+    """Retrouver un coupon par son code, sans tenir compte de la casse"""
+    code = normalize_code(code)
+    if not code or code not in get_active_codes():
+        return None
+
+    cache_key = COUPON_CACHE_KEY.format(code)
+    coupon = cache.get(cache_key)
+    if coupon is None:
+        coupon = Coupon.objects.filter(code__iexact=code, is_active=True).first()
+        if coupon is None:
+            return None
+        cache.set(cache_key, coupon, COUPON_TIMEOUT)
+    return coupon
+
+
+def invalidate_coupon_cache(code):
+    cache.delete_many([ACTIVE_CODES_CACHE_KEY, COUPON_CACHE_KEY.format(normalize_code(code))])
+
+
+def validate_coupon(code, subtotal, shipping_cost, user=None):
+    """
+    Valider un code promo et calculer la remise, sans le consommer
+
+    Les compteurs d'utilisation lus ici peuvent être légèrement en retard
+    (cache) : seule la consommation via redeem_coupon fait foi.
+
+    Returns:
+        tuple: (coupon, remise)
+    """
+    coupon = get_coupon(code)
+    if coupon is None or not coupon.is_valid:
+        raise CouponError(f"Code promo invalide: {normalize_code(code)}")
+
+    discount = coupon.compute_discount(subtotal, shipping_cost)
+    if discount is None:
+        raise CouponError(f"Code promo non applicable: {coupon.code}")
+
+    if user is not None and coupon.max_uses_per_user and (
+        CouponRedemption.objects.filter(
+            coupon=coupon, user=user, order__reservations_released=False,
+        ).count() >= coupon.max_uses_per_user
+    ):
+        raise CouponError(f"Code promo déjà utilisé: {coupon.code}")
+
+    return coupon, discount
+
+
+@transaction.atomic
+def redeem_coupon(coupon, user, order, discount_amount):
+    """
+    Consommer un coupon et enregistrer l'utilisation dans le registre
+
+    L'incrément passe par un UPDATE conditionnel (used_count < max_uses) :
+    deux checkouts concurrents ne peuvent pas dépasser la limite. Le verrou
+    de ligne posé par cet UPDATE sérialise aussi la vérification de la
+    limite par utilisateur.
+    """
+    now = timezone.now()
+    redeemed = Coupon.objects.filter(
+        pk=coupon.pk, is_active=True, valid_from__lte=now, valid_until__gte=now,
+    ).filter(
+        Q(max_uses__isnull=True) | Q(used_count__lt=F('max_uses'))
+    ).update(used_count=F('used_count') + 1)
+    if not redeemed:
+        raise CouponError(f"Code promo épuisé: {coupon.code}")
+
+    if coupon.max_uses_per_user and (
+        CouponRedemption.objects.filter(
+            coupon=coupon, user=user, order__reservations_released=False,
+        ).count() >= coupon.max_uses_per_user
+    ):
+        raise CouponError(f"Code promo déjà utilisé: {coupon.code}")
+
+    return CouponRedemption.objects.create(
+        coupon=coupon,
+        user=user,
+        order=order,
+        discount_amount=discount_amount,
+    )
@@ -0,0 +1,87 @@
+from django.db.models import Count, Sum
+
+from .models import OrderItem, OrderItemCustomization
+
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+def customization_rows(order_item, option_prices, created_at):
+    """
+    Lignes normalisées des personnalisations d'un article de commande
+
+    Les clés qui ne correspondent à aucune option connue (texte libre,
+    option supprimée) sont ignorées.
+    """
+    rows = []
+    for option_id, details in (order_item.customizations or {}).items():
+        price = option_prices.get(str(option_id))
+        if price is None:
+            continue
+        rows.append(OrderItemCustomization(
+            order_item_id=order_item.pk,
+            order_id=order_item.order_id,
+            option_id=int(option_id),
+            quantity=order_item.quantity * (details or {}).get('quantity', 1),
+            unit_price=price,
+            created_at=created_at,
+        ))
+    return rows
+
+
+def backfill_customizations(chunk_size=BACKFILL_CHUNK_SIZE, start_after=0):
+    """
+    Normaliser les personnalisations JSON des commandes existantes
+
+    Parcourt OrderItem par clé primaire croissante, par blocs : chaque bloc
+    coûte une lecture et un INSERT groupé. Les articles déjà normalisés sont
+    ignorés (contrainte unique), la commande peut donc être relancée. Le
+    prix unitaire historique n'étant pas connu, le prix actuel de l'option
+    sert d'instantané.
+
+    Yields:
+        tuple: (dernier id traité, lignes du bloc, y compris celles déjà présentes)
+    """
+    from products.models import CustomizationOption
+    option_prices = {
+        str(pk): price for pk, price in CustomizationOption.objects.values_list('pk', 'price')
+    }
+    last_id = start_after
+    while True:
+        items = list(
+            OrderItem.objects.filter(pk__gt=last_id)
+            .exclude(customizations={})
+            .select_related('order')
+            .only('pk', 'order_id', 'quantity', 'customizations', 'order__created_at')
+            .order_by('pk')[:chunk_size]
+        )
+        if not items:
+            return
+        rows = []
+        for item in items:
+            rows.extend(customization_rows(item, option_prices, item.order.created_at))
+        OrderItemCustomization.objects.bulk_create(rows, ignore_conflicts=True)
+        last_id = items[-1].pk
+        yield last_id, len(rows)
+
+
+def top_options(since, until=None, limit=10, option_type=None):
+    """Options les plus commandées sur une période (agrégat sur l'index option/date)"""
+    queryset = OrderItemCustomization.objects.filter(created_at__gte=since)
+    if until is not None:
+        queryset = queryset.filter(created_at__lt=until)
+    if option_type:
+        queryset = queryset.filter(option__option_type=option_type)
+    return list(
+        queryset.values('option_id', 'option__name')
+        .annotate(units=Sum('quantity'), orders=Count('order_id', distinct=True))
+        .order_by('-units')[:limit]
+    )
+
+
+def orders_with_option(option_id, since=None):
+    """Identifiants des commandes contenant une option"""
+    queryset = OrderItemCustomization.objects.filter(option_id=option_id)
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    return queryset.values_list('order_id', flat=True).distinct()
@@ -0,0 +1,254 @@
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import DeliverySlot, DeliverySlotHold, DeliverySlotShard
+
+
+logger = logging.getLogger(__name__)
+
+GRID_CACHE_KEY = 'delivery_slots:grid:{}'
+GRID_DAYS = 7
+
+# Commandes qui ne seront pas livrées : leur place sur le créneau est rendue
+RELEASING_ORDER_STATUSES = {'cancelled', 'refunded'}
+RELEASING_PAYMENT_STATUSES = {'failed', 'refunded'}
+
+
+class SlotUnavailableError(Exception):
+    """Créneau complet, inactif, passé ou réservation expirée"""
+
+
+def hold_duration():
+    return timedelta(minutes=getattr(settings, 'DELIVERY_SLOT_HOLD_MINUTES', 15))
+
+
+def _claim_shard(slot):
+    """
+    Prendre une place sur l'un des compteurs du créneau
+
+    Chaque tentative est un UPDATE conditionnel (claimed < capacity) : la
+    base garantit qu'aucune place n'est vendue deux fois, sans verrou
+    applicatif. Le compteur de départ est tiré au hasard pour répartir la
+    contention ; les autres sont essayés si celui-ci est plein.
+
+    Returns:
+        int | None: Index du compteur utilisé, None si le créneau est complet
+    """
+    start = random.randrange(slot.shard_count)
+    for offset in range(slot.shard_count):
+        index = (start + offset) % slot.shard_count
+        updated = DeliverySlotShard.objects.filter(
+            slot=slot, index=index, claimed__lt=F('capacity'),
+        ).update(claimed=F('claimed') + 1)
+        if updated:
+            return index
+    return None
+
+
+def _release_shards(holds):
+    """Rendre les places d'un ensemble de réservations (un UPDATE par compteur)"""
+    counts = {}
+    for slot_id, shard_index in holds:
+        counts[(slot_id, shard_index)] = counts.get((slot_id, shard_index), 0) + 1
+    for (slot_id, shard_index), count in counts.items():
+        DeliverySlotShard.objects.filter(slot_id=slot_id, index=shard_index).update(claimed=F('claimed') - count)
+
+
+def hold_slot(slot_id, session_key):
+    """
+    Retenir une place sur un créneau pour une session de checkout
+
+    La réservation précédente de la session est libérée. Si le créneau est
+    complet, les réservations expirées de ce créneau sont rendues avant un
+    second essai.
+
+    Raises:
+        SlotUnavailableError: Si aucune place n'est disponible
+    """
+    now = timezone.now()
+    slot = DeliverySlot.objects.filter(pk=slot_id, is_active=True, date__gte=timezone.localdate()).first()
+    if slot is None:
+        raise SlotUnavailableError("Ce créneau n'est pas disponible")
+
+    with transaction.atomic():
+        # La prise de place (une écriture) passe en premier : sous SQLite, une
+        # transaction qui lit avant d'écrire échoue sans attendre le verrou.
+        shard_index = _claim_shard(slot)
+        released = release_session_holds(session_key)
+        if shard_index is None and (released or release_expired_holds(slot_id=slot.pk)):
+            shard_index = _claim_shard(slot)
+        if shard_index is None:
+            raise SlotUnavailableError("Ce créneau est complet")
+        hold = DeliverySlotHold.objects.create(
+            slot=slot,
+            shard_index=shard_index,
+            session_key=session_key,
+            expires_at=now + hold_duration(),
+        )
+    hold.slot = slot
+    return hold
+
+
+def get_session_hold(session_key):
+    """Réservation en cours (non expirée) de la session, ou None"""
+    if not session_key:
+        return None
+    return (
+        DeliverySlotHold.objects.select_related('slot')
+        .filter(session_key=session_key, status='held', expires_at__gt=timezone.now())
+        .order_by('-created_at')
+        .first()
+    )
+
+
+def confirm_hold(hold, order):
+    """
+    Rattacher la place retenue à la commande (dans la transaction de la commande)
+
+    Raises:
+        SlotUnavailableError: Si la réservation a expiré ou a été libérée
+    """
+    updated = DeliverySlotHold.objects.filter(
+        pk=hold.pk, status='held', expires_at__gt=timezone.now(),
+    ).update(status='confirmed', order=order)
+    if not updated:
+        raise SlotUnavailableError("La réservation du créneau a expiré, veuillez en choisir un autre")
+
+
+def sync_order_slots(order_ids):
+    """
+    Rendre ou reprendre la place des commandes après un changement de statut
+
+    À appeler avec sync_order_stats (webhook, rapprochement, back-office).
+    Une commande annulée, remboursée ou dont le paiement a échoué rend sa
+    place ; si son paiement aboutit ensuite, la place est reprise quand le
+    créneau en a encore une (sinon la commande est signalée dans les logs).
+
+    Returns:
+        tuple: (places rendues, places reprises)
+    """
+    with transaction.atomic():
+        holds = list(
+            DeliverySlotHold.objects.select_for_update(of=('self',))
+            .filter(order_id__in=list(order_ids), status__in=['confirmed', 'released'])
+            .select_related('slot')
+            .annotate(order_status=F('order__order_status'), payment_status=F('order__payment_status'))
+        )
+        to_release, to_reclaim = [], []
+        for hold in holds:
+            releasing = (hold.order_status in RELEASING_ORDER_STATUSES
+                         or hold.payment_status in RELEASING_PAYMENT_STATUSES)
+            if releasing and hold.status == 'confirmed':
+                to_release.append(hold)
+            elif not releasing and hold.status == 'released':
+                to_reclaim.append(hold)
+
+        if to_release:
+            DeliverySlotHold.objects.filter(pk__in=[hold.pk for hold in to_release]).update(status='released')
+            _release_shards([(hold.slot_id, hold.shard_index) for hold in to_release])
+
+        reclaimed = 0
+        for hold in to_reclaim:
+            shard_index = _claim_shard(hold.slot)
+            if shard_index is None:
+                logger.warning(f"Créneau {hold.slot_id} complet : la commande {hold.order_id} doit être replanifiée")
+                continue
+            DeliverySlotHold.objects.filter(pk=hold.pk).update(status='confirmed', shard_index=shard_index)
+            reclaimed += 1
+    return len(to_release), reclaimed
+
+
+def release_session_holds(session_key):
+    with transaction.atomic():
+        holds = list(
+            DeliverySlotHold.objects.select_for_update()
+            .filter(session_key=session_key, status='held')
+            .values_list('pk', 'slot_id', 'shard_index')
+        )
+        if holds:
+            DeliverySlotHold.objects.filter(pk__in=[pk for pk, _, _ in holds]).update(status='released')
+            _release_shards([(slot_id, shard_index) for _, slot_id, shard_index in holds])
+    return len(holds)
+
+
+def release_expired_holds(slot_id=None, batch_size=1000):
+    """
+    Libérer les réservations expirées (worker, ou créneau complet)
+
+    Returns:
+        int: Nombre de places rendues
+    """
+    filters = {'status': 'held', 'expires_at__lte': timezone.now()}
+    if slot_id is not None:
+        filters['slot_id'] = slot_id
+    with transaction.atomic():
+        holds = list(
+            DeliverySlotHold.objects.select_for_update(skip_locked=True)
+            .filter(**filters)
+            .values_list('pk', 'slot_id', 'shard_index')[:batch_size]
+        )
+        if holds:
+            DeliverySlotHold.objects.filter(pk__in=[pk for pk, _, _ in holds]).update(status='released')
+            _release_shards([(slot_id, shard_index) for _, slot_id, shard_index in holds])
+    return len(holds)
+
+
+def get_availability_grid(shipping_method='standard', days=GRID_DAYS):
+    """
+    Places restantes par créneau pour les prochains jours
+
+    Une requête agrégée, mise en cache quelques secondes : la grille est
+    indicative, la prise de place reste validée par le compteur.
+
+    Returns:
+        list: Un dict par jour {'date', 'slots': [...]}
+    """
+    cache_key = GRID_CACHE_KEY.format(shipping_method)
+    grid = cache.get(cache_key)
+    if grid is not None:
+        return grid
+
+    now = timezone.localtime()
+    today = now.date()
+    rows = (
+        DeliverySlot.objects.filter(
+            is_active=True,
+            shipping_method=shipping_method,
+            date__gte=today,
+            date__lt=today + timedelta(days=days),
+        )
+        .annotate(total_capacity=Sum('shards__capacity'), total_claimed=Sum('shards__claimed'))
+        .values('id', 'date', 'start_time', 'end_time', 'total_capacity', 'total_claimed')
+        .order_by('date', 'start_time')
+    )
+
+    by_date = {today + timedelta(days=offset): [] for offset in range(days)}
+    for row in rows:
+        if row['date'] == today and row['start_time'] <= now.time():
+            continue
+        remaining = max((row['total_capacity'] or 0) - (row['total_claimed'] or 0), 0)
+        by_date[row['date']].append({
+            'id': row['id'],
+            'start': row['start_time'].strftime('%H:%M'),
+            'end': row['end_time'].strftime('%H:%M'),
+            'remaining': remaining,
+            'available': remaining > 0,
+        })
+    grid = [{'date': day.isoformat(), 'slots': slots} for day, slots in by_date.items()]
+    cache.set(cache_key, grid, getattr(settings, 'DELIVERY_SLOT_GRID_TIMEOUT', 30))
+    return grid
+
+
+def slot_occupancy(slot_id):
+    """Places prises (réservations retenues et confirmées) d'après les réservations"""
+    return DeliverySlotHold.objects.filter(slot_id=slot_id, status__in=['held', 'confirmed']).aggregate(
+        count=Count('id'),
+    )['count']
+
@@ -0,0 +1,190 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import Order, OrderItem, OutboundEmail
+
+
+logger = logging.getLogger(__name__)
+
+ORDER_EMAILS = {
+    'order_confirmation': {
+        'template_name': 'checkout/emails/order_confirmation.html',
+        'subject': "Confirmation de commande - La Caravela #{order_number}",
+    },
+    'payment_failed': {
+        'template_name': 'checkout/emails/payment_failed.html',
+        'subject': "Échec de paiement - La Caravela #{order_number}",
+    },
+    'order_shipped': {
+        'template_name': 'checkout/emails/order_shipped.html',
+        'subject': "Votre commande est en route - La Caravela #{order_number}",
+    },
+    'order_delivered': {
+        'template_name': 'checkout/emails/order_delivered.html',
+        'subject': "Commande livrée - La Caravela #{order_number}",
+    },
+    'order_cancelled': {
+        'template_name': 'checkout/emails/order_cancelled.html',
+        'subject': "Commande annulée - La Caravela #{order_number}",
+    },
+}
+
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 60 * 60
+
+
+class EmailConnectionError(Exception):
+    """Serveur SMTP injoignable : le lot est reporté sans consommer de tentative"""
+
+_template_cache = {}
+
+
+def enqueue_order_emails(kind, order_ids):
+    """
+    Mettre en file les emails d'un type donné pour plusieurs commandes
+
+    À appeler dans la transaction qui modifie le statut des commandes :
+    l'email n'existe que si le changement de statut est validé.
+    Deux requêtes quel que soit le nombre de commandes.
+    """
+    config = ORDER_EMAILS[kind]
+    rows = Order.objects.filter(pk__in=order_ids).values_list('pk', 'order_number', 'user__email')
+    emails = [
+        OutboundEmail(
+            to_email=email,
+            subject=config['subject'].format(order_number=order_number),
+            template_name=config['template_name'],
+            order_id=pk,
+        )
+        for pk, order_number, email in rows
+        if email
+    ]
+    return OutboundEmail.objects.bulk_create(emails)
+
+
+def get_email_template(template_name):
+    """
+    Template compilé, mis en cache par version
+
+    Changer EMAIL_TEMPLATES_VERSION (déploiement d'un nouveau gabarit)
+    invalide le cache des workers.
+    """
+    version = getattr(settings, 'EMAIL_TEMPLATES_VERSION', '1')
+    key = (template_name, version)
+    template = _template_cache.get(key)
+    if template is None:
+        template = get_template(template_name)
+        _template_cache[key] = template
+    return template
+
+
+def retry_delay(attempts):
+    """Backoff exponentiel : 30 s, 1 min, 2 min... plafonné à 1 h"""
+    return timedelta(seconds=min(RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), RETRY_MAX_DELAY))
+
+
+def send_pending_emails(batch_size=100, max_attempts=5, connection=None):
+    """
+    Envoyer un lot d'emails en attente sur une seule connexion SMTP
+
+    Si la connexion ne peut pas être ouverte, les emails du lot restent en
+    attente et sont reportés de RETRY_BASE_DELAY secondes (sans compter de
+    tentative) avant de lever EmailConnectionError.
+
+    Returns:
+        tuple: (emails envoyés, emails en échec)
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .select_related('order__user')
+            .prefetch_related(Prefetch(
+                'order__items',
+                queryset=OrderItem.objects.select_related('product', 'flavor'),
+            ))
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if not emails:
+            return 0, 0
+
+        sent, failed = [], []
+        connection = connection or get_connection()
+        try:
+            connection.open()
+        except Exception as e:
+            logger.warning(f"Serveur SMTP injoignable, {len(emails)} emails reportés: {e}")
+            OutboundEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+                next_attempt_at=now + timedelta(seconds=RETRY_BASE_DELAY), last_error=str(e),
+            )
+            connection_error = e
+        else:
+            connection_error = None
+    if connection_error is not None:
+        raise EmailConnectionError(str(connection_error)) from connection_error
+
+    with transaction.atomic():
+        try:
+            for email in emails:
+                try:
+                    html_message = get_email_template(email.template_name).render({
+                        'order': email.order,
+                        **email.context,
+                    })
+                    message = EmailMultiAlternatives(
+                        subject=email.subject,
+                        body='',
+                        from_email=settings.DEFAULT_FROM_EMAIL,
+                        to=[email.to_email],
+                        connection=connection,
+                    )
+                    message.attach_alternative(html_message, 'text/html')
+                    message.send()
+                    sent.append(email.pk)
+                except Exception as e:
+                    logger.error(f"Erreur lors de l'envoi de l'email {email.pk}: {str(e)}")
+                    email.attempts += 1
+                    email.last_error = str(e)
+                    email.status = 'failed' if email.attempts >= max_attempts else 'pending'
+                    email.next_attempt_at = now + retry_delay(email.attempts)
+                    failed.append(email)
+        finally:
+            connection.close()
+
+        OutboundEmail.objects.filter(pk__in=sent).update(status='sent', sent_at=timezone.now())
+        OutboundEmail.objects.bulk_update(failed, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+    return len(sent), len(failed)
+
+
+def drain_outbox(batch_size=100, max_attempts=5):
+    """
+    Vider la file jusqu'à épuisement
+
+    Returns:
+        dict: Emails envoyés, en échec et débit en emails par seconde
+    """
+    start = time.perf_counter()
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = send_pending_emails(batch_size=batch_size, max_attempts=max_attempts)
+        if not sent and not failed:
+            break
+        total_sent += sent
+        total_failed += failed
+    elapsed = time.perf_counter() - start
+    return {
+        'sent': total_sent,
+        'failed': total_failed,
+        'seconds': elapsed,
+        'per_second': total_sent / elapsed if elapsed else 0.0,
+    }
@@ -0,0 +1,214 @@
+"""
+Faux serveur Stripe local pour les tests de charge et de panne hors ligne
+
+Implémente le sous-ensemble de l'API utilisé par la passerelle
+(PaymentIntents, Refunds) avec clés d'idempotence, pagination par curseur,
+latence et taux d'erreur configurables. Démarrage :
+
+    python manage.py fake_stripe_server --port 12111 --latency 50 --error-rate 0.05
+
+puis STRIPE_API_BASE=http://127.0.0.1:12111 pour y diriger l'application.
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+
+def parse_form(body):
+    """Décoder un corps x-www-form-urlencoded au format Stripe (a[b]=c)"""
+    data = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        match = re.match(r'^([^\[]+)\[([^\]]*)\]$', key)
+        if match:
+            data.setdefault(match.group(1), {})[match.group(2)] = value
+        else:
+            data[key] = value
+    return data
+
+
+class FakeStripeState:
+    """Objets et réponses idempotentes conservés en mémoire"""
+
+    def __init__(self, latency=0.0, error_rate=0.0, down=False):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.down = down
+        self.lock = threading.Lock()
+        self.payment_intents = {}
+        self.refunds = {}
+        self.idempotent_responses = {}
+        self.request_count = 0
+
+    def new_id(self, prefix):
+        return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+    def create_payment_intent(self, params):
+        intent_id = self.new_id('pi')
+        intent = {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': int(params.get('amount', 0)),
+            'amount_received': 0,
+            'currency': params.get('currency', 'eur'),
+            'client_secret': f"{intent_id}_secret_{uuid.uuid4().hex[:24]}",
+            'created': int(time.time()),
+            'description': params.get('description'),
+            'metadata': params.get('metadata', {}),
+            'status': params.get('status', 'requires_payment_method'),
+            'livemode': False,
+        }
+        self.payment_intents[intent_id] = intent
+        return intent
+
+    def modify_payment_intent(self, intent_id, params):
+        intent = self.payment_intents.get(intent_id)
+        if intent is None:
+            return None
+        if 'amount' in params:
+            intent['amount'] = int(params['amount'])
+        if 'metadata' in params:
+            intent['metadata'].update(params['metadata'])
+        if 'status' in params:
+            intent['status'] = params['status']
+            if params['status'] == 'succeeded':
+                intent['amount_received'] = intent['amount']
+        return intent
+
+    def create_refund(self, params):
+        intent = self.payment_intents.get(params.get('payment_intent'))
+        if intent is None:
+            return None
+        refund = {
+            'id': self.new_id('re'),
+            'object': 'refund',
+            'amount': int(params.get('amount') or intent['amount']),
+            'currency': intent['currency'],
+            'payment_intent': intent['id'],
+            'reason': params.get('reason'),
+            'created': int(time.time()),
+            'metadata': intent['metadata'],
+            'status': 'succeeded',
+        }
+        self.refunds[refund['id']] = refund
+        return refund
+
+    def list_objects(self, objects, url, query):
+        """Liste paginée par ordre de création décroissant, comme l'API Stripe"""
+        items = sorted(objects.values(), key=lambda o: (o['created'], o['id']), reverse=True)
+        if 'created[gte]' in query:
+            items = [o for o in items if o['created'] >= int(query['created[gte]'])]
+        if 'created[lt]' in query:
+            items = [o for o in items if o['created'] < int(query['created[lt]'])]
+        if 'payment_intent' in query:
+            items = [o for o in items if o.get('payment_intent') == query['payment_intent']]
+        if 'starting_after' in query:
+            ids = [o['id'] for o in items]
+            if query['starting_after'] in ids:
+                items = items[ids.index(query['starting_after']) + 1:]
+        limit = min(int(query.get('limit', 10)), 100)
+        return {
+            'object': 'list',
+            'url': url,
+            'data': items[:limit],
+            'has_more': len(items) > limit,
+        }
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, error_type='invalid_request_error'):
+        self._send(status, {'error': {'type': error_type, 'message': message}})
+
+    def _simulate_conditions(self):
+        """Latence et pannes injectées ; renvoie True si la requête a échoué"""
+        state = self.state
+        with state.lock:
+            state.request_count += 1
+        if state.latency:
+            time.sleep(state.latency)
+        if state.down:
+            self._error(503, "Service indisponible (simulation)", 'api_error')
+            return True
+        if state.error_rate and random.random() < state.error_rate:
+            self._error(500, "Erreur interne (simulation)", 'api_error')
+            return True
+        return False
+
+    def do_GET(self):
+        if self._simulate_conditions():
+            return
+        parsed = urlparse(self.path)
+        query = dict(parse_qsl(parsed.query))
+        state = self.state
+        with state.lock:
+            if parsed.path == '/v1/payment_intents':
+                return self._send(200, state.list_objects(state.payment_intents, parsed.path, query))
+            if parsed.path == '/v1/refunds':
+                return self._send(200, state.list_objects(state.refunds, parsed.path, query))
+            match = re.match(r'^/v1/payment_intents/([\w]+)$', parsed.path)
+            if match and match.group(1) in state.payment_intents:
+                return self._send(200, state.payment_intents[match.group(1)])
+        self._error(404, f"Ressource inconnue: {parsed.path}")
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        params = parse_form(self.rfile.read(length).decode())
+        if self._simulate_conditions():
+            return
+
+        state = self.state
+        idempotency_key = self.headers.get('Idempotency-Key')
+        with state.lock:
+            cache_key = (self.path, idempotency_key)
+            if idempotency_key and cache_key in state.idempotent_responses:
+                return self._send(*state.idempotent_responses[cache_key])
+
+            response = self._dispatch_post(params)
+            if idempotency_key:
+                state.idempotent_responses[cache_key] = response
+        self._send(*response)
+
+    def _dispatch_post(self, params):
+        state = self.state
+        path = urlparse(self.path).path
+        if path == '/v1/payment_intents':
+            return 200, state.create_payment_intent(params)
+        if path == '/v1/refunds':
+            refund = state.create_refund(params)
+            if refund is None:
+                return 404, {'error': {'type': 'invalid_request_error', 'message': "Payment Intent inconnu"}}
+            return 200, refund
+        match = re.match(r'^/v1/payment_intents/([\w]+)$', path)
+        if match:
+            intent = state.modify_payment_intent(match.group(1), params)
+            if intent is not None:
+                return 200, intent
+        return 404, {'error': {'type': 'invalid_request_error', 'message': f"Ressource inconnue: {path}"}}
+
+
+def make_server(host='127.0.0.1', port=12111, latency=0.0, error_rate=0.0, down=False):
+    """Créer le serveur (appeler serve_forever() ou le lancer dans un thread)"""
+    state = FakeStripeState(latency=latency, error_rate=error_rate, down=down)
+    handler = type('BoundFakeStripeHandler', (FakeStripeHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
@@ -0,0 +1,204 @@
+import logging
+import random
+import threading
+import time
+import uuid
+from urllib.parse import quote_plus
+
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from stripe import util
+from stripe.api_requestor import APIRequestor
+from stripe.http_client import RequestsClient
+
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (
+    stripe.error.APIConnectionError,
+    stripe.error.RateLimitError,
+    stripe.error.APIError,
+)
+
+
+class CircuitOpenError(stripe.error.StripeError):
+    """Stripe est considéré comme indisponible : échec immédiat sans appel réseau"""
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur simple (fermé / ouvert / semi-ouvert)
+
+    Après ``failure_threshold`` échecs consécutifs, les appels échouent
+    immédiatement pendant ``reset_timeout`` secondes. Un seul appel d'essai
+    est ensuite autorisé ; s'il réussit, le circuit se referme.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self):
+        """Autoriser un appel ; renvoie True s'il s'agit de l'appel d'essai (semi-ouvert)"""
+        with self._lock:
+            state = self._state()
+            if state == 'open' or (state == 'half_open' and self._trial_in_progress):
+                raise CircuitOpenError("Stripe indisponible (circuit ouvert)")
+            if state == 'half_open':
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def release_trial(self):
+        """Appel d'essai terminé sans résultat enregistré (exception inattendue)"""
+        with self._lock:
+            self._trial_in_progress = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_progress = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Circuit Stripe ouvert après %s échecs", self._failures)
+                self._opened_at = time.monotonic()
+
+
+class _GatewayHTTPClient(RequestsClient):
+    """Client HTTP de la passerelle : les retries sont gérés par StripeGateway, pas par la librairie"""
+
+    def _max_network_retries(self):
+        return 0
+
+
+class StripeGateway:
+    """
+    Accès à l'API Stripe : client HTTP mutualisé, timeouts courts, clés
+    d'idempotence automatiques, retries avec jitter et disjoncteur
+
+    ``api_base`` permet de pointer vers le faux serveur Stripe local
+    (commande fake_stripe_server) pour les tests de charge hors ligne.
+    """
+
+    def __init__(self, api_key=None, api_base=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, retry_base_delay=0.2, breaker=None, pool_size=20):
+        self.api_key = api_key if api_key is not None else settings.STRIPE_SECRET_KEY
+        self.api_base = api_base or getattr(settings, 'STRIPE_API_BASE', '') or None
+        self.max_retries = max_retries if max_retries is not None else getattr(settings, 'STRIPE_MAX_RETRIES', 2)
+        self.retry_base_delay = retry_base_delay
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=getattr(settings, 'STRIPE_CIRCUIT_FAILURE_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'STRIPE_CIRCUIT_RESET_TIMEOUT', 30),
+        )
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        self.http_client = _GatewayHTTPClient(
+            timeout=(
+                connect_timeout or getattr(settings, 'STRIPE_CONNECT_TIMEOUT', 2),
+                read_timeout or getattr(settings, 'STRIPE_READ_TIMEOUT', 10),
+            ),
+            session=session,
+        )
+
+    def _call(self, http_method, url, idempotent=False, idempotency_key=None, **params):
+        """
+        Appeler l'API Stripe avec retries et disjoncteur
+
+        La requête passe par un APIRequestor propre à la passerelle (clé,
+        client HTTP et api_base) : aucun réglage global de la librairie n'est
+        modifié, deux passerelles ne se marchent pas dessus.
+        """
+        trial = self.breaker.before_call()
+        try:
+            headers = None
+            if idempotent:
+                headers = util.populate_headers(idempotency_key or uuid.uuid4().hex)
+            requestor = APIRequestor(key=self.api_key, client=self.http_client, api_base=self.api_base)
+
+            attempt = 0
+            while True:
+                try:
+                    response, api_key = requestor.request(http_method, url, params, headers)
+                except RETRYABLE_ERRORS as e:
+                    # Rejouer est sûr : lectures, ou écritures portant une clé d'idempotence
+                    if attempt >= self.max_retries:
+                        self.breaker.record_failure()
+                        raise
+                    attempt += 1
+                    delay = random.uniform(0, self.retry_base_delay * 2 ** attempt)
+                    logger.warning(f"Erreur Stripe transitoire ({type(e).__name__}), nouvel essai dans {delay:.2f}s")
+                    time.sleep(delay)
+                except stripe.error.StripeError:
+                    # Erreur métier (carte refusée, requête invalide) : Stripe répond normalement
+                    self.breaker.record_success()
+                    raise
+                else:
+                    self.breaker.record_success()
+                    return util.convert_to_stripe_object(response, api_key, None, None, params)
+        finally:
+            # Toute autre exception ne doit pas laisser le circuit bloqué en semi-ouvert
+            if trial:
+                self.breaker.release_trial()
+
+    def create_payment_intent(self, idempotency_key=None, **params):
+        return self._call('post', '/v1/payment_intents', idempotent=True, idempotency_key=idempotency_key, **params)
+
+    def modify_payment_intent(self, payment_intent_id, idempotency_key=None, **params):
+        return self._call('post', f'/v1/payment_intents/{quote_plus(payment_intent_id)}',
+                          idempotent=True, idempotency_key=idempotency_key, **params)
+
+    def retrieve_payment_intent(self, payment_intent_id):
+        return self._call('get', f'/v1/payment_intents/{quote_plus(payment_intent_id)}')
+
+    def list_payment_intents(self, **params):
+        return self._call('get', '/v1/payment_intents', **params)
+
+    def create_refund(self, idempotency_key=None, **params):
+        return self._call('post', '/v1/refunds', idempotent=True, idempotency_key=idempotency_key, **params)
+
+    def list_refunds(self, **params):
+        return self._call('get', '/v1/refunds', **params)
+
+    def list_payment_methods(self, **params):
+        return self._call('get', '/v1/payment_methods', **params)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Passerelle partagée par le processus (pool de connexions et disjoncteur communs)"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = StripeGateway()
+    return _gateway
@@ -0,0 +1,98 @@
+import heapq
+import math
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distance orthodromique en kilomètres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def to_unit_vector(lat, lon):
+    """
+    Coordonnées cartésiennes sur la sphère unité
+
+    La distance euclidienne entre deux de ces vecteurs croît avec la
+    distance orthodromique : un k-d tree classique donne donc les vrais
+    plus proches voisins, sans distorsion près des pôles ou de l'antiméridien.
+    """
+    phi, lam = math.radians(lat), math.radians(lon)
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+class KDTree:
+    """
+    k-d tree statique en 3 dimensions (points sur la sphère unité)
+
+    Construit une fois, puis interrogé sans allocation de requête SQL.
+    Chaque nœud est un tuple (point, valeur, axe, gauche, droite).
+    """
+
+    def __init__(self, points, values):
+        self.size = len(points)
+        self.root = self._build(list(zip(points, values)), 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda item: item[0][axis])
+        middle = len(items) // 2
+        point, value = items[middle]
+        return (
+            point, value, axis,
+            self._build(items[:middle], depth + 1),
+            self._build(items[middle + 1:], depth + 1),
+        )
+
+    def nearest(self, target, k=10, max_distance=None):
+        """
+        Les ``k`` valeurs les plus proches de ``target``
+
+        Returns:
+            list: Tuples (distance euclidienne, valeur) triés par distance
+        """
+        if self.root is None or k <= 0:
+            return []
+        limit_sq = max_distance ** 2 if max_distance is not None else math.inf
+        heap = []  # tas max via distances négatives
+        counter = 0
+        # Pile de (nœud, borne inférieure de distance au carré vers son sous-arbre)
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, bound_sq = stack.pop()
+            worst = -heap[0][0] if len(heap) == k else limit_sq
+            if node is None or bound_sq > worst:
+                continue
+            point, value, axis, left, right = node
+            dist_sq = (
+                (point[0] - target[0]) ** 2
+                + (point[1] - target[1]) ** 2
+                + (point[2] - target[2]) ** 2
+            )
+            if dist_sq <= limit_sq:
+                counter += 1
+                if len(heap) < k:
+                    heapq.heappush(heap, (-dist_sq, counter, value))
+                elif dist_sq < -heap[0][0]:
+                    heapq.heapreplace(heap, (-dist_sq, counter, value))
+
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Le sous-arbre éloigné est empilé en premier : il n'est visité
+            # qu'après le proche, et seulement s'il peut encore contenir un meilleur point
+            stack.append((far, max(bound_sq, diff * diff)))
+            stack.append((near, bound_sq))
+        ordered = sorted(heap, key=lambda entry: -entry[0])
+        return [(math.sqrt(-d), value) for d, _, value in ordered]
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from checkout.customizations import BACKFILL_CHUNK_SIZE, backfill_customizations
+
+
+class Command(BaseCommand):
+    help = 'Normaliser les personnalisations JSON des commandes existantes dans OrderItemCustomization'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=BACKFILL_CHUNK_SIZE)
+        parser.add_argument('--start-after', type=int, default=0, help='Reprendre après cet id d\'article')
+
+    def handle(self, *args, **options):
+        total = 0
+        for last_id, rows in backfill_customizations(options['chunk_size'], options['start_after']):
+            total += rows
+            self.stdout.write(f"  articles jusqu'à #{last_id} : {rows} lignes")
+        self.stdout.write(self.style.SUCCESS(f"{total} personnalisations traitées (les lignes déjà présentes sont conservées)"))
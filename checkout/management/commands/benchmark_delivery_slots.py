@@ -0,0 +1,91 @@
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+
+from checkout.delivery_slots import SlotUnavailableError, hold_slot
+from checkout.models import DeliverySlot, DeliverySlotHold
+
+
+class Command(BaseCommand):
+    help = 'Mesurer la prise de places concurrente sur un créneau et vérifier l\'absence de surréservation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--capacity', type=int, default=200)
+        parser.add_argument('--shards', type=int, default=8)
+        parser.add_argument('--shoppers', type=int, default=1000, help='Nombre de tentatives de réservation')
+        parser.add_argument('--concurrency', type=int, default=32)
+
+    def handle(self, *args, **options):
+        # Les threads doivent voir des écritures validées : le banc tourne sur
+        # une base de test créée pour l'occasion, jamais sur la base réelle
+        if connection.vendor == 'sqlite':
+            # SQLite en mémoire partagée lève « table is locked » sans attendre : fichier temporaire
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tempfile.gettempdir(), 'benchmark_delivery_slots.sqlite3',
+            )
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            self._benchmark(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def _benchmark(self, options):
+        slot_date = timezone.localdate() + timedelta(days=1)
+        slot = DeliverySlot.objects.create(
+            date=slot_date,
+            start_time=dt_time(23, 0),
+            end_time=dt_time(23, 59),
+            capacity=options['capacity'],
+            shard_count=options['shards'],
+        )
+
+        outcomes = {'held': 0, 'full': 0, 'db_error': 0}
+        latencies = []
+        lock = threading.Lock()
+
+        def shopper(index):
+            start = time.perf_counter()
+            try:
+                hold_slot(slot.pk, f"benchmark-{index}")
+                outcome = 'held'
+            except SlotUnavailableError:
+                outcome = 'full'
+            except OperationalError:
+                outcome = 'db_error'
+            finally:
+                connection.close()
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(shopper, range(options['shoppers'])))
+        elapsed = time.perf_counter() - start
+
+        claimed = slot.shards.aggregate(total=Sum('claimed'))['total']
+        holds = DeliverySlotHold.objects.filter(slot=slot, status='held').count()
+
+        latencies.sort()
+        self.stdout.write(
+            f"{options['shoppers']} tentatives, {options['concurrency']} threads, "
+            f"{options['shards']} compteurs : {elapsed:.2f}s ({options['shoppers'] / elapsed:.0f}/s)"
+        )
+        self.stdout.write(
+            f"retenues={outcomes['held']} complet={outcomes['full']} erreurs_bd={outcomes['db_error']} "
+            f"p50={latencies[len(latencies) // 2] * 1000:.1f}ms p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms"
+        )
+        self.stdout.write(f"compteurs={claimed} réservations={holds} capacité={options['capacity']}")
+
+        if claimed > options['capacity'] or claimed != holds or holds != outcomes['held']:
+            raise CommandError("Surréservation ou compteurs incohérents")
+        self.stdout.write(self.style.SUCCESS("Aucune surréservation"))
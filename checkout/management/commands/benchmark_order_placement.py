@@ -0,0 +1,85 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from checkout.models import Address, Cart, CartItem
+from checkout.orders import place_order
+from products.models import Category, CustomizationOption, Flavor, Product, ProductFlavor
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Mesurer le nombre de requêtes et la durée de place_order pour des paniers de 1, 10 et 100 lignes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1, 10, 100])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'lignes':>8} {'requêtes (médiane)':>20} {'ms (médiane)':>14}")
+        for size in options['sizes']:
+            query_counts, durations = [], []
+            for run in range(options['repeat']):
+                queries, duration = self._run_once(size, run)
+                query_counts.append(queries)
+                durations.append(duration)
+            # Médiane : la réservation d'un bloc de numéros de commande n'a lieu
+            # qu'une fois tous les ORDER_NUMBER_BLOCK_SIZE appels
+            query_counts.sort()
+            durations.sort()
+            middle = len(durations) // 2
+            self.stdout.write(f"{size:>8} {query_counts[middle]:>20} {durations[middle] * 1000:>14.2f}")
+
+    def _run_once(self, size, run):
+        """Créer un jeu de données jetable, passer commande, puis tout annuler"""
+        result = {}
+        try:
+            with transaction.atomic():
+                user = User.objects.create(username=f'bench-{size}-{run}-{time.monotonic_ns()}')
+                address = Address.objects.create(
+                    user=user, first_name='Bench', last_name='Mark',
+                    address_line_1='1 rue du Port', city='Casablanca', postal_code='20000',
+                )
+                category = Category.objects.create(name=f'Bench {size}-{run}-{time.monotonic_ns()}')
+                flavor = Flavor.objects.create(name=f'Bench {size}-{run}-{time.monotonic_ns()}')
+                option = CustomizationOption.objects.create(
+                    name=f'Bench {size}-{run}-{time.monotonic_ns()}',
+                    option_type='topping', price=Decimal('1.50'),
+                )
+                products = Product.objects.bulk_create([
+                    Product(
+                        name=f'Bench {i}', slug=f'bench-{size}-{run}-{i}-{time.monotonic_ns()}',
+                        description='Bench', category=category,
+                        base_price=Decimal('4.50'), stock_quantity=1000,
+                    )
+                    for i in range(size)
+                ])
+                ProductFlavor.objects.bulk_create([
+                    ProductFlavor(product=product, flavor=flavor, price_modifier=Decimal('0.50'))
+                    for product in products
+                ])
+                cart = Cart.objects.create(user=user)
+                CartItem.objects.bulk_create([
+                    CartItem(
+                        cart=cart, product=product, flavor=flavor, quantity=2,
+                        customizations={str(option.pk): {'quantity': 1}},
+                    )
+                    for product in products
+                ])
+
+                start = time.perf_counter()
+                with CaptureQueriesContext(connection) as ctx:
+                    place_order(cart, shipping_address=address, idempotency_key=f'bench-{time.monotonic_ns()}')
+                result['duration'] = time.perf_counter() - start
+                result['queries'] = len(ctx.captured_queries)
+                raise _Rollback
+        except _Rollback:
+            pass
+        return result['queries'], result['duration']
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from checkout.fake_stripe import make_server
+
+
+class Command(BaseCommand):
+    help = 'Lancer un faux serveur Stripe local (tests de charge et de panne hors ligne)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=12111)
+        parser.add_argument('--latency', type=float, default=0.0, help='Latence ajoutée en millisecondes')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Proportion de réponses 500 (0 à 1)')
+        parser.add_argument('--down', action='store_true', help='Répondre 503 à toutes les requêtes')
+
+    def handle(self, *args, **options):
+        server = make_server(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'] / 1000,
+            error_rate=options['error_rate'],
+            down=options['down'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Faux Stripe sur http://{options['host']}:{options['port']} "
+            f"(STRIPE_API_BASE=http://{options['host']}:{options['port']})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
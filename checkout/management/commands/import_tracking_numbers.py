@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from checkout.order_status import TRACKING_CHUNK_SIZE, import_tracking_numbers
+
+
+class Command(BaseCommand):
+    help = 'Importer un CSV transporteur (order_number, tracking_number) et marquer les commandes expédiées'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Fichier CSV avec une ligne d\'en-tête')
+        parser.add_argument('--chunk-size', type=int, default=TRACKING_CHUNK_SIZE)
+        parser.add_argument('--order-column', default='order_number')
+        parser.add_argument('--tracking-column', default='tracking_number')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as f:
+                stats = import_tracking_numbers(
+                    f,
+                    chunk_size=options['chunk_size'],
+                    order_column=options['order_column'],
+                    tracking_column=options['tracking_column'],
+                )
+        except OSError as e:
+            raise CommandError(f"Impossible de lire {options['path']}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['rows']} lignes lues, {stats['shipped']} commandes expédiées, {stats['skipped']} ignorées"
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from checkout.pickup_points import load_pickup_points, load_postal_code_centroids
+
+
+class Command(BaseCommand):
+    help = 'Charger les points relais et/ou les centres de codes postaux depuis des fichiers CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', help='CSV des points relais (code, name, address_line, city, postal_code, latitude, longitude)')
+        parser.add_argument('--postal-codes', help='CSV des centres de codes postaux (postal_code, latitude, longitude, city)')
+
+    def handle(self, *args, **options):
+        if not options['points'] and not options['postal_codes']:
+            raise CommandError("Indiquer --points et/ou --postal-codes")
+
+        for option, loader, label in (
+            ('postal_codes', load_postal_code_centroids, 'codes postaux'),
+            ('points', load_pickup_points, 'points relais'),
+        ):
+            path = options[option]
+            if not path:
+                continue
+            try:
+                with open(path, newline='', encoding='utf-8') as f:
+                    count = loader(f)
+            except OSError as e:
+                raise CommandError(f"Impossible de lire {path}: {e}")
+            except (KeyError, ValueError) as e:
+                raise CommandError(f"Fichier {path} invalide: {e}")
+            self.stdout.write(self.style.SUCCESS(f"{count} {label} chargés"))
@@ -0,0 +1,69 @@
+import csv
+import sys
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from checkout.routing import DEFAULT_MAX_STOPS, get_depot, load_day_stops, plan_runs
+
+
+class Command(BaseCommand):
+    help = 'Regrouper les commandes payées du jour en tournées de livraison et produire les feuilles de route (CSV)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Jour de livraison AAAA-MM-JJ (par défaut : aujourd\'hui)')
+        parser.add_argument('--max-stops', type=int, default=DEFAULT_MAX_STOPS, help='Arrêts maximum par tournée')
+        parser.add_argument('--max-weight', type=int, help='Poids maximum par tournée, en grammes')
+        parser.add_argument('--output', help='Fichier CSV des feuilles de route (par défaut : sortie standard)')
+
+    def handle(self, *args, **options):
+        try:
+            day = date.fromisoformat(options['date']) if options['date'] else timezone.localdate()
+        except ValueError:
+            raise CommandError(f"Date invalide: {options['date']}")
+        if options['max_stops'] < 1:
+            raise CommandError("--max-stops doit être positif")
+
+        start = time.perf_counter()
+        stops, unrouted = load_day_stops(day)
+        loaded = time.perf_counter()
+        runs = plan_runs(
+            stops,
+            depot=get_depot(),
+            max_stops=options['max_stops'],
+            max_weight_grams=options['max_weight'],
+        )
+        planned = time.perf_counter()
+
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            writer = csv.writer(output)
+            writer.writerow(['tournee', 'creneau', 'arret', 'commande', 'client', 'adresse',
+                             'code_postal', 'ville', 'telephone', 'poids_g'])
+            for run in runs:
+                for position, stop in enumerate(run.stops, start=1):
+                    writer.writerow([
+                        run.number, run.window, position, stop['order_number'],
+                        f"{stop['first_name']} {stop['last_name']}", stop['address'],
+                        stop['postal_code'], stop['city'], stop['phone'], stop['weight_grams'],
+                    ])
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        for run in runs:
+            self.stderr.write(
+                f"Tournée {run.number} ({run.window}) : {len(run.stops)} arrêts, "
+                f"{run.weight_grams / 1000:.1f} kg, {run.distance_km:.1f} km"
+            )
+        if unrouted:
+            self.stderr.write(self.style.WARNING(
+                f"{len(unrouted)} commandes sans coordonnées (code postal inconnu) : "
+                + ", ".join(stop['order_number'] for stop in unrouted[:20])
+            ))
+        self.stderr.write(self.style.SUCCESS(
+            f"{len(stops)} commandes en {len(runs)} tournées le {day} "
+            f"(chargement {loaded - start:.2f}s, planification {planned - loaded:.2f}s)"
+        ))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from checkout.webhooks import process_pending_events
+
+
+class Command(BaseCommand):
+    help = 'Traiter par lots les événements Stripe reçus par le webhook'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--loop', action='store_true', help='Tourner en continu (worker)')
+        parser.add_argument('--interval', type=float, default=1.0, help='Pause en secondes quand la file est vide')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            count = process_pending_events(
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'],
+            )
+            total += count
+            if count:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"{total} événements Stripe traités"))
@@ -0,0 +1,42 @@
+import json
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from checkout.production import compute_production_plan, get_production_plan
+
+
+class Command(BaseCommand):
+    help = 'Plan de production de la cuisine : parfums, options et types de produit à préparer par date de livraison'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Première date de livraison AAAA-MM-JJ (par défaut : demain)')
+        parser.add_argument('--days', type=int, default=1)
+        parser.add_argument('--json', action='store_true', help='Sortie JSON')
+        parser.add_argument('--no-cache', action='store_true', help='Recalculer sans passer par le cache')
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options['date']) if options['date'] else timezone.localdate() + timedelta(days=1)
+        except ValueError:
+            raise CommandError(f"Date invalide: {options['date']}")
+
+        compute = compute_production_plan if options['no_cache'] else get_production_plan
+        plan = compute(start, options['days'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(plan, ensure_ascii=False, indent=2))
+            return
+
+        for day, sections in plan.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Livraisons du {day}"))
+            self.stdout.write("  Parfums")
+            for entry in sections['flavors']:
+                self.stdout.write(f"    {entry['name']:<30} {entry['units']:>7} unités {entry['liters']:>9.2f} L")
+            self.stdout.write("  Options")
+            for entry in sections['options']:
+                self.stdout.write(f"    {entry['name']:<30} {entry['units']:>7}")
+            self.stdout.write("  Types de produit")
+            for entry in sections['product_types']:
+                self.stdout.write(f"    {entry['name']:<30} {entry['units']:>7}")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from checkout.order_stats import rebuild_order_stats
+
+
+class Command(BaseCommand):
+    help = 'Recalculer les statistiques de commande de tous les profils clients'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f"{rebuild_order_stats()} profils recalculés"))
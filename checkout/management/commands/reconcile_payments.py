@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from checkout.models import ReconciliationCursor
+from checkout.reconciliation import CURSOR_NAME, PAGE_SIZE, PaymentReconciler
+
+
+def parse_datetime(value):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Date invalide: {value} (format attendu AAAA-MM-JJ[THH:MM])")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Rapprocher par lots le statut de paiement des commandes avec Stripe (reprise sur curseur)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=parse_datetime, help='Début de fenêtre (par défaut : dernier rapprochement ou 24 h)')
+        parser.add_argument('--until', type=parse_datetime, help='Fin de fenêtre (par défaut : maintenant)')
+        parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+        parser.add_argument('--name', default=CURSOR_NAME, help='Nom du curseur')
+        parser.add_argument('--reset', action='store_true', help='Supprimer le curseur avant de commencer')
+        parser.add_argument('--dry-run', action='store_true', help='Afficher les corrections sans les appliquer')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            ReconciliationCursor.objects.filter(name=options['name']).delete()
+
+        reconciler = PaymentReconciler(
+            name=options['name'],
+            page_size=options['page_size'],
+            dry_run=options['dry_run'],
+        )
+        stats = reconciler.run(since=options['since'], until=options['until'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['objects']} objets Stripe lus en {stats['api_calls']} appels, "
+            f"{stats['matched']} commandes rapprochées, {stats['corrected']} corrigées"
+            + (" (simulation)" if options['dry_run'] else "")
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from checkout.delivery_slots import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Libérer les places des créneaux de livraison retenues par des checkouts abandonnés'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='Tourner en continu (worker)')
+        parser.add_argument('--interval', type=float, default=30.0, help='Pause en secondes quand rien n\'a expiré')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            count = release_expired_holds(batch_size=options['batch_size'])
+            total += count
+            if count:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"{total} places libérées"))
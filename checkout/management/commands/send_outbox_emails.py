@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from checkout.emails import EmailConnectionError, drain_outbox, retry_delay
+
+
+class Command(BaseCommand):
+    help = "Envoyer par lots les emails transactionnels en attente (outbox)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=5)
+        parser.add_argument('--loop', action='store_true', help='Tourner en continu (worker)')
+        parser.add_argument('--interval', type=float, default=2.0, help='Pause en secondes quand la file est vide')
+
+    def handle(self, *args, **options):
+        connection_failures = 0
+        while True:
+            try:
+                stats = drain_outbox(batch_size=options['batch_size'], max_attempts=options['max_attempts'])
+            except EmailConnectionError as e:
+                # SMTP injoignable : les emails restent en attente, on réessaie plus tard
+                self.stderr.write(f"Serveur SMTP injoignable, emails reportés: {e}")
+                if not options['loop']:
+                    break
+                connection_failures += 1
+                time.sleep(retry_delay(connection_failures).total_seconds())
+                continue
+            connection_failures = 0
+            if stats['sent'] or stats['failed'] or not options['loop']:
+                self.stdout.write(
+                    f"{stats['sent']} envoyés, {stats['failed']} en échec "
+                    f"en {stats['seconds']:.2f}s ({stats['per_second']:.1f} emails/s)"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
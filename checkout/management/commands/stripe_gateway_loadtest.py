@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from django.core.management.base import BaseCommand
+
+from checkout.fake_stripe import make_server
+from checkout.gateway import CircuitOpenError, StripeGateway
+
+
+class Command(BaseCommand):
+    help = 'Test de charge de la passerelle Stripe contre le faux serveur local'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--latency', type=float, default=20.0, help='Latence simulée en millisecondes')
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--down', action='store_true')
+        parser.add_argument('--api-base', default='', help='Serveur existant (sinon un faux serveur est démarré)')
+
+    def handle(self, *args, **options):
+        server = None
+        api_base = options['api_base']
+        if not api_base:
+            server = make_server(
+                port=0,
+                latency=options['latency'] / 1000,
+                error_rate=options['error_rate'],
+                down=options['down'],
+            )
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            api_base = f"http://127.0.0.1:{server.server_address[1]}"
+
+        gateway = StripeGateway(api_key='sk_test_fake', api_base=api_base, pool_size=options['concurrency'])
+        outcomes = {'ok': 0, 'stripe_error': 0, 'circuit_open': 0}
+        latencies = []
+        lock = threading.Lock()
+
+        def create(index):
+            start = time.perf_counter()
+            try:
+                gateway.create_payment_intent(amount=1000 + index, currency='eur', metadata={'order_id': f'LOAD{index}'})
+                outcome = 'ok'
+            except CircuitOpenError:
+                outcome = 'circuit_open'
+            except stripe.error.StripeError:
+                outcome = 'stripe_error'
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            list(executor.map(create, range(options['requests'])))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+        self.stdout.write(
+            f"{options['requests']} requêtes en {elapsed:.2f}s ({options['requests'] / elapsed:.0f} req/s) "
+            f"p50={p50:.1f}ms p95={p95:.1f}ms "
+            f"ok={outcomes['ok']} erreurs={outcomes['stripe_error']} circuit_ouvert={outcomes['circuit_open']} "
+            f"circuit={gateway.breaker.state}"
+        )
+        if server is not None:
+            self.stdout.write(f"Requêtes reçues par le faux serveur: {server.state.request_count}")
+            server.shutdown()
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('checkout', '0003_order_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='max_uses_per_user',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Utilisations maximum par client'),
+        ),
+        migrations.CreateModel(
+            name='CouponRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('discount_amount', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Montant de la remise')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='redemptions', to='checkout.coupon', verbose_name='Coupon')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coupon_redemptions', to='checkout.order', verbose_name='Commande')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coupon_redemptions', to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+            ],
+            options={
+                'verbose_name': 'Utilisation de coupon',
+                'verbose_name_plural': 'Utilisations de coupons',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['coupon', 'user'], name='checkout_co_coupon__6cc28c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0004_coupon_redemption'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='ID événement Stripe')),
+                ('event_type', models.CharField(max_length=100, verbose_name="Type d'événement")),
+                ('payment_intent_id', models.CharField(blank=True, db_index=True, max_length=255, verbose_name='ID Payment Intent')),
+                ('order_number', models.CharField(blank=True, max_length=20, verbose_name='Numéro de commande')),
+                ('stripe_created', models.DateTimeField(verbose_name='Créé chez Stripe le')),
+                ('payload', models.JSONField(default=dict, verbose_name='Contenu')),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('processed', 'Traité'), ('ignored', 'Ignoré'), ('failed', 'Échec')], default='pending', max_length=20, verbose_name='Statut')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Tentatives')),
+                ('last_error', models.TextField(blank=True, verbose_name='Dernière erreur')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Traité le')),
+            ],
+            options={
+                'verbose_name': 'Événement Stripe',
+                'verbose_name_plural': 'Événements Stripe',
+                'ordering': ['stripe_created', 'id'],
+                'indexes': [models.Index(fields=['status', 'stripe_created'], name='checkout_st_status_f0cdcb_idx')],
+            },
+        ),
+    ]
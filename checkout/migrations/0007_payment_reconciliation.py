@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0006_outbound_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Nom')),
+                ('synced_until', models.DateTimeField(blank=True, null=True, verbose_name="Rapproché jusqu'au")),
+                ('window_end', models.DateTimeField(blank=True, null=True, verbose_name='Fin de la fenêtre en cours')),
+                ('resource', models.CharField(blank=True, max_length=50, verbose_name='Ressource en cours')),
+                ('starting_after', models.CharField(blank=True, max_length=255, verbose_name='Dernier objet traité')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Curseur de rapprochement',
+                'verbose_name_plural': 'Curseurs de rapprochement',
+            },
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='stripe_payment_intent_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, verbose_name='ID Payment Intent Stripe'),
+        ),
+    ]
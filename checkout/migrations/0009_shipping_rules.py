@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:20
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def create_default_rule(apps, schema_editor):
+    # Reprend l'ancien tarif codé en dur : 59,90 MAD, gratuit à partir de 500 MAD
+    ShippingRule = apps.get_model('checkout', 'ShippingRule')
+    ShippingRule.objects.create(
+        name="Standard (toutes zones)",
+        method='standard',
+        base_cost=Decimal('59.90'),
+        free_shipping_threshold=Decimal('500.00'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0008_order_status_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShippingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Nom')),
+                ('method', models.CharField(choices=[('standard', 'Livraison standard'), ('express', 'Livraison express'), ('pickup', 'Point relais')], default='standard', max_length=20, verbose_name='Méthode de livraison')),
+                ('postal_code_prefix', models.CharField(blank=True, help_text='Vide : toutes les zones', max_length=10, verbose_name='Préfixe de code postal')),
+                ('min_weight_grams', models.PositiveIntegerField(default=0, verbose_name='Poids minimum (g)')),
+                ('max_weight_grams', models.PositiveIntegerField(blank=True, null=True, verbose_name='Poids maximum (g)')),
+                ('base_cost', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Coût de base')),
+                ('cost_per_kg', models.DecimalField(decimal_places=2, default=0, max_digits=8, verbose_name='Coût par kg entamé')),
+                ('free_shipping_threshold', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Livraison gratuite à partir de')),
+                ('priority', models.PositiveSmallIntegerField(default=0, help_text="La plus petite l'emporte", verbose_name='Priorité')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Active')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Règle de livraison',
+                'verbose_name_plural': 'Règles de livraison',
+                'ordering': ['method', 'postal_code_prefix', 'priority'],
+            },
+        ),
+        migrations.RunPython(create_default_rule, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0009_shipping_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PickupPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=50, unique=True, verbose_name='Code')),
+                ('name', models.CharField(max_length=200, verbose_name='Nom')),
+                ('address_line', models.CharField(max_length=255, verbose_name='Adresse')),
+                ('city', models.CharField(max_length=100, verbose_name='Ville')),
+                ('postal_code', models.CharField(max_length=20, verbose_name='Code postal')),
+                ('latitude', models.FloatField(verbose_name='Latitude')),
+                ('longitude', models.FloatField(verbose_name='Longitude')),
+                ('opening_hours', models.CharField(blank=True, max_length=255, verbose_name="Horaires d'ouverture")),
+                ('is_active', models.BooleanField(default=True, verbose_name='Ouvert')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Point relais',
+                'verbose_name_plural': 'Points relais',
+                'ordering': ['city', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PostalCodeCentroid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('postal_code', models.CharField(max_length=20, unique=True, verbose_name='Code postal')),
+                ('city', models.CharField(blank=True, max_length=100, verbose_name='Ville')),
+                ('latitude', models.FloatField(verbose_name='Latitude')),
+                ('longitude', models.FloatField(verbose_name='Longitude')),
+            ],
+            options={
+                'verbose_name': 'Centre de code postal',
+                'verbose_name_plural': 'Centres de codes postaux',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='pickup_point',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='orders', to='checkout.pickuppoint', verbose_name='Point relais'),
+        ),
+    ]
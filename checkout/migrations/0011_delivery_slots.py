@@ -0,0 +1,78 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:23
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0010_pickup_points'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliverySlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('start_time', models.TimeField(verbose_name='Début')),
+                ('end_time', models.TimeField(verbose_name='Fin')),
+                ('shipping_method', models.CharField(choices=[('standard', 'Livraison standard'), ('express', 'Livraison express'), ('pickup', 'Point relais')], default='standard', max_length=20, verbose_name='Méthode de livraison')),
+                ('capacity', models.PositiveIntegerField(verbose_name='Capacité')),
+                ('shard_count', models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Nombre de compteurs')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Actif')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Créneau de livraison',
+                'verbose_name_plural': 'Créneaux de livraison',
+                'ordering': ['date', 'start_time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeliverySlotShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField(verbose_name='Index')),
+                ('capacity', models.PositiveIntegerField(default=0, verbose_name='Capacité')),
+                ('claimed', models.PositiveIntegerField(default=0, verbose_name='Places prises')),
+                ('slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='checkout.deliveryslot', verbose_name='Créneau')),
+            ],
+            options={
+                'verbose_name': 'Compteur de créneau',
+                'verbose_name_plural': 'Compteurs de créneau',
+            },
+        ),
+        migrations.CreateModel(
+            name='DeliverySlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard_index', models.PositiveSmallIntegerField(verbose_name='Compteur')),
+                ('session_key', models.CharField(db_index=True, max_length=40, verbose_name='Clé de session')),
+                ('status', models.CharField(choices=[('held', 'Retenue'), ('confirmed', 'Confirmée'), ('released', 'Libérée')], default='held', max_length=20, verbose_name='Statut')),
+                ('expires_at', models.DateTimeField(verbose_name='Expire le')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='delivery_slot_hold', to='checkout.order', verbose_name='Commande')),
+                ('slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='checkout.deliveryslot', verbose_name='Créneau')),
+            ],
+            options={
+                'verbose_name': 'Réservation de créneau',
+                'verbose_name_plural': 'Réservations de créneau',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='deliveryslot',
+            constraint=models.UniqueConstraint(fields=('date', 'start_time', 'shipping_method'), name='unique_delivery_slot'),
+        ),
+        migrations.AddConstraint(
+            model_name='deliveryslotshard',
+            constraint=models.UniqueConstraint(fields=('slot', 'index'), name='unique_delivery_slot_shard'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryslothold',
+            index=models.Index(fields=['status', 'expires_at'], name='checkout_de_status_865a1d_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_volume'),
+        ('checkout', '0011_delivery_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItemCustomization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Quantité')),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Prix unitaire')),
+                ('created_at', models.DateTimeField(verbose_name='Commandé le')),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='order_lines', to='products.customizationoption', verbose_name='Option')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='customization_lines', to='checkout.order', verbose_name='Commande')),
+                ('order_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='customization_lines', to='checkout.orderitem', verbose_name='Article de commande')),
+            ],
+            options={
+                'verbose_name': 'Personnalisation commandée',
+                'verbose_name_plural': 'Personnalisations commandées',
+                'indexes': [models.Index(fields=['option', 'created_at'], name='checkout_or_option__03ca21_idx'), models.Index(fields=['created_at', 'option'], name='checkout_or_created_1ee2bc_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='orderitemcustomization',
+            constraint=models.UniqueConstraint(fields=('order_item', 'option'), name='unique_order_item_option'),
+        ),
+    ]
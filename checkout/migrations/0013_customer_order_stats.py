@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:39
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def compute_customer_stats(apps, schema_editor):
+    # Statistiques jusqu'ici jamais renseignées : calcul initial à partir des commandes payées
+    Order = apps.get_model('checkout', 'Order')
+    OrderItem = apps.get_model('checkout', 'OrderItem')
+    UserProfile = apps.get_model('users', 'UserProfile')
+    Order.objects.filter(
+        Q(payment_status='paid') & ~Q(order_status__in=['cancelled', 'refunded'])
+    ).update(in_customer_stats=True)
+    counted = Order.objects.filter(user_id=OuterRef('user_id'), in_customer_stats=True).order_by()
+    UserProfile.objects.update(
+        total_orders=Coalesce(Subquery(
+            counted.values('user_id').annotate(n=Count('pk')).values('n')[:1], output_field=IntegerField(),
+        ), 0),
+        total_spent=Coalesce(Subquery(
+            counted.values('user_id').annotate(s=Sum('total')).values('s')[:1],
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ), Value(Decimal('0.00'))),
+        last_order_date=Subquery(counted.order_by('-created_at').values('created_at')[:1]),
+        favorite_flavor=Subquery(
+            OrderItem.objects.filter(
+                order__user_id=OuterRef('user_id'), order__in_customer_stats=True, flavor__isnull=False,
+            ).values('flavor_id').annotate(quantity=Sum('quantity')).order_by('-quantity', 'flavor_id')
+            .values('flavor_id')[:1]
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0012_order_item_customizations'),
+        ('users', '0005_profile_favorite_flavor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='in_customer_stats',
+            field=models.BooleanField(default=False, verbose_name='Comptée dans les statistiques client'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_history_idx'),
+        ),
+        migrations.RunPython(compute_customer_stats, migrations.RunPython.noop),
+    ]
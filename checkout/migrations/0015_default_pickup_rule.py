@@ -0,0 +1,26 @@
+from decimal import Decimal
+
+from django.db import migrations
+
+
+def create_pickup_rule(apps, schema_editor):
+    # Sans règle « pickup », tout checkout en point relais était refusé
+    ShippingRule = apps.get_model('checkout', 'ShippingRule')
+    if not ShippingRule.objects.filter(method='pickup').exists():
+        ShippingRule.objects.create(
+            name="Point relais (toutes zones)",
+            method='pickup',
+            base_cost=Decimal('29.90'),
+            free_shipping_threshold=Decimal('500.00'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0014_order_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pickup_rule, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0015_default_pickup_rule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reservations_released',
+            field=models.BooleanField(default=False, verbose_name='Stock et coupon rendus'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from decimal import Decimal
+
+from django.db import migrations
+
+
+def create_express_rule(apps, schema_editor):
+    # Sans règle « express », tout checkout en livraison express était refusé
+    ShippingRule = apps.get_model('checkout', 'ShippingRule')
+    if not ShippingRule.objects.filter(method='express').exists():
+        ShippingRule.objects.create(
+            name="Express (toutes zones)",
+            method='express',
+            base_cost=Decimal('99.90'),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0016_order_reservations_released'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_express_rule, migrations.RunPython.noop),
+    ]
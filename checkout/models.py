@@ -1,9 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from decimal import Decimal
-import uuid
-from products.models import CustomizationOption
+from products.models import CustomizationOption, Flavor, Product
+from .order_numbers import next_order_number
 
 
 class Address(models.Model):
@@ -74,20 +77,56 @@ class Cart(models.Model):
 
     @property
     def total(self):
-        return self.subtotal + self.shipping_cost - self.discount_amount
+        """Total estimé (sans les frais de port s'ils ne sont connus qu'au checkout)"""
+        subtotal = self.subtotal
+        return subtotal + (self._shipping_cost_for(subtotal) or 0) - self.discount_amount
+
+    @property
+    def total_weight_grams(self):
+        # Une seule requête agrégée, que les lignes du panier soient préchargées ou non
+        return self.items.aggregate(
+            weight=models.Sum(models.F('product__weight_grams') * models.F('quantity')),
+        )['weight'] or 0
 
     @property
     def shipping_cost(self):
-        # Logique de calcul des frais de port
-        if self.subtotal >= 500:  # Livraison gratuite au-dessus de 500 MAD
-            return Decimal('0.00')
-        return Decimal('59.90')
+        """Frais de port estimés, None si aucun tarif standard ne s'applique (calculés au checkout)"""
+        return self._shipping_cost_for(self.subtotal)
+
+    def _shipping_cost_for(self, subtotal):
+        # Tarif standard, toutes zones : le tarif exact dépend de l'adresse (CartPricer)
+        from .shipping import get_shipping_table
+        return get_shipping_table().quote(subtotal, self.total_weight_grams)
 
     @property
     def discount_amount(self):
         return Decimal('0.00')  # À implémenter avec les codes promo
 
 
+class CartItemQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Suppression groupée (sans signal par ligne, donc sans SELECT préalable)
+
+        Le contexte d'en-tête des propriétaires des paniers est invalidé ;
+        depuis ``cart.items`` le panier est déjà connu, sans requête.
+        """
+        cart = self._hints.get('instance')
+        if isinstance(cart, Cart):
+            user_ids = [cart.user_id]
+        else:
+            user_ids = list(
+                Cart.objects.filter(pk__in=self.values('cart_id')).values_list('user_id', flat=True).distinct()
+            )
+        result = super().delete()
+        from users.context import bump_user_context
+        bump_user_context(user_ids)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class CartItem(models.Model):
     """Article dans le panier"""
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items', verbose_name="Panier")
@@ -101,6 +140,8 @@ class CartItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Article du panier"
         verbose_name_plural = "Articles du panier"
@@ -110,6 +151,12 @@ class CartItem(models.Model):
         flavor_text = f" - {self.flavor.name}" if self.flavor else ""
         return f"{self.product.name}{flavor_text} x{self.quantity}"
 
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        from users.context import bump_user_context
+        bump_user_context([Cart.objects.filter(pk=self.cart_id).values_list('user_id', flat=True).first()])
+        return result
+
     @property
     def unit_price(self):
         base_price = self.product.current_price
@@ -148,6 +195,19 @@ class Order(models.Model):
         ('refunded', 'Remboursée'),
     ]
 
+    # Machine à états du back-office : statuts atteignables depuis chaque statut
+    ORDER_TRANSITIONS = {
+        'pending': {'confirmed', 'cancelled'},
+        'confirmed': {'processing', 'shipped', 'cancelled', 'refunded'},
+        'processing': {'shipped', 'cancelled', 'refunded'},
+        'shipped': {'delivered', 'refunded'},
+        'delivered': {'refunded'},
+        'cancelled': set(),
+        'refunded': set(),
+    }
+    # Une commande payée ne s'annule pas : elle se rembourse (via Stripe)
+    PAID_FORBIDDEN_TRANSITIONS = {'cancelled'}
+
     PAYMENT_STATUS = [
         ('pending', 'En attente'),
         ('paid', 'Payée'),
@@ -174,15 +234,26 @@ class Order(models.Model):
     
     # Paiement
     payment_method = models.CharField(max_length=50, blank=True, verbose_name="Méthode de paiement")
-    stripe_payment_intent_id = models.CharField(max_length=255, blank=True, verbose_name="ID Payment Intent Stripe")
+    stripe_payment_intent_id = models.CharField(max_length=255, blank=True, db_index=True, verbose_name="ID Payment Intent Stripe")
     
     # Livraison
     shipping_method = models.CharField(max_length=50, default="standard", verbose_name="Méthode de livraison")
+    pickup_point = models.ForeignKey('PickupPoint', on_delete=models.PROTECT, blank=True, null=True,
+                                     related_name='orders', verbose_name="Point relais")
     tracking_number = models.CharField(max_length=100, blank=True, verbose_name="Numéro de suivi")
     estimated_delivery = models.DateField(blank=True, null=True, verbose_name="Date de livraison estimée")
     
     # Notes
     notes = models.TextField(blank=True, verbose_name="Notes")
+
+    # Clé d'idempotence fournie par le client (double soumission, retries)
+    idempotency_key = models.CharField(max_length=64, unique=True, blank=True, null=True, verbose_name="Clé d'idempotence")
+
+    # Commande déjà comptée dans les statistiques du profil client
+    in_customer_stats = models.BooleanField(default=False, verbose_name="Comptée dans les statistiques client")
+
+    # Stock et utilisation du coupon rendus (commande annulée, remboursée ou paiement échoué)
+    reservations_released = models.BooleanField(default=False, verbose_name="Stock et coupon rendus")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -191,13 +262,19 @@ class Order(models.Model):
         verbose_name = "Commande"
         verbose_name_plural = "Commandes"
         ordering = ['-created_at']
+        indexes = [
+            # Historique client paginé par clé (created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_history_idx'),
+            # Commandes modifiées depuis la dernière segmentation RFM (analytics.rfm)
+            models.Index(fields=['updated_at'], name='order_updated_at_idx'),
+        ]
 
     def __str__(self):
         return f"Commande {self.order_number}"
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            self.order_number = f"CAR{str(uuid.uuid4())[:8].upper()}"
+            self.order_number = next_order_number()
         super().save(*args, **kwargs)
 
     @property
@@ -206,7 +283,291 @@ class Order(models.Model):
 
     @property
     def can_be_cancelled(self):
-        return self.order_status in ['pending', 'confirmed']
+        return self.can_transition_to('cancelled')
+
+    def can_transition_to(self, status):
+        if status in self.PAID_FORBIDDEN_TRANSITIONS and self.payment_status == 'paid':
+            return False
+        return status in self.ORDER_TRANSITIONS.get(self.order_status, ())
+
+    @classmethod
+    def statuses_allowing(cls, status):
+        """Statuts depuis lesquels ``status`` est atteignable"""
+        return [source for source, targets in cls.ORDER_TRANSITIONS.items() if status in targets]
+
+    @classmethod
+    def transition_filter(cls, status):
+        """Filtre des commandes pouvant passer à ``status`` (même règle que can_transition_to)"""
+        condition = models.Q(order_status__in=cls.statuses_allowing(status))
+        if status in cls.PAID_FORBIDDEN_TRANSITIONS:
+            condition &= ~models.Q(payment_status='paid')
+        return condition
+
+
+class StripeEvent(models.Model):
+    """Boîte de réception des webhooks Stripe (traitée en arrière-plan)"""
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('processed', 'Traité'),
+        ('ignored', 'Ignoré'),
+        ('failed', 'Échec'),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True, verbose_name="ID événement Stripe")
+    event_type = models.CharField(max_length=100, verbose_name="Type d'événement")
+    payment_intent_id = models.CharField(max_length=255, blank=True, db_index=True, verbose_name="ID Payment Intent")
+    order_number = models.CharField(max_length=20, blank=True, verbose_name="Numéro de commande")
+    stripe_created = models.DateTimeField(verbose_name="Créé chez Stripe le")
+    payload = models.JSONField(default=dict, verbose_name="Contenu")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Statut")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentatives")
+    last_error = models.TextField(blank=True, verbose_name="Dernière erreur")
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True, verbose_name="Traité le")
+
+    class Meta:
+        verbose_name = "Événement Stripe"
+        verbose_name_plural = "Événements Stripe"
+        ordering = ['stripe_created', 'id']
+        indexes = [
+            models.Index(fields=['status', 'stripe_created']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id})"
+
+
+class OutboundEmail(models.Model):
+    """Email transactionnel en attente d'envoi (outbox)"""
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('sent', 'Envoyé'),
+        ('failed', 'Échec'),
+    ]
+
+    to_email = models.EmailField(verbose_name="Destinataire")
+    subject = models.CharField(max_length=255, verbose_name="Sujet")
+    template_name = models.CharField(max_length=255, verbose_name="Template")
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, blank=True, null=True, related_name='emails', verbose_name="Commande")
+    context = models.JSONField(default=dict, blank=True, verbose_name="Contexte")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Statut")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentatives")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="Prochaine tentative")
+    last_error = models.TextField(blank=True, verbose_name="Dernière erreur")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True, verbose_name="Envoyé le")
+
+    class Meta:
+        verbose_name = "Email sortant"
+        verbose_name_plural = "Emails sortants"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} → {self.to_email}"
+
+
+class ReconciliationCursor(models.Model):
+    """Curseur de reprise du rapprochement des paiements avec Stripe"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="Nom")
+    synced_until = models.DateTimeField(blank=True, null=True, verbose_name="Rapproché jusqu'au")
+    window_end = models.DateTimeField(blank=True, null=True, verbose_name="Fin de la fenêtre en cours")
+    resource = models.CharField(max_length=50, blank=True, verbose_name="Ressource en cours")
+    starting_after = models.CharField(max_length=255, blank=True, verbose_name="Dernier objet traité")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Curseur de rapprochement"
+        verbose_name_plural = "Curseurs de rapprochement"
+
+    def __str__(self):
+        return f"{self.name} ({self.synced_until})"
+
+
+class ShippingRule(models.Model):
+    """
+    Règle de tarification de la livraison
+
+    La règle applicable est celle du préfixe de code postal le plus long,
+    puis de plus petite priorité, dont la tranche de poids contient le colis.
+    """
+    METHODS = [
+        ('standard', 'Livraison standard'),
+        ('express', 'Livraison express'),
+        ('pickup', 'Point relais'),
+    ]
+
+    name = models.CharField(max_length=100, verbose_name="Nom")
+    method = models.CharField(max_length=20, choices=METHODS, default='standard', verbose_name="Méthode de livraison")
+    postal_code_prefix = models.CharField(max_length=10, blank=True, verbose_name="Préfixe de code postal",
+                                          help_text="Vide : toutes les zones")
+    min_weight_grams = models.PositiveIntegerField(default=0, verbose_name="Poids minimum (g)")
+    max_weight_grams = models.PositiveIntegerField(blank=True, null=True, verbose_name="Poids maximum (g)")
+    base_cost = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Coût de base")
+    cost_per_kg = models.DecimalField(max_digits=8, decimal_places=2, default=0, verbose_name="Coût par kg entamé")
+    free_shipping_threshold = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True,
+                                                  verbose_name="Livraison gratuite à partir de")
+    priority = models.PositiveSmallIntegerField(default=0, verbose_name="Priorité", help_text="La plus petite l'emporte")
+    is_active = models.BooleanField(default=True, verbose_name="Active")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Règle de livraison"
+        verbose_name_plural = "Règles de livraison"
+        ordering = ['method', 'postal_code_prefix', 'priority']
+
+    def __str__(self):
+        return f"{self.name} ({self.get_method_display()})"
+
+
+class PostalCodeCentroid(models.Model):
+    """Coordonnées du centre d'un code postal (géocodage local)"""
+    postal_code = models.CharField(max_length=20, unique=True, verbose_name="Code postal")
+    city = models.CharField(max_length=100, blank=True, verbose_name="Ville")
+    latitude = models.FloatField(verbose_name="Latitude")
+    longitude = models.FloatField(verbose_name="Longitude")
+
+    class Meta:
+        verbose_name = "Centre de code postal"
+        verbose_name_plural = "Centres de codes postaux"
+
+    def __str__(self):
+        return f"{self.postal_code} {self.city}"
+
+
+class PickupPoint(models.Model):
+    """Point relais"""
+    code = models.CharField(max_length=50, unique=True, verbose_name="Code")
+    name = models.CharField(max_length=200, verbose_name="Nom")
+    address_line = models.CharField(max_length=255, verbose_name="Adresse")
+    city = models.CharField(max_length=100, verbose_name="Ville")
+    postal_code = models.CharField(max_length=20, verbose_name="Code postal")
+    latitude = models.FloatField(verbose_name="Latitude")
+    longitude = models.FloatField(verbose_name="Longitude")
+    opening_hours = models.CharField(max_length=255, blank=True, verbose_name="Horaires d'ouverture")
+    is_active = models.BooleanField(default=True, verbose_name="Ouvert")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Point relais"
+        verbose_name_plural = "Points relais"
+        ordering = ['city', 'name']
+
+    def __str__(self):
+        return f"{self.name} ({self.city})"
+
+
+class DeliverySlot(models.Model):
+    """
+    Créneau de livraison à capacité limitée
+
+    La capacité est répartie sur ``shard_count`` compteurs : augmenter ce
+    nombre pour les créneaux très demandés répartit les verrous de ligne.
+    """
+    date = models.DateField(verbose_name="Date")
+    start_time = models.TimeField(verbose_name="Début")
+    end_time = models.TimeField(verbose_name="Fin")
+    shipping_method = models.CharField(max_length=20, choices=ShippingRule.METHODS, default='standard',
+                                       verbose_name="Méthode de livraison")
+    capacity = models.PositiveIntegerField(verbose_name="Capacité")
+    shard_count = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)],
+                                                   verbose_name="Nombre de compteurs")
+    is_active = models.BooleanField(default=True, verbose_name="Actif")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Créneau de livraison"
+        verbose_name_plural = "Créneaux de livraison"
+        ordering = ['date', 'start_time']
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'start_time', 'shipping_method'], name='unique_delivery_slot'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.start_time:%H:%M}-{self.end_time:%H:%M} ({self.shipping_method})"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.sync_shards()
+
+    def sync_shards(self):
+        """Créer les compteurs manquants et y répartir la capacité"""
+        base, extra = divmod(self.capacity, self.shard_count)
+        shards = [
+            DeliverySlotShard(slot=self, index=index, capacity=base + (1 if index < extra else 0))
+            for index in range(self.shard_count)
+        ]
+        DeliverySlotShard.objects.bulk_create(
+            shards,
+            update_conflicts=True,
+            unique_fields=['slot', 'index'],
+            update_fields=['capacity'],
+        )
+        # Compteurs en trop (nombre réduit) : plus aucune place à prendre
+        DeliverySlotShard.objects.filter(slot=self, index__gte=self.shard_count).update(capacity=0)
+
+
+class DeliverySlotShard(models.Model):
+    """Compteur de réservations d'une partie de la capacité d'un créneau"""
+    slot = models.ForeignKey(DeliverySlot, on_delete=models.CASCADE, related_name='shards', verbose_name="Créneau")
+    index = models.PositiveSmallIntegerField(verbose_name="Index")
+    capacity = models.PositiveIntegerField(default=0, verbose_name="Capacité")
+    claimed = models.PositiveIntegerField(default=0, verbose_name="Places prises")
+
+    class Meta:
+        verbose_name = "Compteur de créneau"
+        verbose_name_plural = "Compteurs de créneau"
+        constraints = [
+            models.UniqueConstraint(fields=['slot', 'index'], name='unique_delivery_slot_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.slot} #{self.index}: {self.claimed}/{self.capacity}"
+
+
+class DeliverySlotHold(models.Model):
+    """Place retenue sur un créneau, le temps du checkout puis pour la commande"""
+    STATUS_CHOICES = [
+        ('held', 'Retenue'),
+        ('confirmed', 'Confirmée'),
+        ('released', 'Libérée'),
+    ]
+
+    slot = models.ForeignKey(DeliverySlot, on_delete=models.CASCADE, related_name='holds', verbose_name="Créneau")
+    shard_index = models.PositiveSmallIntegerField(verbose_name="Compteur")
+    session_key = models.CharField(max_length=40, db_index=True, verbose_name="Clé de session")
+    order = models.OneToOneField(Order, on_delete=models.SET_NULL, blank=True, null=True,
+                                 related_name='delivery_slot_hold', verbose_name="Commande")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held', verbose_name="Statut")
+    expires_at = models.DateTimeField(verbose_name="Expire le")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Réservation de créneau"
+        verbose_name_plural = "Réservations de créneau"
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.slot} - {self.get_status_display()}"
+
+
+class OrderNumberSequence(models.Model):
+    """Compteur de séquence pour l'allocation des numéros de commande par blocs"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="Nom")
+    next_value = models.BigIntegerField(default=1, verbose_name="Prochaine valeur")
+
+    class Meta:
+        verbose_name = "Séquence de numérotation"
+        verbose_name_plural = "Séquences de numérotation"
+
+    def __str__(self):
+        return f"{self.name} ({self.next_value})"
 
 
 class OrderItem(models.Model):
@@ -228,6 +589,51 @@ class OrderItem(models.Model):
         return f"{self.product.name}{flavor_text} x{self.quantity}"
 
 
+class OrderItemCustomization(models.Model):
+    """Personnalisation d'une ligne de commande (forme normalisée de OrderItem.customizations)"""
+    order_item = models.ForeignKey(OrderItem, on_delete=models.CASCADE, related_name='customization_lines',
+                                   verbose_name="Article de commande")
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='customization_lines', verbose_name="Commande")
+    option = models.ForeignKey(CustomizationOption, on_delete=models.PROTECT, related_name='order_lines', verbose_name="Option")
+    # Quantité totale pour la ligne : quantité de l'option x quantité de l'article
+    quantity = models.PositiveIntegerField(default=1, verbose_name="Quantité")
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Prix unitaire")
+    # Date de la commande, dupliquée pour les agrégats par option et par période
+    created_at = models.DateTimeField(verbose_name="Commandé le")
+
+    class Meta:
+        verbose_name = "Personnalisation commandée"
+        verbose_name_plural = "Personnalisations commandées"
+        constraints = [
+            models.UniqueConstraint(fields=['order_item', 'option'], name='unique_order_item_option'),
+        ]
+        indexes = [
+            models.Index(fields=['option', 'created_at']),
+            models.Index(fields=['created_at', 'option']),
+        ]
+
+    def __str__(self):
+        return f"{self.option_id} x{self.quantity} ({self.order_item_id})"
+
+
+class OrderStatusHistory(models.Model):
+    """Historique des changements de statut d'une commande"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_history', verbose_name="Commande")
+    from_status = models.CharField(max_length=20, choices=Order.ORDER_STATUS, verbose_name="Ancien statut")
+    to_status = models.CharField(max_length=20, choices=Order.ORDER_STATUS, verbose_name="Nouveau statut")
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, verbose_name="Modifié par")
+    note = models.CharField(max_length=255, blank=True, verbose_name="Note")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Historique de statut"
+        verbose_name_plural = "Historiques de statut"
+        ordering = ['order', 'created_at']
+
+    def __str__(self):
+        return f"{self.order_id}: {self.from_status} → {self.to_status}"
+
+
 class Coupon(models.Model):
     """Code promo"""
     COUPON_TYPES = [
@@ -243,6 +649,7 @@ class Coupon(models.Model):
     
     min_order_amount = models.DecimalField(max_digits=8, decimal_places=2, default=0, verbose_name="Montant minimum de commande")
     max_uses = models.PositiveIntegerField(blank=True, null=True, verbose_name="Utilisations maximum")
+    max_uses_per_user = models.PositiveIntegerField(blank=True, null=True, verbose_name="Utilisations maximum par client")
     used_count = models.PositiveIntegerField(default=0, verbose_name="Nombre d'utilisations")
     
     valid_from = models.DateTimeField(verbose_name="Valide à partir de")
@@ -258,6 +665,11 @@ class Coupon(models.Model):
     def __str__(self):
         return self.code
 
+    def save(self, *args, **kwargs):
+        # Les codes sont saisis sans tenir compte de la casse
+        self.code = self.code.strip().upper()
+        super().save(*args, **kwargs)
+
     @property
     def is_valid(self):
         from django.utils import timezone
@@ -268,28 +680,113 @@ class Coupon(models.Model):
             (self.max_uses is None or self.used_count < self.max_uses)
         )
 
+    def compute_discount(self, subtotal, shipping_cost):
+        """Calculer la remise pour un sous-total donné (None si non applicable)"""
+        if subtotal < self.min_order_amount:
+            return None
+        
+        if self.coupon_type == 'percentage':
+            return (subtotal * self.value) / 100
+        elif self.coupon_type == 'fixed':
+            return min(self.value, subtotal)
+        elif self.coupon_type == 'free_shipping':
+            return shipping_cost
+        return None
+
     def apply_to_order(self, order):
         """Appliquer le coupon à une commande"""
+        from .coupons import CouponError, redeem_coupon
+
         if not self.is_valid:
             return False
         
-        if order.subtotal < self.min_order_amount:
+        discount = self.compute_discount(order.subtotal, order.shipping_cost)
+        if discount is None:
             return False
         
-        if self.coupon_type == 'percentage':
-            discount = (order.subtotal * self.value) / 100
-        elif self.coupon_type == 'fixed':
-            discount = self.value
-        elif self.coupon_type == 'free_shipping':
-            discount = order.shipping_cost
-        else:
+        try:
+            redeem_coupon(self, order.user, order, discount)
+        except CouponError:
             return False
         
         order.discount_amount = discount
         order.total = order.subtotal + order.shipping_cost - discount
-        order.save()
-        
-        self.used_count += 1
-        self.save()
+        order.save(update_fields=['discount_amount', 'total', 'updated_at'])
         
         return True
+
+
+class CouponRedemption(models.Model):
+    """Registre des utilisations de coupons"""
+    coupon = models.ForeignKey(Coupon, on_delete=models.PROTECT, related_name='redemptions', verbose_name="Coupon")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='coupon_redemptions', verbose_name="Utilisateur")
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='coupon_redemptions', verbose_name="Commande")
+    discount_amount = models.DecimalField(max_digits=8, decimal_places=2, verbose_name="Montant de la remise")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Utilisation de coupon"
+        verbose_name_plural = "Utilisations de coupons"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['coupon', 'user']),
+        ]
+
+    def __str__(self):
+        return f"{self.coupon.code} - {self.order.order_number}"
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def invalidate_coupon_cache(sender, instance, **kwargs):
+    """Invalider le cache des codes promo"""
+    from .coupons import invalidate_coupon_cache as invalidate
+    invalidate(instance.code)
+
+
+@receiver(post_save, sender=ShippingRule)
+@receiver(post_delete, sender=ShippingRule)
+def invalidate_shipping_rules(sender, instance, **kwargs):
+    """Publier une nouvelle version des règles de livraison"""
+    from django.db import transaction
+    from .shipping import invalidate_shipping_table
+    # Après validation : un autre processus ne doit pas recompiler l'ancienne version
+    transaction.on_commit(invalidate_shipping_table)
+
+
+@receiver(post_save, sender=PickupPoint)
+@receiver(post_delete, sender=PickupPoint)
+def invalidate_pickup_points(sender, instance, **kwargs):
+    """Reconstruire l'index spatial des points relais"""
+    from django.db import transaction
+    from .pickup_points import invalidate_pickup_index
+    transaction.on_commit(invalidate_pickup_index)
+
+
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+def refresh_cart_user_context(sender, instance, **kwargs):
+    """Nombre d'articles de l'en-tête à recharger"""
+    from users.context import bump_user_context
+    bump_user_context([instance.user_id])
+
+
+# Pas de post_delete sur CartItem : le vidage du panier resterait un DELETE groupé.
+# Les suppressions passent par CartItem.delete() / CartItemQuerySet.delete(), et
+# les suppressions en cascade d'un produit ou d'un parfum par le pre_delete ci-dessous.
+@receiver(post_save, sender=CartItem)
+def refresh_cart_item_user_context(sender, instance, **kwargs):
+    from users.context import bump_user_context
+    user_id = Cart.objects.filter(pk=instance.cart_id).values_list('user_id', flat=True).first()
+    bump_user_context([user_id])
+
+
+@receiver(pre_delete, sender=Product)
+@receiver(pre_delete, sender=Flavor)
+def refresh_cascaded_cart_user_context(sender, instance, **kwargs):
+    """Lignes de panier supprimées en cascade avec un produit ou un parfum"""
+    from users.context import bump_user_context
+    field = 'product' if sender is Product else 'flavor'
+    bump_user_context(
+        Cart.objects.filter(**{f'items__{field}': instance}).values_list('user_id', flat=True).distinct()
+    )
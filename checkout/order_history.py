@@ -0,0 +1,82 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Prefetch, Q
+
+from .models import Order, OrderItem
+
+
+PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+
+
+class InvalidCursorError(ValueError):
+    """Curseur de pagination illisible"""
+
+
+def encode_cursor(order):
+    value = f"{order.created_at.isoformat()}|{order.pk}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        value = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, pk = value.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursorError("Curseur invalide") from e
+
+
+def order_history_page(user, cursor=None, page_size=PAGE_SIZE):
+    """
+    Page de l'historique de commandes d'un client
+
+    Pagination par clé sur (created_at, id) décroissants : le coût d'une
+    page ne dépend pas de sa position (pas d'OFFSET) et l'index
+    order_user_history_idx la sert directement. Deux requêtes par page :
+    commandes (avec le point relais), articles avec produit et parfum.
+
+    Raises:
+        InvalidCursorError: Si le curseur est illisible
+
+    Returns:
+        tuple: (commandes, curseur de la page suivante ou None)
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    orders = Order.objects.filter(user=user).order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        orders = orders.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    orders = list(
+        orders.select_related('pickup_point')
+        .prefetch_related(Prefetch('items', queryset=OrderItem.objects.select_related('product', 'flavor')))
+        [:page_size + 1]
+    )
+    if len(orders) > page_size:
+        orders = orders[:page_size]
+        return orders, encode_cursor(orders[-1])
+    return orders, None
+
+
+def serialize_order(order):
+    return {
+        'order_number': order.order_number,
+        'created_at': order.created_at.isoformat(),
+        'order_status': order.order_status,
+        'order_status_display': order.get_order_status_display(),
+        'payment_status': order.payment_status,
+        'total': str(order.total),
+        'tracking_number': order.tracking_number,
+        'estimated_delivery': order.estimated_delivery.isoformat() if order.estimated_delivery else None,
+        'items': [
+            {
+                'product': item.product.name,
+                'product_slug': item.product.slug,
+                'flavor': item.flavor.name if item.flavor else None,
+                'quantity': item.quantity,
+                'total_price': str(item.total_price),
+            }
+            for item in order.items.all()
+        ],
+    }
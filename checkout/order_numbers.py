@@ -0,0 +1,142 @@
+import os
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections
+from django.db.models import F
+from django.utils import timezone
+
+
+ORDER_SEQUENCE_NAME = 'order'
+DEFAULT_BLOCK_SIZE = 50
+
+
+def luhn_check_digit(digits):
+    """Chiffre de contrôle Luhn pour une chaîne de chiffres"""
+    total = 0
+    for index, char in enumerate(reversed(digits)):
+        value = int(char)
+        if index % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+
+def format_order_number(sequence, date=None):
+    """
+    Formater un numéro de séquence en numéro de commande lisible
+
+    Format : CAR + année sur 2 chiffres + séquence sur 8 chiffres + chiffre
+    de contrôle, ex. CAR26000012344. La séquence ne repart jamais à zéro,
+    l'année n'est là que pour la lisibilité.
+    """
+    date = date or timezone.localdate()
+    digits = f"{date:%y}{sequence:08d}"
+    return f"CAR{digits}{luhn_check_digit(digits)}"
+
+
+def is_valid_order_number(order_number):
+    """Vérifier le chiffre de contrôle d'un numéro de commande"""
+    digits = order_number[3:]
+    if not order_number.startswith('CAR') or not digits.isdigit() or len(digits) < 2:
+        return False
+    return luhn_check_digit(digits[:-1]) == digits[-1]
+
+
+class OrderNumberAllocator:
+    """
+    Allocateur de numéros de commande par blocs
+
+    Chaque processus réserve un bloc de ``block_size`` numéros dans la table
+    de compteurs, puis les distribue en mémoire : pas d'aller-retour base par
+    commande et aucune collision possible entre workers.
+
+    La réservation passe par une connexion dédiée et validée immédiatement,
+    pour qu'un rollback de la transaction de commande ne puisse pas rendre
+    le même bloc à un autre worker. SQLite n'acceptant qu'un seul écrivain,
+    on réserve sur la connexion courante quand elle est déjà dans une
+    transaction (développement uniquement).
+    """
+
+    def __init__(self, name=ORDER_SEQUENCE_NAME, block_size=None, using=DEFAULT_DB_ALIAS):
+        self.name = name
+        self.block_size = block_size or getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', DEFAULT_BLOCK_SIZE)
+        self.using = using
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._pid = None
+
+    def next_value(self):
+        with self._lock:
+            # Après un fork (gunicorn --preload), le bloc hérité appartient au parent
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._next, self._end = self._lease_block()
+                self._pid = os.getpid()
+            value = self._next
+            self._next += 1
+            return value
+
+    def next_order_number(self):
+        return format_order_number(self.next_value())
+
+    def _lease_block(self):
+        current = connections[self.using]
+        if current.vendor == 'sqlite' and current.in_atomic_block:
+            return self._lease_block_inline()
+
+        connection = connections.create_connection(self.using)
+        table = connection.ops.quote_name(self._db_table())
+        try:
+            connection.set_autocommit(False)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} SET next_value = next_value + %s WHERE name = %s",
+                    [self.block_size, self.name],
+                )
+                if cursor.rowcount == 0:
+                    try:
+                        cursor.execute(
+                            f"INSERT INTO {table} (name, next_value) VALUES (%s, %s)",
+                            [self.name, 1 + self.block_size],
+                        )
+                    except IntegrityError:
+                        # Un autre worker vient de créer le compteur
+                        connection.rollback()
+                        cursor.execute(
+                            f"UPDATE {table} SET next_value = next_value + %s WHERE name = %s",
+                            [self.block_size, self.name],
+                        )
+                cursor.execute(f"SELECT next_value FROM {table} WHERE name = %s", [self.name])
+                end = cursor.fetchone()[0]
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        return end - self.block_size, end
+
+    def _lease_block_inline(self):
+        from .models import OrderNumberSequence
+
+        sequence, _ = OrderNumberSequence.objects.using(self.using).get_or_create(name=self.name)
+        OrderNumberSequence.objects.using(self.using).filter(pk=sequence.pk).update(
+            next_value=F('next_value') + self.block_size
+        )
+        sequence.refresh_from_db(fields=['next_value'])
+        return sequence.next_value - self.block_size, sequence.next_value
+
+    @staticmethod
+    def _db_table():
+        from .models import OrderNumberSequence
+        return OrderNumberSequence._meta.db_table
+
+
+order_number_allocator = OrderNumberAllocator()
+
+
+def next_order_number():
+    return order_number_allocator.next_order_number()
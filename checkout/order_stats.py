@@ -0,0 +1,117 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (
+    BooleanField, Case, Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from products.recommendations import invalidate_recommendations
+from users.models import UserProfile
+
+from .models import Order, OrderItem
+
+
+# Commandes comptées dans les statistiques client : payées, ni annulées ni remboursées
+COUNTED_ORDERS = Q(payment_status='paid') & ~Q(order_status__in=['cancelled', 'refunded'])
+
+
+def last_order_subquery():
+    return Subquery(
+        Order.objects.filter(user_id=OuterRef('user_id'), in_customer_stats=True)
+        .order_by('-created_at')
+        .values('created_at')[:1]
+    )
+
+
+def favorite_flavor_subquery():
+    return Subquery(
+        OrderItem.objects.filter(
+            order__user_id=OuterRef('user_id'), order__in_customer_stats=True, flavor__isnull=False,
+        )
+        .values('flavor_id')
+        .annotate(quantity=Sum('quantity'))
+        .order_by('-quantity', 'flavor_id')
+        .values('flavor_id')[:1]
+    )
+
+
+def sync_order_stats(order_ids):
+    """
+    Reporter dans les profils l'entrée ou la sortie de commandes du périmètre compté
+
+    À appeler après tout changement de statut (webhook, rapprochement,
+    back-office). Chaque commande porte l'indicateur in_customer_stats :
+    seules celles dont l'état compté a changé modifient les compteurs, par
+    incrément (F) ; rejouer l'appel est sans effet. Le parfum préféré et la
+    date de dernière commande des seuls clients concernés sont recalculés
+    dans le même UPDATE.
+
+    Returns:
+        int: Nombre de commandes entrées ou sorties du périmètre
+    """
+    with transaction.atomic():
+        rows = [
+            (pk, user_id, total, counted)
+            for pk, user_id, total, counted, flagged in (
+                Order.objects.select_for_update()
+                .filter(pk__in=list(order_ids))
+                .annotate(counted=Case(When(COUNTED_ORDERS, then=Value(True)), default=Value(False),
+                                       output_field=BooleanField()))
+                .values_list('pk', 'user_id', 'total', 'counted', 'in_customer_stats')
+            )
+            if counted != flagged
+        ]
+        if not rows:
+            return 0
+
+        deltas = {}
+        for pk, user_id, total, counted in rows:
+            sign = 1 if counted else -1
+            orders, spent = deltas.get(user_id, (0, Decimal('0.00')))
+            deltas[user_id] = (orders + sign, spent + sign * total)
+
+        for counted in (True, False):
+            Order.objects.filter(pk__in=[pk for pk, _, _, c in rows if c == counted]).update(in_customer_stats=counted)
+
+        # Profils absents (comptes antérieurs aux signaux) créés avant l'UPDATE
+        UserProfile.objects.bulk_create([UserProfile(user_id=user_id) for user_id in deltas], ignore_conflicts=True)
+        UserProfile.objects.filter(user_id__in=deltas).update(
+            total_orders=Case(
+                *[When(user_id=user_id, then=F('total_orders') + orders) for user_id, (orders, _) in deltas.items()],
+                default=F('total_orders'),
+                output_field=IntegerField(),
+            ),
+            total_spent=Case(
+                *[When(user_id=user_id, then=F('total_spent') + spent) for user_id, (_, spent) in deltas.items()],
+                default=F('total_spent'),
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ),
+            last_order_date=last_order_subquery(),
+            favorite_flavor=favorite_flavor_subquery(),
+            updated_at=timezone.now(),
+        )
+        # Achats pris en compte dans les recommandations
+        invalidate_recommendations(deltas)
+    return len(rows)
+
+
+def rebuild_order_stats():
+    """Recalculer toutes les statistiques client à partir des commandes (audit, réparation)"""
+    with transaction.atomic():
+        Order.objects.filter(COUNTED_ORDERS, in_customer_stats=False).update(in_customer_stats=True)
+        Order.objects.exclude(COUNTED_ORDERS).filter(in_customer_stats=True).update(in_customer_stats=False)
+        counted = Order.objects.filter(user_id=OuterRef('user_id'), in_customer_stats=True).order_by().values('user_id')
+        return UserProfile.objects.update(
+            total_orders=Coalesce(
+                Subquery(counted.annotate(n=Count('pk')).values('n')[:1], output_field=IntegerField()), 0,
+            ),
+            total_spent=Coalesce(
+                Subquery(counted.annotate(s=Sum('total')).values('s')[:1],
+                         output_field=DecimalField(max_digits=10, decimal_places=2)),
+                Value(Decimal('0.00')),
+            ),
+            last_order_date=last_order_subquery(),
+            favorite_flavor=favorite_flavor_subquery(),
+        )
@@ -0,0 +1,178 @@
+import csv
+import logging
+
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+from django.utils import timezone
+
+from caravela.push import publish
+
+from .delivery_slots import sync_order_slots
+from .emails import enqueue_order_emails
+from .models import Order, OrderStatusHistory
+from .order_stats import sync_order_stats
+from .orders import sync_order_reservations
+
+
+logger = logging.getLogger(__name__)
+
+# Emails mis en file avec le changement de statut (jamais envoyés en ligne)
+STATUS_EMAILS = {
+    'shipped': 'order_shipped',
+    'delivered': 'order_delivered',
+    'cancelled': 'order_cancelled',
+}
+
+TRACKING_CHUNK_SIZE = 500
+
+
+class OrderTransitionError(Exception):
+    """Transition de statut non autorisée par la machine à états"""
+
+
+def transition_order(order, to_status, changed_by=None, note=''):
+    """
+    Faire passer une commande à un nouveau statut
+
+    Raises:
+        OrderTransitionError: Si la transition n'est pas autorisée, ou si la
+            commande a changé de statut entre-temps.
+    """
+    if not order.can_transition_to(to_status):
+        raise OrderTransitionError(
+            f"Transition interdite pour la commande {order.order_number}: {order.order_status} → {to_status}"
+        )
+    updated = bulk_transition(Order.objects.filter(pk=order.pk, order_status=order.order_status),
+                              to_status, changed_by=changed_by, note=note)
+    if not updated:
+        raise OrderTransitionError(f"La commande {order.order_number} a changé de statut entre-temps")
+    order.order_status = to_status
+    return order
+
+
+def bulk_transition(queryset, to_status, changed_by=None, note='', values=None):
+    """
+    Faire passer un ensemble de commandes à un nouveau statut
+
+    Les commandes dont le statut actuel n'autorise pas la transition sont
+    ignorées, comme les commandes payées à annuler (à rembourser d'abord). Un seul UPDATE pour tout l'ensemble, l'historique et les
+    notifications étant écrits en masse dans la même transaction.
+
+    Args:
+        queryset: Commandes visées (filtre de l'admin, par exemple)
+        values: Champs supplémentaires à écrire avec le statut
+
+    Returns:
+        int: Nombre de commandes modifiées
+    """
+    with transaction.atomic():
+        rows = list(
+            queryset.order_by().select_for_update()
+            .filter(Order.transition_filter(to_status))
+            .values_list('pk', 'order_status')
+        )
+        if not rows:
+            return 0
+        pks = [pk for pk, _ in rows]
+        Order.objects.filter(pk__in=pks).update(
+            order_status=to_status,
+            updated_at=timezone.now(),
+            **(values or {}),
+        )
+        _record_transitions(rows, to_status, changed_by, note)
+    return len(rows)
+
+
+def _record_transitions(rows, to_status, changed_by, note):
+    OrderStatusHistory.objects.bulk_create([
+        OrderStatusHistory(
+            order_id=pk,
+            from_status=from_status,
+            to_status=to_status,
+            changed_by=changed_by,
+            note=note,
+        )
+        for pk, from_status in rows
+    ], batch_size=TRACKING_CHUNK_SIZE)
+    if to_status in STATUS_EMAILS:
+        enqueue_order_emails(STATUS_EMAILS[to_status], [pk for pk, _ in rows])
+    sync_order_stats([pk for pk, _ in rows])
+    sync_order_slots([pk for pk, _ in rows])
+    sync_order_reservations([pk for pk, _ in rows])
+    publish_order_updates([pk for pk, _ in rows])
+
+
+def publish_order_updates(order_ids):
+    """Diffuser aux clients connectés le nouveau statut de leurs commandes, après validation"""
+    order_ids = list(order_ids)
+    transaction.on_commit(lambda: _publish_order_updates(order_ids))
+
+
+def _publish_order_updates(order_ids):
+    rows = (
+        Order.objects.filter(pk__in=order_ids, user__isnull=False)
+        .values_list('user_id', 'order_number', 'order_status', 'payment_status')
+    )
+    for user_id, order_number, order_status, payment_status in rows:
+        publish([user_id], 'order', {
+            'order_number': order_number,
+            'order_status': order_status,
+            'payment_status': payment_status,
+        })
+
+
+def import_tracking_numbers(lines, chunk_size=TRACKING_CHUNK_SIZE, changed_by=None,
+                            order_column='order_number', tracking_column='tracking_number'):
+    """
+    Importer le fichier CSV d'un transporteur et marquer les commandes expédiées
+
+    Le fichier est lu en flux, par blocs de ``chunk_size`` lignes : chaque
+    bloc coûte une lecture, un UPDATE (CASE par commande pour le numéro de
+    suivi), l'insertion de l'historique et la mise en file des emails.
+
+    Args:
+        lines: Itérable de lignes texte (fichier ouvert, par exemple)
+
+    Returns:
+        dict: Lignes lues, commandes expédiées, lignes ignorées (incomplètes,
+        commande inconnue ou dont le statut n'autorise pas l'expédition)
+    """
+    stats = {'rows': 0, 'shipped': 0, 'skipped': 0}
+    chunk = {}
+    for row in csv.DictReader(lines):
+        stats['rows'] += 1
+        order_number = (row.get(order_column) or '').strip()
+        tracking_number = (row.get(tracking_column) or '').strip()
+        if not order_number or not tracking_number:
+            continue
+        chunk[order_number] = tracking_number
+        if len(chunk) >= chunk_size:
+            stats['shipped'] += _ship_chunk(chunk, changed_by)
+            chunk = {}
+    if chunk:
+        stats['shipped'] += _ship_chunk(chunk, changed_by)
+    stats['skipped'] = stats['rows'] - stats['shipped']
+    return stats
+
+
+def _ship_chunk(tracking_by_number, changed_by):
+    with transaction.atomic():
+        rows = list(
+            Order.objects.order_by().select_for_update()
+            .filter(order_number__in=list(tracking_by_number), order_status__in=Order.statuses_allowing('shipped'))
+            .values_list('pk', 'order_status', 'order_number')
+        )
+        if not rows:
+            return 0
+        Order.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(
+            order_status='shipped',
+            tracking_number=Case(
+                *[When(pk=pk, then=Value(tracking_by_number[number])) for pk, _, number in rows],
+                output_field=CharField(),
+            ),
+            updated_at=timezone.now(),
+        )
+        _record_transitions([(pk, status) for pk, status, _ in rows], 'shipped', changed_by,
+                            note="Import des numéros de suivi")
+    logger.info(f"{len(rows)} commandes marquées expédiées (import suivi)")
+    return len(rows)
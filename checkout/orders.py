@@ -0,0 +1,298 @@
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import IntegrityError, transaction
+from django.db.models import BooleanField, Case, Count, F, IntegerField, PositiveIntegerField, Q, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from products.models import Product
+from .coupons import CouponError, redeem_coupon, validate_coupon
+from .customizations import customization_rows
+from .delivery_slots import (
+    RELEASING_ORDER_STATUSES, RELEASING_PAYMENT_STATUSES, SlotUnavailableError, confirm_hold,
+)
+from .models import Address, Coupon, CouponRedemption, Order, OrderItem, OrderItemCustomization, PickupPoint
+from .order_numbers import next_order_number
+from .pricing import CartPricer
+
+
+logger = logging.getLogger(__name__)
+
+CENTS = Decimal('0.01')
+
+# Commandes dont le stock et le coupon sont rendus (mêmes statuts que les créneaux)
+RELEASING_ORDERS = Q(order_status__in=RELEASING_ORDER_STATUSES) | Q(payment_status__in=RELEASING_PAYMENT_STATUSES)
+
+
+class OrderPlacementError(Exception):
+    """Erreur métier lors de la transformation d'un panier en commande"""
+
+
+class EmptyCartError(OrderPlacementError):
+    pass
+
+
+class InsufficientStockError(OrderPlacementError):
+    def __init__(self, product_ids):
+        self.product_ids = list(product_ids)
+        super().__init__(f"Stock insuffisant pour les produits {self.product_ids}")
+
+
+class InvalidCouponError(OrderPlacementError):
+    pass
+
+
+class ShippingUnavailableError(OrderPlacementError):
+    pass
+
+
+class DeliverySlotUnavailableError(OrderPlacementError):
+    pass
+
+
+class IdempotencyKeyConflictError(OrderPlacementError):
+    pass
+
+
+def place_order(cart, shipping_address, billing_address=None, idempotency_key=None,
+                coupon_code='', shipping_method='standard', notes='', pickup_point_id=None,
+                slot_hold=None):
+    """
+    Transformer un panier en commande dans une seule transaction
+
+    Le panier est valorisé une seule fois, la commande et toutes ses lignes
+    sont créées avec les prix figés, le stock est réservé et le coupon
+    consommé de manière atomique. Le nombre de requêtes ne dépend pas du
+    nombre de lignes du panier.
+
+    Si ``idempotency_key`` est fourni, un nouvel appel avec la même clé
+    (retry, double clic) renvoie la commande déjà créée.
+
+    ``shipping_address`` est une Address ou les champs d'une adresse saisie :
+    dans ce cas l'adresse identique déjà enregistrée est réutilisée, sinon
+    elle est créée dans la transaction de la commande (rien n'est créé pour
+    un retry ou une commande refusée).
+
+    ``slot_hold`` est la place retenue sur un créneau de livraison pendant
+    le checkout ; elle est confirmée dans la même transaction.
+    """
+    if idempotency_key:
+        existing = _find_existing_order(cart.user, idempotency_key)
+        if existing:
+            return existing
+
+    if isinstance(shipping_address, Address):
+        postal_code = shipping_address.postal_code
+    else:
+        postal_code = shipping_address.get('postal_code', '')
+    pricing = CartPricer(cart).price(
+        postal_code=postal_code,
+        shipping_method=shipping_method,
+    )
+    if not pricing.lines:
+        raise EmptyCartError("Le panier est vide")
+    if not pricing.shipping_available:
+        raise ShippingUnavailableError("Ce mode de livraison n'est pas disponible pour cette adresse")
+    if shipping_method == 'pickup':
+        if not pickup_point_id or not PickupPoint.objects.filter(pk=pickup_point_id, is_active=True).exists():
+            raise ShippingUnavailableError("Veuillez choisir un point relais ouvert")
+    else:
+        pickup_point_id = None
+    if slot_hold is not None and slot_hold.slot.shipping_method != shipping_method:
+        raise DeliverySlotUnavailableError("Ce créneau ne correspond pas au mode de livraison choisi")
+
+    coupon = None
+    if coupon_code:
+        try:
+            coupon, pricing.discount_amount = validate_coupon(
+                coupon_code, pricing.subtotal, pricing.shipping_cost, user=cart.user,
+            )
+        except CouponError as e:
+            raise InvalidCouponError(str(e)) from e
+
+    # Numéro alloué hors transaction : la réservation d'un bloc n'est jamais annulée
+    order_number = next_order_number()
+
+    try:
+        with transaction.atomic():
+            shipping_address = _resolve_address(cart.user, shipping_address)
+            # La commande est créée en premier : l'index unique sur la clé
+            # d'idempotence sérialise les soumissions concurrentes.
+            order = Order.objects.create(
+                order_number=order_number,
+                user=cart.user,
+                idempotency_key=idempotency_key or None,
+                shipping_address=shipping_address,
+                billing_address=billing_address or shipping_address,
+                subtotal=pricing.subtotal.quantize(CENTS, ROUND_HALF_UP),
+                shipping_cost=pricing.shipping_cost.quantize(CENTS, ROUND_HALF_UP),
+                discount_amount=pricing.discount_amount.quantize(CENTS, ROUND_HALF_UP),
+                total=pricing.total.quantize(CENTS, ROUND_HALF_UP),
+                shipping_method=shipping_method,
+                pickup_point_id=pickup_point_id,
+                estimated_delivery=slot_hold.slot.date if slot_hold is not None else None,
+                notes=notes,
+            )
+
+            if slot_hold is not None:
+                try:
+                    confirm_hold(slot_hold, order)
+                except SlotUnavailableError as e:
+                    raise DeliverySlotUnavailableError(str(e)) from e
+
+            _reserve_stock(pricing.lines)
+
+            if coupon is not None:
+                try:
+                    redeem_coupon(coupon, cart.user, order, order.discount_amount)
+                except CouponError as e:
+                    raise InvalidCouponError(str(e)) from e
+
+            order_items = OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product_id=line.item.product_id,
+                    flavor_id=line.item.flavor_id,
+                    quantity=line.quantity,
+                    unit_price=line.unit_price.quantize(CENTS, ROUND_HALF_UP),
+                    total_price=line.total_price.quantize(CENTS, ROUND_HALF_UP),
+                    customizations=line.item.customizations,
+                )
+                for line in pricing.lines
+            ])
+            customizations = [
+                row
+                for order_item in order_items
+                for row in customization_rows(order_item, pricing.option_prices, order.created_at)
+            ]
+            if customizations:
+                OrderItemCustomization.objects.bulk_create(customizations)
+
+            # Invalide aussi le contexte d'en-tête (nombre d'articles)
+            cart.items.all().delete()
+    except IntegrityError:
+        if idempotency_key:
+            existing = _find_existing_order(cart.user, idempotency_key)
+            if existing:
+                return existing
+            if Order.objects.filter(idempotency_key=idempotency_key).exists():
+                # Clé déjà utilisée par un autre compte : refus, pas d'erreur 500
+                raise IdempotencyKeyConflictError("Cette commande a déjà été soumise, veuillez réessayer")
+        raise
+
+    return order
+
+
+def _resolve_address(user, address):
+    """Adresse de la commande : celle fournie, l'adresse identique existante ou une nouvelle"""
+    if isinstance(address, Address):
+        return address
+    existing = Address.objects.filter(user=user, **address).order_by('pk').first()
+    return existing or Address.objects.create(user=user, **address)
+
+
+def _find_existing_order(user, idempotency_key):
+    return Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+
+
+def _reserve_stock(lines):
+    """Décrémenter le stock de tous les produits en deux requêtes"""
+    quantities = {}
+    for line in lines:
+        quantities[line.item.product_id] = quantities.get(line.item.product_id, 0) + line.quantity
+
+    stock = dict(
+        Product.objects.select_for_update()
+        .filter(pk__in=quantities)
+        .values_list('pk', 'stock_quantity')
+    )
+    missing = [pk for pk, quantity in quantities.items() if stock.get(pk, 0) < quantity]
+    if missing:
+        raise InsufficientStockError(missing)
+
+    Product.objects.filter(pk__in=quantities).update(
+        stock_quantity=Case(
+            *[When(pk=pk, then=F('stock_quantity') - quantity) for pk, quantity in quantities.items()],
+            default=F('stock_quantity'),
+            output_field=PositiveIntegerField(),
+        )
+    )
+
+
+def sync_order_reservations(order_ids):
+    """
+    Rendre ou reprendre le stock et l'utilisation du coupon des commandes
+
+    À appeler avec sync_order_slots (webhook, rapprochement, back-office).
+    L'indicateur reservations_released de chaque commande rend l'appel
+    idempotent : seules les commandes qui entrent dans un statut libérant
+    (annulée, remboursée, paiement échoué) ou qui en sortent (paiement
+    abouti après un échec) modifient le stock et les compteurs de coupons.
+
+    Returns:
+        tuple: (commandes libérées, commandes reprises)
+    """
+    with transaction.atomic():
+        rows = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=list(order_ids))
+            .annotate(releasing=Case(When(RELEASING_ORDERS, then=Value(True)), default=Value(False),
+                                     output_field=BooleanField()))
+            .values_list('pk', 'releasing', 'reservations_released')
+        )
+        to_release = [pk for pk, releasing, released in rows if releasing and not released]
+        to_reclaim = [pk for pk, releasing, released in rows if not releasing and released]
+
+        for pks, sign in ((to_release, 1), (to_reclaim, -1)):
+            if not pks:
+                continue
+            _adjust_stock(pks, sign)
+            coupons = dict(
+                CouponRedemption.objects.filter(order_id__in=pks)
+                .values('coupon_id').order_by().annotate(uses=Count('pk'))
+                .values_list('coupon_id', 'uses')
+            )
+            if coupons:
+                Coupon.objects.filter(pk__in=coupons).update(used_count=Greatest(
+                    Case(
+                        *[When(pk=pk, then=F('used_count') - sign * uses) for pk, uses in coupons.items()],
+                        default=F('used_count'),
+                        output_field=IntegerField(),
+                    ),
+                    0,
+                    output_field=PositiveIntegerField(),
+                ))
+            Order.objects.filter(pk__in=pks).update(reservations_released=sign > 0)
+    return len(to_release), len(to_reclaim)
+
+
+def _adjust_stock(order_ids, sign):
+    """Remettre (sign=1) ou reprendre (sign=-1) le stock des lignes de ces commandes"""
+    quantities = dict(
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values('product_id').order_by().annotate(quantity=Sum('quantity'))
+        .values_list('product_id', 'quantity')
+    )
+    if not quantities:
+        return
+    if sign < 0:
+        stock = dict(
+            Product.objects.select_for_update()
+            .filter(pk__in=quantities)
+            .values_list('pk', 'stock_quantity')
+        )
+        short = [pk for pk, quantity in quantities.items() if stock.get(pk, 0) < quantity]
+        if short:
+            # Paiement reçu après un échec : la commande est due, le stock manquant est signalé
+            logger.warning(f"Stock insuffisant pour reprendre les commandes {order_ids} (produits {short})")
+    Product.objects.filter(pk__in=quantities).update(
+        stock_quantity=Greatest(
+            Case(
+                *[When(pk=pk, then=F('stock_quantity') + sign * quantity) for pk, quantity in quantities.items()],
+                default=F('stock_quantity'),
+                output_field=IntegerField(),
+            ),
+            0,
+            output_field=PositiveIntegerField(),
+        )
+    )
@@ -0,0 +1,200 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from django.core.cache import cache
+from django.db import transaction
+
+from .gateway import get_gateway
+
+
+logger = logging.getLogger(__name__)
+
+INTENT_CACHE_KEY = 'payment_intent:cart:{}'
+PENDING_CACHE_KEY = 'payment_intent:cart:{}:pending'
+# Jeton du checkout en cours sur le panier, changé à chaque commande passée
+CHECKOUT_TOKEN_CACHE_KEY = 'payment_intent:cart:{}:token'
+ORDER_INTENT_CACHE_KEY = 'payment_intent:order:{}'
+INTENT_TIMEOUT = 60 * 60 * 24
+PENDING_TIMEOUT = 30
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='payment-intents')
+
+
+def to_cents(amount):
+    return int((amount * 100).to_integral_value())
+
+
+def get_cached_payment_intent(cart_id):
+    """Payment Intent préparé pour ce panier (dict) ou None s'il n'est pas prêt"""
+    if not cart_id:
+        return None
+    return cache.get(INTENT_CACHE_KEY.format(cart_id))
+
+
+def get_order_payment_intent(order):
+    """Payment Intent rattaché à la commande (dict) ou None s'il n'est pas en cache"""
+    return cache.get(ORDER_INTENT_CACHE_KEY.format(order.order_number))
+
+
+def _checkout_token(cart_id):
+    key = CHECKOUT_TOKEN_CACHE_KEY.format(cart_id)
+    cache.add(key, uuid.uuid4().hex, INTENT_TIMEOUT)
+    return cache.get(key)
+
+
+def _intent_data(intent):
+    return {
+        'id': intent.id,
+        'client_secret': intent.client_secret,
+        'amount': intent.amount,
+        'currency': intent.currency,
+    }
+
+
+def forget_cart_intent(cart_id, payment_intent_id=None):
+    """
+    Oublier l'intent préparé pour le panier et changer de jeton de checkout
+
+    Le prochain checkout du même panier crée un nouvel intent : un intent
+    rattaché à une commande (ou déjà payé) n'est jamais réutilisé. Avec
+    ``payment_intent_id``, l'entrée n'est oubliée que si c'est bien cet intent.
+    """
+    if payment_intent_id is not None:
+        current = get_cached_payment_intent(cart_id)
+        if current is not None and current['id'] != payment_intent_id:
+            return
+    cache.delete_many([INTENT_CACHE_KEY.format(cart_id), CHECKOUT_TOKEN_CACHE_KEY.format(cart_id)])
+
+
+def schedule_payment_intent(cart_id, amount, currency='eur'):
+    """
+    Préparer en arrière-plan le Payment Intent d'un panier valorisé
+
+    Ne fait rien si l'intent en cache a déjà ce montant ou si une
+    préparation est en cours. Appelé au checkout, pour que la page de
+    paiement s'affiche sans appel à Stripe.
+    """
+    amount_cents = to_cents(amount)
+    current = get_cached_payment_intent(cart_id)
+    if current and current['amount'] == amount_cents:
+        return
+    if not cache.add(PENDING_CACHE_KEY.format(cart_id), amount_cents, PENDING_TIMEOUT):
+        return
+    transaction.on_commit(lambda: _executor.submit(_sync_in_background, cart_id, amount_cents, currency))
+
+
+def _sync_in_background(cart_id, amount_cents, currency):
+    try:
+        sync_payment_intent(cart_id, amount_cents, currency)
+    except stripe.error.StripeError as e:
+        logger.error(f"Erreur Stripe lors de la préparation du Payment Intent du panier {cart_id}: {str(e)}")
+    except Exception:
+        logger.exception(f"Erreur lors de la préparation du Payment Intent du panier {cart_id}")
+    finally:
+        cache.delete(PENDING_CACHE_KEY.format(cart_id))
+
+
+def sync_payment_intent(cart_id, amount_cents, currency='eur'):
+    """
+    Créer ou mettre à jour le Payment Intent d'un panier
+
+    Le montant n'est modifié chez Stripe que s'il a changé. La clé
+    d'idempotence de création, dérivée du panier et du jeton du checkout en
+    cours, évite de créer un second intent si le cache a été perdu
+    entre-temps, sans jamais resservir celui d'une commande précédente.
+    """
+    gateway = get_gateway()
+    current = get_cached_payment_intent(cart_id)
+    if current and current['amount'] == amount_cents:
+        return current
+
+    if current:
+        intent = gateway.modify_payment_intent(current['id'], amount=amount_cents)
+    else:
+        intent = gateway.create_payment_intent(
+            amount=amount_cents,
+            currency=currency,
+            metadata={'cart_id': str(cart_id)},
+            automatic_payment_methods={'enabled': True},
+            description="Commande La Caravela",
+            idempotency_key=f"cart-{cart_id}-{_checkout_token(cart_id)}-create",
+        )
+        # Clé déjà utilisée : Stripe renvoie l'intent d'origine, avec son montant initial
+        if intent.amount != amount_cents:
+            intent = gateway.modify_payment_intent(intent.id, amount=amount_cents)
+
+    data = _intent_data(intent)
+    cache.set(INTENT_CACHE_KEY.format(cart_id), data, INTENT_TIMEOUT)
+    return data
+
+
+def attach_order(cart_id, order):
+    """
+    Rattacher la commande à l'intent préparé (métadonnées utilisées par le webhook)
+
+    L'intent passe du panier à la commande : le panier repart avec un
+    nouveau jeton de checkout.
+    """
+    intent = get_cached_payment_intent(cart_id)
+    if intent is None:
+        return None
+    order.stripe_payment_intent_id = intent['id']
+    order.save(update_fields=['stripe_payment_intent_id', 'updated_at'])
+    cache.set(ORDER_INTENT_CACHE_KEY.format(order.order_number), intent, INTENT_TIMEOUT)
+    forget_cart_intent(cart_id)
+
+    # Remise appliquée à la commande : le montant est corrigé en même temps que les métadonnées
+    amount_cents = to_cents(order.total)
+    transaction.on_commit(lambda: _executor.submit(
+        _tag_intent_in_background, intent['id'], order.order_number,
+        amount_cents if intent['amount'] != amount_cents else None,
+    ))
+    return intent
+
+
+def sync_order_payment_intent(order, cart_id=None):
+    """
+    Intent de la commande au bon montant (solution de repli de la page de paiement)
+
+    Returns:
+        dict: Intent en cache, mis à jour chez Stripe si besoin
+    """
+    amount_cents = to_cents(order.total)
+    current = get_order_payment_intent(order)
+    if current and current['id'] == order.stripe_payment_intent_id and current['amount'] == amount_cents:
+        return current
+
+    gateway = get_gateway()
+    if order.stripe_payment_intent_id:
+        intent = gateway.modify_payment_intent(order.stripe_payment_intent_id, amount=amount_cents)
+    else:
+        intent = gateway.create_payment_intent(
+            amount=amount_cents,
+            currency='eur',
+            metadata={'order_id': order.order_number, 'cart_id': str(cart_id or '')},
+            automatic_payment_methods={'enabled': True},
+            description="Commande La Caravela",
+            idempotency_key=f"order-{order.order_number}-create",
+        )
+        order.stripe_payment_intent_id = intent.id
+        order.save(update_fields=['stripe_payment_intent_id', 'updated_at'])
+        if cart_id:
+            forget_cart_intent(cart_id)
+    data = _intent_data(intent)
+    cache.set(ORDER_INTENT_CACHE_KEY.format(order.order_number), data, INTENT_TIMEOUT)
+    return data
+
+
+def _tag_intent_in_background(payment_intent_id, order_number, amount_cents=None):
+    params = {'metadata': {'order_id': order_number}}
+    if amount_cents is not None:
+        params['amount'] = amount_cents
+    try:
+        intent = get_gateway().modify_payment_intent(payment_intent_id, **params)
+    except stripe.error.StripeError as e:
+        logger.error(f"Erreur Stripe lors du rattachement de la commande {order_number}: {str(e)}")
+        return
+    if amount_cents is not None:
+        cache.set(ORDER_INTENT_CACHE_KEY.format(order_number), _intent_data(intent), INTENT_TIMEOUT)
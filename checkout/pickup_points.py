@@ -0,0 +1,186 @@
+import csv
+import threading
+import uuid
+
+from django.core.cache import cache
+
+from .geo import KDTree, chord_to_km, to_unit_vector
+from .models import PickupPoint, PostalCodeCentroid
+from .shipping import normalize_postal_code
+
+
+VERSION_CACHE_KEY = 'pickup_points:index_version'
+CENTROID_CACHE_KEY = 'postal_codes:centroid:{}'
+CENTROID_TIMEOUT = 60 * 60 * 24
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+LOAD_BATCH_SIZE = 1000
+
+_index = None
+_index_lock = threading.Lock()
+
+
+class PickupPointIndex:
+    """
+    Index spatial des points relais ouverts
+
+    Les points sont copiés en mémoire (dictionnaires prêts à sérialiser) et
+    rangés dans un k-d tree : une recherche des plus proches voisins ne
+    touche pas la base.
+    """
+
+    FIELDS = ('id', 'code', 'name', 'address_line', 'city', 'postal_code',
+              'latitude', 'longitude', 'opening_hours')
+
+    def __init__(self, points, version=None):
+        self.version = version
+        self.points = points
+        self.tree = KDTree(
+            [to_unit_vector(point['latitude'], point['longitude']) for point in points],
+            points,
+        )
+
+    def nearest(self, latitude, longitude, limit=DEFAULT_LIMIT):
+        """Points les plus proches, avec leur distance en kilomètres"""
+        return [
+            {**point, 'distance_km': round(chord_to_km(chord), 2)}
+            for chord, point in self.tree.nearest(to_unit_vector(latitude, longitude), k=limit)
+        ]
+
+
+def build_pickup_index(version=None):
+    points = list(PickupPoint.objects.filter(is_active=True).values(*PickupPointIndex.FIELDS))
+    return PickupPointIndex(points, version=version)
+
+
+def get_pickup_index():
+    """Index du processus, reconstruit quand la version publiée change"""
+    global _index
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            index = _index
+            if index is None or index.version != version:
+                index = build_pickup_index(version)
+                _index = index
+    return index
+
+
+def invalidate_pickup_index():
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def geocode_postal_code(postal_code):
+    """
+    Coordonnées (latitude, longitude) du centre d'un code postal
+
+    Returns:
+        tuple | None: None si le code postal est inconnu
+    """
+    postal_code = normalize_postal_code(postal_code)
+    if not postal_code:
+        return None
+    cache_key = CENTROID_CACHE_KEY.format(postal_code)
+    coordinates = cache.get(cache_key)
+    if coordinates is None:
+        row = PostalCodeCentroid.objects.filter(postal_code=postal_code).values_list('latitude', 'longitude').first()
+        # Les codes inconnus sont aussi mis en cache (liste vide)
+        coordinates = list(row) if row else []
+        cache.set(cache_key, coordinates, CENTROID_TIMEOUT)
+    return tuple(coordinates) if coordinates else None
+
+
+def nearest_pickup_points(latitude=None, longitude=None, postal_code='', limit=DEFAULT_LIMIT):
+    """
+    Points relais ouverts les plus proches d'une position ou d'un code postal
+
+    Returns:
+        list | None: None si la position n'a pas pu être déterminée
+    """
+    if latitude is None or longitude is None:
+        coordinates = geocode_postal_code(postal_code)
+        if coordinates is None:
+            return None
+        latitude, longitude = coordinates
+    return get_pickup_index().nearest(latitude, longitude, limit=min(max(limit, 1), MAX_LIMIT))
+
+
+def load_pickup_points(lines, batch_size=LOAD_BATCH_SIZE):
+    """
+    Charger un fichier CSV de points relais (mise à jour par code)
+
+    Colonnes : code, name, address_line, city, postal_code, latitude,
+    longitude, et en option opening_hours et is_active.
+
+    Returns:
+        int: Nombre de points chargés
+    """
+    count = 0
+    batch = []
+    for row in csv.DictReader(lines):
+        batch.append(PickupPoint(
+            code=row['code'].strip(),
+            name=row['name'].strip(),
+            address_line=row['address_line'].strip(),
+            city=row['city'].strip(),
+            postal_code=normalize_postal_code(row['postal_code']),
+            latitude=float(row['latitude']),
+            longitude=float(row['longitude']),
+            opening_hours=(row.get('opening_hours') or '').strip(),
+            is_active=(row.get('is_active') or '1').strip().lower() not in ('0', 'false', 'non', 'no'),
+        ))
+        if len(batch) >= batch_size:
+            count += _upsert(PickupPoint, batch, 'code')
+            batch = []
+    if batch:
+        count += _upsert(PickupPoint, batch, 'code')
+    # bulk_create ne déclenche pas post_save : invalidation explicite
+    invalidate_pickup_index()
+    return count
+
+
+def load_postal_code_centroids(lines, batch_size=LOAD_BATCH_SIZE):
+    """
+    Charger un fichier CSV de centres de codes postaux
+
+    Colonnes : postal_code, latitude, longitude, et en option city.
+    """
+    count = 0
+    batch = []
+    for row in csv.DictReader(lines):
+        batch.append(PostalCodeCentroid(
+            postal_code=normalize_postal_code(row['postal_code']),
+            city=(row.get('city') or '').strip(),
+            latitude=float(row['latitude']),
+            longitude=float(row['longitude']),
+        ))
+        if len(batch) >= batch_size:
+            count += _upsert_centroids(batch)
+            batch = []
+    if batch:
+        count += _upsert_centroids(batch)
+    return count
+
+
+def _upsert_centroids(centroids):
+    count = _upsert(PostalCodeCentroid, centroids, 'postal_code')
+    cache.delete_many([CENTROID_CACHE_KEY.format(centroid.postal_code) for centroid in centroids])
+    return count
+
+
+def _upsert(model, objects, unique_field):
+    update_fields = [
+        field.name for field in model._meta.concrete_fields
+        if not field.primary_key and field.name != unique_field
+    ]
+    model.objects.bulk_create(
+        objects,
+        update_conflicts=True,
+        unique_fields=[unique_field],
+        update_fields=update_fields,
+    )
+    return len(objects)
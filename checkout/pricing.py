@@ -0,0 +1,112 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from products.models import CustomizationOption, ProductFlavor
+from .shipping import get_shipping_table
+
+
+@dataclass
+class PricedLine:
+    """Ligne de panier valorisée (prix figés au moment du calcul)"""
+    item: object
+    unit_price: Decimal
+    quantity: int
+
+    @property
+    def total_price(self):
+        return self.unit_price * self.quantity
+
+
+@dataclass
+class CartPricing:
+    """Résultat du calcul de prix d'un panier"""
+    lines: list = field(default_factory=list)
+    subtotal: Decimal = Decimal('0.00')
+    shipping_cost: Decimal = Decimal('0.00')
+    discount_amount: Decimal = Decimal('0.00')
+    option_prices: dict = field(default_factory=dict)
+    weight_grams: int = 0
+    shipping_method: str = 'standard'
+    shipping_available: bool = True
+
+    @property
+    def total(self):
+        return self.subtotal + self.shipping_cost - self.discount_amount
+
+    @property
+    def total_items(self):
+        return sum(line.quantity for line in self.lines)
+
+
+class CartPricer:
+    """
+    Calcule le prix d'un panier en un nombre constant de requêtes
+
+    Contrairement à CartItem.unit_price (une requête par parfum et par
+    personnalisation), les modificateurs de parfum et les options de
+    personnalisation sont chargés en une seule fois pour tout le panier.
+    Les frais de port sont cotés sur la table de règles compilée, sans requête.
+    """
+
+    def __init__(self, cart, shipping_table=None):
+        self.cart = cart
+        self.shipping_table = shipping_table
+
+    def price(self, postal_code='', shipping_method='standard'):
+        items = list(self.cart.items.select_related('product', 'flavor'))
+
+        flavor_modifiers = self._load_flavor_modifiers(items)
+        option_prices = self._load_option_prices(items)
+
+        lines = []
+        for item in items:
+            unit_price = item.product.current_price
+            if item.flavor_id:
+                unit_price += flavor_modifiers.get((item.product_id, item.flavor_id), Decimal('0.00'))
+            unit_price += self.customization_price(item.customizations, option_prices)
+            lines.append(PricedLine(item=item, unit_price=unit_price, quantity=item.quantity))
+
+        subtotal = sum((line.total_price for line in lines), Decimal('0.00'))
+        weight_grams = sum(item.product.weight_grams * item.quantity for item in items)
+        table = self.shipping_table or get_shipping_table()
+        shipping_cost = table.quote(subtotal, weight_grams, postal_code, shipping_method)
+        return CartPricing(
+            lines=lines,
+            subtotal=subtotal,
+            option_prices=option_prices,
+            shipping_cost=shipping_cost if shipping_cost is not None else Decimal('0.00'),
+            weight_grams=weight_grams,
+            shipping_method=shipping_method,
+            shipping_available=shipping_cost is not None,
+        )
+
+    @staticmethod
+    def customization_price(customizations, option_prices):
+        price = Decimal('0.00')
+        for option_id, details in (customizations or {}).items():
+            option_price = option_prices.get(str(option_id))
+            if option_price is not None:
+                price += option_price * details.get('quantity', 1)
+        return price
+
+    def _load_flavor_modifiers(self, items):
+        product_ids = {item.product_id for item in items if item.flavor_id}
+        flavor_ids = {item.flavor_id for item in items if item.flavor_id}
+        if not flavor_ids:
+            return {}
+        rows = ProductFlavor.objects.filter(
+            product_id__in=product_ids,
+            flavor_id__in=flavor_ids,
+        ).values_list('product_id', 'flavor_id', 'price_modifier')
+        return {(product_id, flavor_id): modifier for product_id, flavor_id, modifier in rows}
+
+    def _load_option_prices(self, items):
+        option_ids = set()
+        for item in items:
+            for option_id in (item.customizations or {}):
+                if str(option_id).isdigit():
+                    option_ids.add(int(option_id))
+        if not option_ids:
+            return {}
+        rows = CustomizationOption.objects.filter(id__in=option_ids).values_list('id', 'price')
+        return {str(option_id): price for option_id, price in rows}
@@ -0,0 +1,162 @@
+"""
+Plan de production de la cuisine
+
+Les lignes des commandes confirmées et non expédiées sont lues en flux
+(``.iterator()``), les personnalisations JSON sont éclatées, puis tout est
+agrégé avec NumPy en une passe : volume par parfum, quantités par option et
+par type de produit, pour chaque date de livraison.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from products.models import CustomizationOption, Flavor, Product
+from .models import Order, OrderItem
+
+
+PRODUCTION_STATUSES = ['confirmed', 'processing']
+PLAN_CACHE_KEY = 'production_plan:{}:{}:{}'
+PLAN_TIMEOUT = 60 * 60
+CHUNK_SIZE = 2000
+
+
+def _orders(start, days):
+    return Order.objects.filter(
+        order_status__in=PRODUCTION_STATUSES,
+        estimated_delivery__gte=start,
+        estimated_delivery__lt=start + timedelta(days=days),
+    )
+
+
+def _fingerprint(start, days):
+    """
+    Empreinte des commandes concernées (nombre, dernière modification)
+
+    Une nouvelle commande ou un changement de statut la modifie : le plan
+    en cache reste valable tant qu'aucune commande n'arrive.
+    """
+    stats = _orders(start, days).aggregate(count=Count('id'), last=Max('updated_at'))
+    last = stats['last'].timestamp() if stats['last'] else 0
+    return f"{stats['count']}-{last}"
+
+
+def get_production_plan(start, days=1):
+    """Plan de production en cache, recalculé quand les commandes changent"""
+    cache_key = PLAN_CACHE_KEY.format(start.isoformat(), days, _fingerprint(start, days))
+    plan = cache.get(cache_key)
+    if plan is None:
+        plan = compute_production_plan(start, days)
+        cache.set(cache_key, plan, PLAN_TIMEOUT)
+    return plan
+
+
+def compute_production_plan(start, days=1):
+    """
+    Agréger les lignes à produire par date de livraison
+
+    Returns:
+        dict: {date ISO: {'flavors': [...], 'options': [...], 'product_types': [...]}}
+    """
+    dates = [start + timedelta(days=offset) for offset in range(days)]
+    date_index = {day: index for index, day in enumerate(dates)}
+    product_types = [code for code, _ in Product.PRODUCT_TYPES]
+    type_index = {code: index for index, code in enumerate(product_types)}
+
+    # Colonnes codées en entiers, remplies en une passe sur le flux de lignes
+    line_dates, line_flavors, line_types, line_quantities, line_volumes = [], [], [], [], []
+    option_dates, option_ids, option_quantities = [], [], []
+
+    rows = OrderItem.objects.filter(
+        order__in=_orders(start, days),
+    ).values_list(
+        'order__estimated_delivery', 'flavor_id', 'product__product_type',
+        'quantity', 'product__volume_ml', 'customizations',
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+    for delivery_date, flavor_id, product_type, quantity, volume_ml, customizations in rows:
+        day = date_index[delivery_date]
+        line_dates.append(day)
+        line_flavors.append(flavor_id or 0)
+        line_types.append(type_index.get(product_type, 0))
+        line_quantities.append(quantity)
+        line_volumes.append(volume_ml)
+        for option_id, details in (customizations or {}).items():
+            if not str(option_id).isdigit():
+                continue
+            option_dates.append(day)
+            option_ids.append(int(option_id))
+            option_quantities.append(quantity * (details or {}).get('quantity', 1))
+
+    line_dates = np.asarray(line_dates, dtype=np.int64)
+    line_quantities = np.asarray(line_quantities, dtype=np.int64)
+    liters = line_quantities * np.asarray(line_volumes, dtype=np.int64) / 1000
+
+    flavor_keys, flavor_units, flavor_liters = _group_sum(
+        line_dates, np.asarray(line_flavors, dtype=np.int64), line_quantities, liters,
+    )
+    type_keys, type_units, _ = _group_sum(
+        line_dates, np.asarray(line_types, dtype=np.int64), line_quantities,
+    )
+    option_keys, option_units, _ = _group_sum(
+        np.asarray(option_dates, dtype=np.int64),
+        np.asarray(option_ids, dtype=np.int64),
+        np.asarray(option_quantities, dtype=np.int64),
+    )
+
+    flavor_names = dict(Flavor.objects.filter(pk__in=set(flavor_keys[:, 1].tolist())).values_list('pk', 'name'))
+    flavor_names[0] = "Sans parfum"
+    options = {
+        pk: (name, option_type)
+        for pk, name, option_type in CustomizationOption.objects.filter(
+            pk__in=set(option_keys[:, 1].tolist()),
+        ).values_list('pk', 'name', 'option_type')
+    }
+    type_labels = dict(Product.PRODUCT_TYPES)
+
+    plan = {day.isoformat(): {'flavors': [], 'options': [], 'product_types': []} for day in dates}
+    for (day, flavor_id), units, volume in zip(flavor_keys.tolist(), flavor_units.tolist(), flavor_liters.tolist()):
+        plan[dates[day].isoformat()]['flavors'].append({
+            'flavor_id': flavor_id or None,
+            'name': flavor_names.get(flavor_id, f"Parfum #{flavor_id}"),
+            'units': units,
+            'liters': round(volume, 2),
+        })
+    for (day, option_id), units in zip(option_keys.tolist(), option_units.tolist()):
+        name, option_type = options.get(option_id, (f"Option #{option_id}", ''))
+        plan[dates[day].isoformat()]['options'].append({
+            'option_id': option_id,
+            'name': name,
+            'option_type': option_type,
+            'units': units,
+        })
+    for (day, type_code), units in zip(type_keys.tolist(), type_units.tolist()):
+        code = product_types[type_code]
+        plan[dates[day].isoformat()]['product_types'].append({
+            'product_type': code,
+            'name': type_labels[code],
+            'units': units,
+        })
+
+    for day_plan in plan.values():
+        for section in day_plan.values():
+            section.sort(key=lambda entry: -entry['units'])
+    return plan
+
+
+def _group_sum(dates, keys, units, extra=None):
+    """
+    Somme par couple (date, clé)
+
+    Returns:
+        tuple: (couples uniques en tableau n x 2, sommes des unités, sommes de ``extra``)
+    """
+    if not len(keys):
+        empty = np.zeros(0)
+        return np.zeros((0, 2), dtype=np.int64), empty.astype(np.int64), empty
+    pairs, inverse = np.unique(np.column_stack((dates, keys)), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    unit_sums = np.bincount(inverse, weights=units, minlength=len(pairs)).astype(np.int64)
+    extra_sums = np.bincount(inverse, weights=extra, minlength=len(pairs)) if extra is not None else None
+    return pairs, unit_sums, extra_sums
@@ -0,0 +1,208 @@
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .delivery_slots import sync_order_slots
+from .emails import enqueue_order_emails
+from .gateway import get_gateway
+from .models import Order, OrderStatusHistory, ReconciliationCursor
+from .order_stats import sync_order_stats
+from .orders import sync_order_reservations
+from .order_status import TRACKING_CHUNK_SIZE, publish_order_updates
+from .payment_intents import to_cents
+from .webhooks import TRANSITION_EMAILS
+
+
+logger = logging.getLogger(__name__)
+
+CURSOR_NAME = 'stripe_payments'
+PAGE_SIZE = 100
+RESOURCES = ('payment_intents', 'refunds')
+
+# Même ordre monotone que le traitement des webhooks : une correction ne
+# fait jamais revenir une commande à un état antérieur.
+PAYMENT_STATUS_RANK = {'pending': 0, 'failed': 1, 'paid': 2, 'refunded': 3}
+
+INTENT_STATUS_MAP = {
+    'succeeded': 'paid',
+    'canceled': 'failed',
+}
+
+# Mêmes emails que le webhook manqué aurait mis en file
+PAYMENT_STATUS_EMAILS = {
+    'paid': TRANSITION_EMAILS['payment_intent.succeeded'],
+    'failed': TRANSITION_EMAILS['payment_intent.payment_failed'],
+}
+
+HISTORY_NOTE = "Rapprochement Stripe"
+
+
+class PaymentReconciler:
+    """
+    Rapprochement par lots des commandes avec Stripe
+
+    Parcourt les listes PaymentIntent et Refund par fenêtre de temps (100
+    objets par appel), retrouve les commandes par stripe_payment_intent_id
+    (indexé) et applique les corrections avec bulk_update. Le curseur est
+    enregistré après chaque page : une exécution interrompue reprend là où
+    elle s'était arrêtée.
+    """
+
+    def __init__(self, gateway=None, name=CURSOR_NAME, page_size=PAGE_SIZE, dry_run=False):
+        self.gateway = gateway or get_gateway()
+        self.name = name
+        self.page_size = page_size
+        self.dry_run = dry_run
+        self.stats = {'api_calls': 0, 'objects': 0, 'matched': 0, 'corrected': 0}
+
+    def run(self, since=None, until=None):
+        if self.dry_run:
+            # Simulation : aucune écriture, pas même la création du curseur
+            cursor = (ReconciliationCursor.objects.filter(name=self.name).first()
+                      or ReconciliationCursor(name=self.name))
+        else:
+            cursor, _ = ReconciliationCursor.objects.get_or_create(name=self.name)
+
+        if cursor.window_end is None or since is not None:
+            # Nouvelle fenêtre (la précédente est terminée ou une date est imposée)
+            cursor.synced_until = since or cursor.synced_until or timezone.now() - timedelta(days=1)
+            cursor.window_end = until or timezone.now()
+            cursor.resource = RESOURCES[0]
+            cursor.starting_after = ''
+            self._save_cursor(cursor)
+
+        for resource in RESOURCES[RESOURCES.index(cursor.resource or RESOURCES[0]):]:
+            if cursor.resource != resource:
+                cursor.resource = resource
+                cursor.starting_after = ''
+                self._save_cursor(cursor)
+            self._reconcile_resource(cursor, resource)
+
+        cursor.synced_until = cursor.window_end
+        cursor.window_end = None
+        cursor.resource = ''
+        cursor.starting_after = ''
+        self._save_cursor(cursor)
+        return self.stats
+
+    def _reconcile_resource(self, cursor, resource):
+        list_method = {
+            'payment_intents': self.gateway.list_payment_intents,
+            'refunds': self.gateway.list_refunds,
+        }[resource]
+        apply_page = {
+            'payment_intents': self._apply_payment_intents,
+            'refunds': self._apply_refunds,
+        }[resource]
+
+        while True:
+            params = {
+                'limit': self.page_size,
+                'created': {
+                    'gte': int(cursor.synced_until.timestamp()),
+                    'lt': int(cursor.window_end.timestamp()),
+                },
+            }
+            if cursor.starting_after:
+                params['starting_after'] = cursor.starting_after
+            page = list_method(**params)
+            self.stats['api_calls'] += 1
+            if not page.data:
+                break
+
+            self.stats['objects'] += len(page.data)
+            with transaction.atomic():
+                apply_page(page.data)
+                cursor.starting_after = page.data[-1].id
+                self._save_cursor(cursor)
+
+            if not page.has_more:
+                break
+
+    def _apply_payment_intents(self, intents):
+        targets = {
+            intent.id: INTENT_STATUS_MAP[intent.status]
+            for intent in intents
+            if intent.status in INTENT_STATUS_MAP
+        }
+        self._correct(targets)
+
+    def _apply_refunds(self, refunds):
+        refunded = {}
+        for refund in refunds:
+            if refund.status == 'succeeded' and refund.payment_intent:
+                refunded[refund.payment_intent] = refunded.get(refund.payment_intent, 0) + refund.amount
+
+        def fully_refunded(order):
+            # Un remboursement partiel ne change pas le statut de la commande. Les
+            # remboursements d'un même paiement peuvent être répartis sur plusieurs
+            # pages ou fenêtres : sous le total, tous ceux du paiement sont relus.
+            intent_id = order.stripe_payment_intent_id
+            total = to_cents(order.total)
+            return refunded[intent_id] >= total or self._refunded_amount(intent_id) >= total
+
+        self._correct({intent_id: 'refunded' for intent_id in refunded}, amount_check=fully_refunded)
+
+    def _refunded_amount(self, payment_intent_id):
+        """Montant remboursé (centimes) sur ce paiement, tous remboursements confondus"""
+        amount = 0
+        params = {'payment_intent': payment_intent_id, 'limit': self.page_size}
+        while True:
+            page = self.gateway.list_refunds(**params)
+            self.stats['api_calls'] += 1
+            amount += sum(refund.amount for refund in page.data if refund.status == 'succeeded')
+            if not page.has_more or not page.data:
+                return amount
+            params['starting_after'] = page.data[-1].id
+
+    def _correct(self, targets, amount_check=None):
+        if not targets:
+            return
+        orders = list(
+            Order.objects.select_for_update()
+            .filter(stripe_payment_intent_id__in=list(targets))
+            .only('pk', 'stripe_payment_intent_id', 'payment_status', 'order_status', 'total')
+        )
+        self.stats['matched'] += len(orders)
+
+        now = timezone.now()
+        corrected = []
+        history = []
+        for order in orders:
+            target = targets[order.stripe_payment_intent_id]
+            if PAYMENT_STATUS_RANK[target] <= PAYMENT_STATUS_RANK.get(order.payment_status, 0):
+                continue
+            if amount_check is not None and not amount_check(order):
+                continue
+            logger.info(f"Rapprochement: commande {order.pk} {order.payment_status} -> {target}")
+            from_status = order.order_status
+            order.payment_status = target
+            if target == 'paid' and order.order_status == 'pending':
+                order.order_status = 'confirmed'
+            elif target == 'refunded':
+                order.order_status = 'refunded'
+            order.updated_at = now
+            corrected.append(order)
+            if order.order_status != from_status:
+                history.append(OrderStatusHistory(
+                    order_id=order.pk, from_status=from_status, to_status=order.order_status, note=HISTORY_NOTE,
+                ))
+
+        self.stats['corrected'] += len(corrected)
+        if corrected and not self.dry_run:
+            Order.objects.bulk_update(corrected, ['payment_status', 'order_status', 'updated_at'], batch_size=500)
+            OrderStatusHistory.objects.bulk_create(history, batch_size=TRACKING_CHUNK_SIZE)
+            for status, template in PAYMENT_STATUS_EMAILS.items():
+                order_ids = [order.pk for order in corrected if order.payment_status == status]
+                if order_ids:
+                    enqueue_order_emails(template, order_ids)
+            sync_order_stats([order.pk for order in corrected])
+            sync_order_slots([order.pk for order in corrected])
+            sync_order_reservations([order.pk for order in corrected])
+            publish_order_updates([order.pk for order in corrected])
+
+    def _save_cursor(self, cursor):
+        if not self.dry_run:
+            cursor.save()
@@ -0,0 +1,186 @@
+"""
+Regroupement des commandes payées du jour en tournées de livraison
+
+Heuristique de balayage (sweep) : les arrêts d'un même créneau sont triés
+par angle autour du dépôt puis découpés en tournées sous contrainte de
+capacité ; l'ordre de passage dans chaque tournée est obtenu par plus
+proche voisin. Les calculs de distance sont vectorisés avec NumPy.
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Sum
+
+from .geo import EARTH_RADIUS_KM
+from .models import Order, PostalCodeCentroid
+from .shipping import normalize_postal_code
+
+
+ROUTABLE_STATUSES = ['confirmed', 'processing']
+DEFAULT_MAX_STOPS = 25
+
+
+@dataclass
+class DeliveryRun:
+    """Tournée d'un livreur : arrêts dans l'ordre de passage"""
+    number: int
+    window: str
+    stops: list = field(default_factory=list)
+    distance_km: float = 0.0
+
+    @property
+    def weight_grams(self):
+        return sum(stop['weight_grams'] for stop in self.stops)
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2):
+    """Distances orthodromiques (km) entre deux ensembles de points, en une opération"""
+    lat1, lon1 = np.radians(lat1)[:, None], np.radians(lon1)[:, None]
+    lat2, lon2 = np.radians(lat2)[None, :], np.radians(lon2)[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def get_depot():
+    latitude = getattr(settings, 'DELIVERY_DEPOT_LATITUDE', '')
+    longitude = getattr(settings, 'DELIVERY_DEPOT_LONGITUDE', '')
+    if latitude in ('', None) or longitude in ('', None):
+        return None
+    return float(latitude), float(longitude)
+
+
+def load_day_stops(day):
+    """
+    Commandes payées à livrer ce jour, avec adresse, créneau et poids
+
+    Deux requêtes : les commandes (poids agrégé) et les centres des codes
+    postaux concernés.
+
+    Returns:
+        tuple: (arrêts géocodés, arrêts dont le code postal est inconnu)
+    """
+    rows = list(
+        Order.objects.filter(
+            estimated_delivery=day,
+            payment_status='paid',
+            order_status__in=ROUTABLE_STATUSES,
+            pickup_point__isnull=True,
+        )
+        .values(
+            'pk', 'order_number',
+            first_name=F('shipping_address__first_name'),
+            last_name=F('shipping_address__last_name'),
+            address=F('shipping_address__address_line_1'),
+            city=F('shipping_address__city'),
+            postal_code=F('shipping_address__postal_code'),
+            phone=F('shipping_address__phone'),
+            window_start=F('delivery_slot_hold__slot__start_time'),
+            window_end=F('delivery_slot_hold__slot__end_time'),
+        )
+        .annotate(weight_grams=Sum(F('items__quantity') * F('items__product__weight_grams')))
+        .order_by('pk')
+    )
+
+    postal_codes = {normalize_postal_code(row['postal_code']) for row in rows}
+    centroids = {
+        postal_code: (latitude, longitude)
+        for postal_code, latitude, longitude in PostalCodeCentroid.objects.filter(
+            postal_code__in=postal_codes,
+        ).values_list('postal_code', 'latitude', 'longitude')
+    }
+
+    stops, unrouted = [], []
+    for row in rows:
+        row['weight_grams'] = row['weight_grams'] or 0
+        row['window'] = (
+            f"{row['window_start']:%H:%M}-{row['window_end']:%H:%M}" if row['window_start'] else 'journée'
+        )
+        coordinates = centroids.get(normalize_postal_code(row['postal_code']))
+        if coordinates is None:
+            unrouted.append(row)
+            continue
+        row['latitude'], row['longitude'] = coordinates
+        stops.append(row)
+    return stops, unrouted
+
+
+def plan_runs(stops, depot=None, max_stops=DEFAULT_MAX_STOPS, max_weight_grams=None):
+    """
+    Découper les arrêts en tournées, créneau par créneau
+
+    Args:
+        stops: Dicts avec au moins latitude, longitude, window, weight_grams
+        depot: (latitude, longitude) ; par défaut, barycentre des arrêts
+
+    Returns:
+        list[DeliveryRun]
+    """
+    if not stops:
+        return []
+    latitudes = np.array([stop['latitude'] for stop in stops], dtype=float)
+    longitudes = np.array([stop['longitude'] for stop in stops], dtype=float)
+    weights = np.array([stop['weight_grams'] for stop in stops], dtype=float)
+    windows = np.array([stop['window'] for stop in stops])
+    if depot is None:
+        depot = (float(latitudes.mean()), float(longitudes.mean()))
+
+    # Angle de chaque arrêt autour du dépôt (longitude corrigée de la latitude)
+    angles = np.arctan2(
+        latitudes - depot[0],
+        (longitudes - depot[1]) * np.cos(np.radians(depot[0])),
+    )
+
+    runs = []
+    for window in sorted(set(windows.tolist())):
+        indices = np.flatnonzero(windows == window)
+        indices = indices[np.argsort(angles[indices], kind='stable')]
+        for group in _split_by_capacity(indices, weights, max_stops, max_weight_grams):
+            ordered = _nearest_neighbour_order(group, latitudes, longitudes, depot)
+            run = DeliveryRun(number=len(runs) + 1, window=window, stops=[stops[i] for i in ordered])
+            run.distance_km = _route_length(ordered, latitudes, longitudes, depot)
+            runs.append(run)
+    return runs
+
+
+def _split_by_capacity(indices, weights, max_stops, max_weight_grams):
+    if max_weight_grams is None:
+        return np.array_split(indices, np.arange(max_stops, len(indices), max_stops))
+    groups, current, load = [], [], 0.0
+    for index in indices:
+        if current and (len(current) >= max_stops or load + weights[index] > max_weight_grams):
+            groups.append(np.array(current))
+            current, load = [], 0.0
+        current.append(index)
+        load += weights[index]
+    if current:
+        groups.append(np.array(current))
+    return groups
+
+
+def _nearest_neighbour_order(group, latitudes, longitudes, depot):
+    """Ordre de passage par plus proche voisin, en partant du dépôt"""
+    distances = haversine_matrix(latitudes[group], longitudes[group], latitudes[group], longitudes[group])
+    from_depot = haversine_matrix(
+        np.array([depot[0]]), np.array([depot[1]]), latitudes[group], longitudes[group],
+    )[0]
+    visited = np.zeros(len(group), dtype=bool)
+    current = int(np.argmin(from_depot))
+    order = [current]
+    visited[current] = True
+    for _ in range(len(group) - 1):
+        candidates = np.where(visited, np.inf, distances[current])
+        current = int(np.argmin(candidates))
+        order.append(current)
+        visited[current] = True
+    return group[order]
+
+
+def _route_length(ordered, latitudes, longitudes, depot):
+    """Distance dépôt → arrêts → dépôt"""
+    path_lat = np.concatenate(([depot[0]], latitudes[ordered], [depot[0]]))
+    path_lon = np.concatenate(([depot[1]], longitudes[ordered], [depot[1]]))
+    phi1, phi2 = np.radians(path_lat[:-1]), np.radians(path_lat[1:])
+    dlambda = np.radians(path_lon[1:] - path_lon[:-1])
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return float((2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))).sum())
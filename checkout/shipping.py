@@ -0,0 +1,143 @@
+import math
+import threading
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.core.cache import cache
+
+from .models import ShippingRule
+
+
+VERSION_CACHE_KEY = 'shipping:rules_version'
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def normalize_postal_code(postal_code):
+    return ''.join((postal_code or '').split()).upper()
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """Règle figée en mémoire (aucun accès à la base lors du calcul)"""
+    rule_id: int
+    min_weight_grams: int
+    max_weight_grams: int
+    base_cost: Decimal
+    cost_per_kg: Decimal
+    free_shipping_threshold: Decimal
+
+    def matches(self, weight_grams):
+        if weight_grams < self.min_weight_grams:
+            return False
+        return self.max_weight_grams is None or weight_grams <= self.max_weight_grams
+
+    def cost(self, subtotal, weight_grams):
+        if self.free_shipping_threshold is not None and subtotal >= self.free_shipping_threshold:
+            return Decimal('0.00')
+        return self.base_cost + self.cost_per_kg * math.ceil(weight_grams / 1000)
+
+
+class ShippingTable:
+    """
+    Règles de livraison compilées, indexées par (préfixe de code postal, méthode)
+
+    Une cotation essaie les préfixes du plus long au plus court (le préfixe
+    vide couvre toutes les zones) : quelques lookups de dictionnaire, sans
+    requête. La table est immuable ; une modification des règles produit
+    une nouvelle version.
+    """
+
+    def __init__(self, rules, version=None):
+        self.version = version
+        self._index = {}
+        for rule in sorted(rules, key=lambda r: (r.priority, r.pk or 0)):
+            key = (normalize_postal_code(rule.postal_code_prefix), rule.method)
+            self._index.setdefault(key, []).append(CompiledRule(
+                rule_id=rule.pk,
+                min_weight_grams=rule.min_weight_grams,
+                max_weight_grams=rule.max_weight_grams,
+                base_cost=rule.base_cost,
+                cost_per_kg=rule.cost_per_kg,
+                free_shipping_threshold=rule.free_shipping_threshold,
+            ))
+        self._prefix_lengths = sorted({len(prefix) for prefix, _ in self._index}, reverse=True)
+        self.methods = sorted({method for _, method in self._index})
+
+    def find_rule(self, postal_code='', method='standard', weight_grams=0):
+        postal_code = normalize_postal_code(postal_code)
+        for length in self._prefix_lengths:
+            if length > len(postal_code):
+                continue
+            for rule in self._index.get((postal_code[:length], method), ()):
+                if rule.matches(weight_grams):
+                    return rule
+        return None
+
+    def quote(self, subtotal, weight_grams=0, postal_code='', method='standard'):
+        """
+        Frais de port d'un colis
+
+        Returns:
+            Decimal | None: None si la méthode n'est pas proposée pour cette
+            zone et ce poids
+        """
+        rule = self.find_rule(postal_code, method, weight_grams)
+        if rule is None:
+            return None
+        return rule.cost(subtotal, weight_grams)
+
+    def quote_methods(self, subtotal, weight_grams=0, postal_code=''):
+        """Tarif de chaque méthode disponible pour ce colis"""
+        quotes = {}
+        for method in self.methods:
+            cost = self.quote(subtotal, weight_grams, postal_code, method)
+            if cost is not None:
+                quotes[method] = cost
+        return quotes
+
+    def quote_many(self, parcels):
+        """
+        Coter un lot de colis (checkout, analytics)
+
+        Args:
+            parcels: Itérable de tuples (subtotal, weight_grams, postal_code, method)
+        """
+        return [self.quote(*parcel) for parcel in parcels]
+
+
+def compile_shipping_rules(version=None):
+    return ShippingTable(ShippingRule.objects.filter(is_active=True), version=version)
+
+
+def get_shipping_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def get_shipping_table():
+    """
+    Table compilée du processus, recompilée quand la version publiée change
+
+    Une lecture de cache par appel pour vérifier la version ; la base n'est
+    interrogée qu'après une modification des règles.
+    """
+    global _table
+    version = get_shipping_version()
+    table = _table
+    if table is None or table.version != version:
+        with _table_lock:
+            table = _table
+            if table is None or table.version != version:
+                table = compile_shipping_rules(version)
+                _table = table
+    return table
+
+
+def invalidate_shipping_table():
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
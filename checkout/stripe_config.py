@@ -6,8 +6,9 @@ from django.views.decorators.http import require_POST
 import json
 import logging
 
-# Configuration Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from .emails import enqueue_order_emails
+from .gateway import get_gateway
+from .webhooks import record_event
 
 logger = logging.getLogger(__name__)
 
@@ -15,12 +16,13 @@ logger = logging.getLogger(__name__)
 class StripePaymentHandler:
     """Gestionnaire de paiements Stripe pour La Caravela"""
     
-    def __init__(self):
+    def __init__(self, gateway=None):
         self.publishable_key = settings.STRIPE_PUBLISHABLE_KEY
         self.secret_key = settings.STRIPE_SECRET_KEY
         self.webhook_secret = settings.STRIPE_WEBHOOK_SECRET
+        self.gateway = gateway or get_gateway()
     
-    def create_payment_intent(self, amount, currency='eur', metadata=None):
+    def create_payment_intent(self, amount, currency='eur', metadata=None, idempotency_key=None):
         """
         Créer un Payment Intent Stripe
         
@@ -28,12 +30,14 @@ class StripePaymentHandler:
             amount (int): Montant en centimes
             currency (str): Devise (eur par défaut)
             metadata (dict): Métadonnées pour la commande
+            idempotency_key (str): Clé d'idempotence (générée si absente)
         
         Returns:
             dict: Payment Intent créé
         """
         try:
-            intent = stripe.PaymentIntent.create(
+            intent = self.gateway.create_payment_intent(
+                idempotency_key=idempotency_key,
                 amount=amount,
                 currency=currency,
                 metadata=metadata or {},
@@ -73,7 +77,7 @@ class StripePaymentHandler:
             dict: Statut de la confirmation
         """
         try:
-            intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+            intent = self.gateway.retrieve_payment_intent(payment_intent_id)
             
             if intent.status == 'succeeded':
                 return {
@@ -96,7 +100,7 @@ class StripePaymentHandler:
                 'error': str(e),
             }
     
-    def create_refund(self, payment_intent_id, amount=None, reason='requested_by_customer'):
+    def create_refund(self, payment_intent_id, amount=None, reason='requested_by_customer', idempotency_key=None):
         """
         Créer un remboursement
         
@@ -104,6 +108,7 @@ class StripePaymentHandler:
             payment_intent_id (str): ID du Payment Intent
             amount (int): Montant à rembourser en centimes (None pour remboursement total)
             reason (str): Raison du remboursement
+            idempotency_key (str): Clé d'idempotence (générée si absente)
         
         Returns:
             dict: Statut du remboursement
@@ -117,7 +122,7 @@ class StripePaymentHandler:
             if amount:
                 refund_params['amount'] = amount
             
-            refund = stripe.Refund.create(**refund_params)
+            refund = self.gateway.create_refund(idempotency_key=idempotency_key, **refund_params)
             
             logger.info(f"Remboursement créé: {refund.id}")
             return {
@@ -143,7 +148,7 @@ class StripePaymentHandler:
         """
         try:
             # Récupérer les méthodes de paiement configurées
-            payment_methods = stripe.PaymentMethod.list(
+            payment_methods = self.gateway.list_payment_methods(
                 customer=None,  # Pour les méthodes globales
                 type='card',
                 limit=10
@@ -179,13 +184,16 @@ class StripePaymentHandler:
 @require_POST
 def stripe_webhook(request):
     """
-    Webhook Stripe pour traiter les événements de paiement
+    Webhook Stripe : vérifier la signature et enregistrer l'événement
+
+    Le traitement (statuts de commande, emails) est fait en arrière-plan par
+    la commande process_stripe_events, pour répondre à Stripe sans délai.
     """
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
     
     try:
-        event = stripe.Webhook.construct_event(
+        stripe.Webhook.construct_event(
             payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
         )
     except ValueError as e:
@@ -195,136 +203,19 @@ def stripe_webhook(request):
         logger.error(f"Erreur de signature: {str(e)}")
         return JsonResponse({'error': 'Signature invalide'}, status=400)
     
-    # Traiter les événements
-    if event['type'] == 'payment_intent.succeeded':
-        handle_payment_succeeded(event)
-    elif event['type'] == 'payment_intent.payment_failed':
-        handle_payment_failed(event)
-    elif event['type'] == 'charge.refunded':
-        handle_refund_processed(event)
+    record_event(json.loads(payload))
     
     return JsonResponse({'status': 'success'})
 
 
-def handle_payment_succeeded(event):
-    """Traiter un paiement réussi"""
-    payment_intent = event['data']['object']
-    order_id = payment_intent.metadata.get('order_id')
-    
-    if order_id:
-        try:
-            from .models import Order
-            order = Order.objects.get(order_number=order_id)
-            order.payment_status = 'paid'
-            order.order_status = 'confirmed'
-            order.save()
-            
-            logger.info(f"Commande {order_id} marquée comme payée")
-            
-            # Envoyer un email de confirmation
-            send_order_confirmation_email(order)
-            
-        except Order.DoesNotExist:
-            logger.error(f"Commande {order_id} non trouvée")
-        except Exception as e:
-            logger.error(f"Erreur lors du traitement de la commande {order_id}: {str(e)}")
-
-
-def handle_payment_failed(event):
-    """Traiter un échec de paiement"""
-    payment_intent = event['data']['object']
-    order_id = payment_intent.metadata.get('order_id')
-    
-    if order_id:
-        try:
-            from .models import Order
-            order = Order.objects.get(order_number=order_id)
-            order.payment_status = 'failed'
-            order.save()
-            
-            logger.info(f"Commande {order_id} marquée comme échouée")
-            
-            # Envoyer un email d'échec
-            send_payment_failed_email(order)
-            
-        except Order.DoesNotExist:
-            logger.error(f"Commande {order_id} non trouvée")
-        except Exception as e:
-            logger.error(f"Erreur lors du traitement de l'échec {order_id}: {str(e)}")
-
-
-def handle_refund_processed(event):
-    """Traiter un remboursement"""
-    charge = event['data']['object']
-    order_id = charge.metadata.get('order_id')
-    
-    if order_id:
-        try:
-            from .models import Order
-            order = Order.objects.get(order_number=order_id)
-            order.payment_status = 'refunded'
-            order.order_status = 'refunded'
-            order.save()
-            
-            logger.info(f"Commande {order_id} marquée comme remboursée")
-            
-        except Order.DoesNotExist:
-            logger.error(f"Commande {order_id} non trouvée")
-        except Exception as e:
-            logger.error(f"Erreur lors du traitement du remboursement {order_id}: {str(e)}")
-
-
 def send_order_confirmation_email(order):
-    """Envoyer un email de confirmation de commande"""
-    try:
-        from django.core.mail import send_mail
-        from django.template.loader import render_to_string
-        
-        subject = f"Confirmation de commande - La Caravela #{order.order_number}"
-        
-        # Rendre le template d'email
-        html_message = render_to_string('checkout/emails/order_confirmation.html', {
-            'order': order,
-        })
-        
-        send_mail(
-            subject=subject,
-            message='',
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[order.user.email],
-            html_message=html_message,
-        )
-        
-        logger.info(f"Email de confirmation envoyé pour la commande {order.order_number}")
-        
-    except Exception as e:
-        logger.error(f"Erreur lors de l'envoi de l'email de confirmation: {str(e)}")
+    """Mettre en file l'email de confirmation de commande (envoyé par send_outbox_emails)"""
+    enqueue_order_emails('order_confirmation', [order.pk])
 
 
 def send_payment_failed_email(order):
-    """Envoyer un email d'échec de paiement"""
-    try:
-        from django.core.mail import send_mail
-        from django.template.loader import render_to_string
-        
-        subject = f"Échec de paiement - La Caravela #{order.order_number}"
-        
-        html_message = render_to_string('checkout/emails/payment_failed.html', {
-            'order': order,
-        })
-        
-        send_mail(
-            subject=subject,
-            message='',
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[order.user.email],
-            html_message=html_message,
-        )
-        
-        logger.info(f"Email d'échec envoyé pour la commande {order.order_number}")
-        
-    except Exception as e:
-        logger.error(f"Erreur lors de l'envoi de l'email d'échec: {str(e)}")
+    """Mettre en file l'email d'échec de paiement (envoyé par send_outbox_emails)"""
+    enqueue_order_emails('payment_failed', [order.pk])
 
 
 # Configuration pour les tests Stripe
@@ -1,3 +1,499 @@
+from datetime import time as dt_time, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from products.models import Category, Product
+from users.models import UserProfile
+from . import webhooks
+from .coupons import get_coupon
+from .delivery_slots import SlotUnavailableError, hold_slot, slot_occupancy, sync_order_slots
+from .emails import EmailConnectionError, enqueue_order_emails, send_pending_emails
+from .models import (
+    Cart, CartItem, Coupon, DeliverySlot, DeliverySlotHold, Order, OrderStatusHistory, OutboundEmail, PickupPoint,
+    ReconciliationCursor, ShippingRule, StripeEvent,
+)
+from .order_history import InvalidCursorError, order_history_page
+from .order_stats import sync_order_stats
+from .order_status import OrderTransitionError, bulk_transition, transition_order
+from .orders import (
+    IdempotencyKeyConflictError, InsufficientStockError, InvalidCouponError, place_order, sync_order_reservations,
+)
+from .pickup_points import MAX_LIMIT
+from .reconciliation import PaymentReconciler
+from .shipping import get_shipping_table
+
+
+ADDRESS = {
+    'first_name': 'Amina', 'last_name': 'Test', 'address_line_1': '1 rue des Glaces',
+    'city': 'Casablanca', 'postal_code': '20000', 'country': 'Maroc',
+}
+
+
+class CheckoutTestMixin:
+    """Utilisateur, produit en stock et commande passée par place_order"""
+
+    def make_product(self, stock=10, price='10.00'):
+        category, _ = Category.objects.get_or_create(name="Glaces", slug='glaces')
+        return Product.objects.create(
+            name=f"Glace {Product.objects.count()}", description="Glace", category=category,
+            base_price=Decimal(price), stock_quantity=stock,
+        )
+
+    def make_user(self, username='client'):
+        return User.objects.create_user(username, f'{username}@example.com', 'password')
+
+    def place(self, user, product, quantity=1, **kwargs):
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        return place_order(cart, dict(ADDRESS), **kwargs)
+
+
+class PlaceOrderTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        self.user = self.make_user()
+        self.product = self.make_product(stock=10)
+
+    def test_short_stock_rolls_back_the_whole_order(self):
+        other = self.make_product(stock=1)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        CartItem.objects.create(cart=cart, product=other, quantity=2)
+        with self.assertRaises(InsufficientStockError) as raised:
+            place_order(cart, dict(ADDRESS))
+        self.assertEqual(raised.exception.product_ids, [other.pk])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 10)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(cart.items.count(), 2)
+
+    def test_same_idempotency_key_returns_the_same_order(self):
+        first = self.place(self.user, self.product, quantity=2, idempotency_key='checkout-1')
+        second = self.place(self.user, self.product, quantity=2, idempotency_key='checkout-1')
+        self.assertEqual(first.pk, second.pk)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 8)
+
+    def test_idempotency_key_of_another_user_is_refused(self):
+        self.place(self.user, self.product, idempotency_key='checkout-1')
+        with self.assertRaises(IdempotencyKeyConflictError):
+            self.place(self.make_user('autre'), self.product, idempotency_key='checkout-1')
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 9)
+
+
+class WebhookProcessingTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        self.user = self.make_user()
+        self.product = self.make_product()
+
+    def record(self, event_id, event_type, order, seconds=0):
+        webhooks.record_event({
+            'id': event_id,
+            'type': event_type,
+            'created': int((timezone.now() + timedelta(seconds=seconds)).timestamp()),
+            'data': {'object': {
+                'object': 'payment_intent', 'id': f'pi_{order.order_number}',
+                'metadata': {'order_id': order.order_number},
+            }},
+        })
+
+    def test_events_out_of_order_end_in_the_same_state(self):
+        order = self.place(self.user, self.product)
+        self.record('evt_paid', 'payment_intent.succeeded', order, seconds=1)
+        self.record('evt_failed', 'payment_intent.payment_failed', order, seconds=2)
+        webhooks.process_pending_events()
+        order.refresh_from_db()
+        self.assertEqual((order.payment_status, order.order_status), ('paid', 'confirmed'))
+
+    def test_late_events_never_move_an_order_backwards(self):
+        order = self.place(self.user, self.product)
+        self.record('evt_paid', 'payment_intent.succeeded', order, seconds=1)
+        self.record('evt_refund', 'charge.refunded', order, seconds=2)
+        webhooks.process_pending_events()
+
+        # Événements plus anciens livrés après coup (nouvelle tentative de Stripe)
+        self.record('evt_failed', 'payment_intent.payment_failed', order)
+        self.record('evt_paid_again', 'payment_intent.succeeded', order, seconds=3)
+        webhooks.process_pending_events()
+
+        order.refresh_from_db()
+        self.assertEqual((order.payment_status, order.order_status), ('refunded', 'refunded'))
+        self.assertEqual(
+            list(OutboundEmail.objects.filter(order=order).values_list('template_name', flat=True)),
+            ['checkout/emails/order_confirmation.html'],
+        )
+
+    def test_duplicate_event_is_recorded_once(self):
+        order = self.place(self.user, self.product)
+        self.record('evt_dup', 'payment_intent.succeeded', order)
+        self.record('evt_dup', 'payment_intent.succeeded', order)
+        self.assertEqual(StripeEvent.objects.filter(event_id='evt_dup').count(), 1)
+
+    def test_failing_event_does_not_block_the_rest_of_the_batch(self):
+        good = self.place(self.user, self.product)
+        bad = self.place(self.user, self.product)
+        self.record('evt_good', 'payment_intent.succeeded', good)
+        self.record('evt_bad', 'payment_intent.succeeded', bad, seconds=1)
+        apply_events = webhooks.apply_events
+
+        def failing_apply(events):
+            if any(event.event_id == 'evt_bad' for event in events):
+                raise ValueError("payload invalide")
+            return apply_events(events)
+
+        with mock.patch.object(webhooks, 'apply_events', side_effect=failing_apply), \
+                self.assertLogs('checkout.webhooks', level='ERROR'):
+            for _ in range(5):
+                webhooks.process_pending_events(max_attempts=5)
+
+        good.refresh_from_db()
+        self.assertEqual(good.payment_status, 'paid')
+        statuses = dict(StripeEvent.objects.values_list('event_id', 'status'))
+        self.assertEqual(statuses, {'evt_good': 'processed', 'evt_bad': 'failed'})
+        self.assertEqual(StripeEvent.objects.get(event_id='evt_good').attempts, 1)
+
+
+class CouponRedemptionTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = self.make_product(stock=10)
+
+    def make_coupon(self, **limits):
+        return Coupon.objects.create(
+            code='ETE10', description="Été", coupon_type='fixed', value=Decimal('1.00'),
+            valid_from=timezone.now() - timedelta(days=1), valid_until=timezone.now() + timedelta(days=1), **limits,
+        )
+
+    def test_exhausted_coupon_is_refused_even_when_the_cache_is_stale(self):
+        coupon = self.make_coupon(max_uses=1)
+        get_coupon('ETE10')
+        self.place(self.make_user('premier'), self.product, coupon_code='ETE10')
+        # La validation lit le coupon en cache (used_count=0) : l'UPDATE conditionnel refuse
+        with self.assertRaisesMessage(InvalidCouponError, "épuisé"):
+            self.place(self.make_user('second'), self.product, coupon_code='ETE10')
+        coupon.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((coupon.used_count, coupon.redemptions.count()), (1, 1))
+        self.assertEqual(self.product.stock_quantity, 9)
+
+    def test_per_user_limit(self):
+        self.make_coupon(max_uses_per_user=1)
+        user = self.make_user()
+        self.place(user, self.product, coupon_code='ETE10')
+        with self.assertRaises(InvalidCouponError):
+            self.place(user, self.product, coupon_code='ETE10')
+        self.place(self.make_user('autre'), self.product, coupon_code='ETE10')
+
+
+class ReservationReleaseTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = self.make_user()
+        self.product = self.make_product(stock=10)
+        self.coupon = Coupon.objects.create(
+            code='ETE10', description="Été", coupon_type='fixed', value=Decimal('1.00'), max_uses=1,
+            max_uses_per_user=1, valid_from=timezone.now() - timedelta(days=1),
+            valid_until=timezone.now() + timedelta(days=1),
+        )
+
+    def set_status(self, order, **values):
+        Order.objects.filter(pk=order.pk).update(**values)
+        return sync_order_reservations([order.pk])
+
+    def test_failed_payment_gives_back_stock_and_coupon_once(self):
+        order = self.place(self.user, self.product, quantity=3, coupon_code='ETE10')
+        self.product.refresh_from_db()
+        self.coupon.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.coupon.used_count), (7, 1))
+
+        self.assertEqual(self.set_status(order, payment_status='failed'), (1, 0))
+        self.assertEqual(sync_order_reservations([order.pk]), (0, 0))
+        self.product.refresh_from_db()
+        self.coupon.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.coupon.used_count), (10, 0))
+
+        # Le coupon rendu peut être utilisé par une nouvelle commande
+        self.place(self.user, self.product, coupon_code='ETE10')
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.used_count, 1)
+
+    def test_payment_after_failure_takes_stock_again(self):
+        order = self.place(self.user, self.product, quantity=3)
+        self.set_status(order, payment_status='failed')
+        self.assertEqual(self.set_status(order, payment_status='paid'), (0, 1))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 7)
+        self.assertEqual(self.set_status(order, order_status='cancelled'), (1, 0))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 10)
+
+
+class OrderHistoryTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        self.user = self.make_user()
+        self.product = self.make_product(stock=100)
+        self.orders = [self.place(self.user, self.product) for _ in range(5)]
+        # Deux commandes à la même seconde : l'id départage
+        same_time = timezone.now() - timedelta(hours=1)
+        Order.objects.filter(pk__in=[self.orders[1].pk, self.orders[2].pk]).update(created_at=same_time)
+        self.place(self.make_user('autre'), self.product)
+
+    def test_cursor_walks_every_order_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(2):
+                orders, cursor = order_history_page(self.user, cursor=cursor, page_size=2)
+            seen.extend(order.pk for order in orders)
+            if cursor is None:
+                break
+        expected = list(Order.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_unreadable_cursor_is_refused(self):
+        with self.assertRaises(InvalidCursorError):
+            order_history_page(self.user, cursor='pas-un-curseur')
+
+    def test_customer_stats_follow_paid_orders_once(self):
+        paid = self.orders[:2]
+        Order.objects.filter(pk__in=[order.pk for order in paid]).update(payment_status='paid')
+        self.assertEqual(sync_order_stats([order.pk for order in self.orders]), 2)
+        self.assertEqual(sync_order_stats([order.pk for order in self.orders]), 0)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.total_orders, profile.total_spent), (2, paid[0].total + paid[1].total))
+
+        Order.objects.filter(pk=paid[0].pk).update(order_status='refunded', payment_status='refunded')
+        self.assertEqual(sync_order_stats([paid[0].pk]), 1)
+        profile.refresh_from_db()
+        self.assertEqual((profile.total_orders, profile.total_spent), (1, paid[1].total))
+
+
+class FakeGateway:
+    """Listes Stripe servies par pages, sans réseau"""
+
+    def __init__(self, intents=(), refunds=()):
+        self.objects = {'payment_intents': list(intents), 'refunds': list(refunds)}
+
+    def _list(self, resource, limit, starting_after=None, payment_intent=None, **params):
+        items = [item for item in self.objects[resource]
+                 if payment_intent is None or item.payment_intent == payment_intent]
+        if starting_after:
+            items = items[[item.id for item in items].index(starting_after) + 1:]
+        return SimpleNamespace(data=items[:limit], has_more=len(items) > limit)
+
+    def list_payment_intents(self, **params):
+        return self._list('payment_intents', **params)
+
+    def list_refunds(self, **params):
+        return self._list('refunds', **params)
+
+
+class ReconciliationTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        self.user = self.make_user()
+        self.product = self.make_product()
+        self.order = self.place(self.user, self.product)
+        Order.objects.filter(pk=self.order.pk).update(stripe_payment_intent_id='pi_missed')
+
+    def run_reconciler(self, gateway, **kwargs):
+        return PaymentReconciler(gateway=gateway, page_size=1, **kwargs).run(
+            since=timezone.now() - timedelta(days=1), until=timezone.now(),
+        )
+
+    def test_missed_payment_confirms_order_with_email_and_history(self):
+        gateway = FakeGateway(intents=[SimpleNamespace(id='pi_missed', status='succeeded')])
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = self.run_reconciler(gateway)
+        self.assertEqual(stats['corrected'], 1)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.payment_status, self.order.order_status), ('paid', 'confirmed'))
+        self.assertTrue(OutboundEmail.objects.filter(
+            order=self.order, template_name='checkout/emails/order_confirmation.html',
+        ).exists())
+        self.assertEqual(
+            list(OrderStatusHistory.objects.filter(order=self.order).values_list('from_status', 'to_status')),
+            [('pending', 'confirmed')],
+        )
+        cursor = ReconciliationCursor.objects.get()
+        self.assertIsNone(cursor.window_end)
+
+        # Rejouer la même fenêtre ne change plus rien
+        self.assertEqual(self.run_reconciler(gateway)['corrected'], 0)
+
+    def test_interrupted_run_resumes_from_the_cursor(self):
+        second = self.place(self.user, self.product)
+        Order.objects.filter(pk=second.pk).update(stripe_payment_intent_id='pi_second')
+        gateway = FakeGateway(intents=[SimpleNamespace(id='pi_missed', status='succeeded'),
+                                       SimpleNamespace(id='pi_second', status='succeeded')])
+        list_payment_intents = gateway.list_payment_intents
+        requests = []
+
+        def flaky_list(**params):
+            requests.append(params.get('starting_after'))
+            if len(requests) == 2:
+                raise ConnectionError("Stripe injoignable")
+            return list_payment_intents(**params)
+
+        with mock.patch.object(gateway, 'list_payment_intents', side_effect=flaky_list), \
+                self.assertRaises(ConnectionError):
+            self.run_reconciler(gateway)
+        cursor = ReconciliationCursor.objects.get()
+        self.assertEqual((cursor.resource, cursor.starting_after), ('payment_intents', 'pi_missed'))
+        self.assertIsNotNone(cursor.window_end)
+
+        # Reprise sans date imposée : la page déjà traitée n'est pas relue
+        with mock.patch.object(gateway, 'list_payment_intents', side_effect=flaky_list):
+            stats = PaymentReconciler(gateway=gateway, page_size=1).run()
+        self.assertEqual(requests, [None, 'pi_missed', 'pi_missed'])
+        self.assertEqual(stats['corrected'], 1)
+        self.assertEqual(set(Order.objects.values_list('payment_status', flat=True)), {'paid'})
+        cursor.refresh_from_db()
+        self.assertIsNone(cursor.window_end)
+
+    def test_full_refund_split_across_pages(self):
+        Order.objects.filter(pk=self.order.pk).update(payment_status='paid', order_status='confirmed')
+        half = int(self.order.total * 100) // 2
+        gateway = FakeGateway(refunds=[
+            SimpleNamespace(id='re_1', status='succeeded', payment_intent='pi_missed', amount=half),
+            SimpleNamespace(id='re_2', status='succeeded', payment_intent='pi_missed',
+                            amount=int(self.order.total * 100) - half),
+        ])
+        self.run_reconciler(gateway)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'refunded')
+
+    def test_dry_run_writes_nothing(self):
+        gateway = FakeGateway(intents=[SimpleNamespace(id='pi_missed', status='succeeded')])
+        self.run_reconciler(gateway, dry_run=True)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'pending')
+        self.assertFalse(ReconciliationCursor.objects.exists())
+        self.assertFalse(OutboundEmail.objects.filter(order=self.order).exists())
+
+
+class OutboxConnectionTest(CheckoutTestMixin, TestCase):
+    def test_smtp_down_keeps_emails_pending_without_using_attempts(self):
+        order = self.place(self.make_user(), self.make_product())
+        enqueue_order_emails('order_confirmation', [order.pk])
+        connection = mock.Mock()
+        connection.open.side_effect = OSError("Connection refused")
+
+        before = timezone.now()
+        with self.assertRaises(EmailConnectionError), self.assertLogs('checkout.emails', level='WARNING'):
+            send_pending_emails(connection=connection)
+
+        email = OutboundEmail.objects.get(order=order)
+        self.assertEqual((email.status, email.attempts), ('pending', 0))
+        self.assertGreater(email.next_attempt_at, before)
+        self.assertFalse(connection.send_messages.called)
+        # Reporté : rien n'est repris avant le délai
+        self.assertEqual(send_pending_emails(connection=connection), (0, 0))
+
+
+class CartShippingTest(CheckoutTestMixin, TestCase):
+    def test_cart_weight_is_a_single_query(self):
+        cart = Cart.objects.create(user=self.make_user())
+        for quantity in (1, 2, 3):
+            product = self.make_product()
+            Product.objects.filter(pk=product.pk).update(weight_grams=100)
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        with self.assertNumQueries(1):
+            self.assertEqual(cart.total_weight_grams, 600)
+
+    def test_every_shipping_method_has_a_default_rule(self):
+        cache.clear()
+        quotes = get_shipping_table().quote_methods(Decimal('100.00'), weight_grams=1000, postal_code='20000')
+        self.assertEqual(set(quotes), {method for method, _ in ShippingRule.METHODS})
+
+
+class OrderTransitionTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        self.user = self.make_user()
+        self.product = self.make_product(stock=10)
+
+    def test_paid_orders_cannot_be_cancelled_in_bulk(self):
+        paid = self.place(self.user, self.product)
+        unpaid = self.place(self.user, self.product)
+        Order.objects.filter(pk__in=[paid.pk, unpaid.pk]).update(order_status='confirmed')
+        Order.objects.filter(pk=paid.pk).update(payment_status='paid')
+
+        self.assertEqual(bulk_transition(Order.objects.all(), 'cancelled'), 1)
+        paid.refresh_from_db()
+        unpaid.refresh_from_db()
+        self.assertEqual((paid.order_status, paid.reservations_released), ('confirmed', False))
+        self.assertEqual(unpaid.order_status, 'cancelled')
+
+        with self.assertRaises(OrderTransitionError):
+            transition_order(paid, 'cancelled')
+        # Le remboursement reste possible
+        transition_order(paid, 'refunded')
+        self.assertEqual(paid.order_status, 'refunded')
+
+
+class PickupPointsViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        PickupPoint.objects.bulk_create([
+            PickupPoint(code=f'PR{index}', name=f"Relais {index}", address_line="Rue", city="Casablanca",
+                        postal_code='20000', latitude=33.5 + index / 100, longitude=-7.6)
+            for index in range(MAX_LIMIT + 5)
+        ])
+
+    def get(self, **params):
+        return self.client.get(reverse('checkout:pickup_points'), params)
+
+    def test_invalid_coordinates_are_rejected(self):
+        with self.assertLogs('django.request', level='WARNING'):
+            for lat, lng in [('nan', '-7.6'), ('inf', '-7.6'), ('91', '-7.6'), ('33.5', '-180.5'), ('33.5', '-inf')]:
+                self.assertEqual(self.get(lat=lat, lng=lng).status_code, 400, (lat, lng))
+
+    def test_limit_is_clamped(self):
+        response = self.get(lat='33.5', lng='-7.6', limit='100000')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['points']), MAX_LIMIT)
+
+
+class DeliverySlotTest(CheckoutTestMixin, TestCase):
+    def setUp(self):
+        self.slot = DeliverySlot.objects.create(
+            date=timezone.localdate() + timedelta(days=1), start_time=dt_time(10, 0), end_time=dt_time(12, 0),
+            capacity=2, shard_count=2,
+        )
+
+    def claimed(self):
+        return sum(self.slot.shards.values_list('claimed', flat=True))
+
+    def test_full_slot_is_never_oversold(self):
+        hold_slot(self.slot.pk, 'session-a')
+        hold_slot(self.slot.pk, 'session-b')
+        with self.assertRaises(SlotUnavailableError):
+            hold_slot(self.slot.pk, 'session-c')
+        # Une session qui change de créneau rend d'abord sa place
+        hold_slot(self.slot.pk, 'session-a')
+        self.assertEqual((self.claimed(), slot_occupancy(self.slot.pk)), (2, 2))
+
+    def test_expired_hold_frees_its_place(self):
+        hold_slot(self.slot.pk, 'session-a')
+        hold_slot(self.slot.pk, 'session-b')
+        DeliverySlotHold.objects.filter(session_key='session-a').update(expires_at=timezone.now())
+        hold_slot(self.slot.pk, 'session-c')
+        self.assertEqual(self.claimed(), 2)
+        self.assertEqual(DeliverySlotHold.objects.get(session_key='session-a').status, 'released')
+
+    def test_order_slot_release_is_idempotent(self):
+        order = self.place(self.make_user(), self.make_product(), slot_hold=hold_slot(self.slot.pk, 'session-a'))
+        Order.objects.filter(pk=order.pk).update(payment_status='failed')
+        self.assertEqual(sync_order_slots([order.pk]), (1, 0))
+        self.assertEqual(sync_order_slots([order.pk]), (0, 0))
+        self.assertEqual(self.claimed(), 0)
 
-# Create your tests here.
+        Order.objects.filter(pk=order.pk).update(payment_status='paid')
+        self.assertEqual(sync_order_slots([order.pk]), (0, 1))
+        self.assertEqual(self.claimed(), 1)
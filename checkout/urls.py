@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, stripe_config
 
 app_name = 'checkout'
 
@@ -9,7 +9,11 @@ urlpatterns = [
     path('remove-from-cart/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('update-cart/<int:item_id>/', views.update_cart_item, name='update_cart_item'),
     path('checkout/', views.checkout_view, name='checkout'),
+    path('pickup-points/', views.pickup_points, name='pickup_points'),
+    path('delivery-slots/', views.delivery_slots, name='delivery_slots'),
+    path('delivery-slots/hold/', views.hold_delivery_slot, name='hold_delivery_slot'),
     path('payment/', views.payment_view, name='payment'),
-    path('stripe-webhook/', views.stripe_webhook, name='stripe_webhook'),
+    path('payment/intent/', views.payment_intent_status, name='payment_intent_status'),
+    path('stripe-webhook/', stripe_config.stripe_webhook, name='stripe_webhook'),
     path('order-confirmation/<str:order_number>/', views.order_confirmation, name='order_confirmation'),
 ] 
\ No newline at end of file
@@ -3,7 +3,22 @@ from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
+from django.contrib import messages
+from django.conf import settings
 import json
+import math
+import uuid
+
+import stripe
+
+from .models import Cart, Order, PickupPoint
+from .orders import place_order, OrderPlacementError
+from .payment_intents import (
+    attach_order, get_order_payment_intent, schedule_payment_intent, sync_order_payment_intent, to_cents,
+)
+from .delivery_slots import SlotUnavailableError, get_availability_grid, get_session_hold, hold_slot
+from .pickup_points import DEFAULT_LIMIT, MAX_LIMIT, nearest_pickup_points
+from .pricing import CartPricer
 
 def cart_view(request):
     """Vue du panier"""
@@ -41,17 +56,152 @@ def update_cart_item(request, item_id):
 @login_required
 def checkout_view(request):
     """Vue du checkout"""
-    return render(request, 'checkout/checkout.html')
+    cart = Cart.objects.filter(user=request.user).order_by('-updated_at').first()
+    if cart is None:
+        messages.error(request, "Votre panier est vide.")
+        return redirect('checkout:cart')
+
+    if request.method == 'POST':
+        shipping_method = request.POST.get('shipping_method', 'standard')
+        pickup_point_id = None
+        if shipping_method == 'pickup':
+            try:
+                pickup_point_id = int(request.POST.get('pickup_point', ''))
+            except ValueError:
+                pickup_point_id = None
+            if pickup_point_id is None or not PickupPoint.objects.filter(pk=pickup_point_id, is_active=True).exists():
+                messages.error(request, "Veuillez choisir un point relais ouvert.")
+                return redirect('checkout:checkout')
+
+        # Adresse créée (ou réutilisée) par place_order, dans la transaction de la commande
+        address = {
+            'first_name': request.POST.get('first_name', ''),
+            'last_name': request.POST.get('last_name', ''),
+            'address_line_1': request.POST.get('address', ''),
+            'city': request.POST.get('city', ''),
+            'postal_code': request.POST.get('postal_code', ''),
+            'country': request.POST.get('country', 'MA'),
+            'phone': request.POST.get('phone', ''),
+        }
+        try:
+            order = place_order(
+                cart,
+                shipping_address=address,
+                idempotency_key=request.POST.get('idempotency_key') or None,
+                coupon_code=request.POST.get('coupon_code', '').strip(),
+                shipping_method=shipping_method,
+                pickup_point_id=pickup_point_id,
+                slot_hold=get_session_hold(request.session.session_key),
+            )
+        except OrderPlacementError as e:
+            messages.error(request, str(e))
+            return redirect('checkout:checkout')
+
+        attach_order(cart.pk, order)
+        request.session['pending_order_number'] = order.order_number
+        request.session['checkout_cart_id'] = cart.pk
+        return redirect('checkout:payment')
+
+    # Le panier est valorisé ici : le Payment Intent est préparé en arrière-plan
+    # pendant que le client remplit le formulaire de livraison.
+    pricing = CartPricer(cart).price()
+    if pricing.lines:
+        schedule_payment_intent(cart.pk, pricing.total)
+
+    return render(request, 'checkout/checkout.html', {
+        'idempotency_key': uuid.uuid4().hex,
+        'pricing': pricing,
+    })
+
+def _pending_order(request):
+    order_number = request.session.get('pending_order_number')
+    if not order_number:
+        return None
+    return Order.objects.filter(user=request.user, order_number=order_number).first()
+
 
 @login_required
 def payment_view(request):
-    """Vue du paiement"""
-    return render(request, 'checkout/payment.html')
+    """Vue du paiement (aucun appel à Stripe : l'intent est préparé au checkout)"""
+    order = _pending_order(request)
+    if order is None:
+        return redirect('checkout:checkout')
+
+    intent = get_order_payment_intent(order)
+    if intent and (intent['id'] != order.stripe_payment_intent_id or intent['amount'] != to_cents(order.total)):
+        intent = None
+
+    return render(request, 'checkout/payment.html', {
+        'order': order,
+        'stripe_publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
+        'client_secret': intent['client_secret'] if intent else '',
+    })
 
-@csrf_exempt
-def stripe_webhook(request):
-    """Webhook Stripe"""
-    return JsonResponse({'status': 'success'})
+
+@login_required
+def payment_intent_status(request):
+    """
+    Secret client du Payment Intent, pour la page de paiement quand
+    l'intent n'était pas encore prêt à l'affichage
+    """
+    order = _pending_order(request)
+    if order is None:
+        return JsonResponse({'ready': False, 'error': 'Aucune commande en cours'}, status=404)
+
+    # Solution de repli : la préparation ou la correction du montant en arrière-plan n'a pas abouti
+    try:
+        intent = sync_order_payment_intent(order, cart_id=request.session.get('checkout_cart_id'))
+    except stripe.error.StripeError:
+        return JsonResponse({'ready': False}, status=503)
+
+    return JsonResponse({'ready': True, 'client_secret': intent['client_secret']})
+
+def pickup_points(request):
+    """Points relais les plus proches (sélecteur du checkout)"""
+    try:
+        latitude = float(request.GET['lat']) if request.GET.get('lat') else None
+        longitude = float(request.GET['lng']) if request.GET.get('lng') else None
+        limit = min(max(int(request.GET.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'Paramètres invalides'}, status=400)
+    # float() accepte « nan » et « inf » : coordonnées hors du globe refusées
+    if latitude is not None and not (math.isfinite(latitude) and -90 <= latitude <= 90):
+        return JsonResponse({'error': 'Latitude invalide'}, status=400)
+    if longitude is not None and not (math.isfinite(longitude) and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'Longitude invalide'}, status=400)
+
+    points = nearest_pickup_points(
+        latitude=latitude,
+        longitude=longitude,
+        postal_code=request.GET.get('postal_code', ''),
+        limit=limit,
+    )
+    if points is None:
+        return JsonResponse({'error': 'Code postal inconnu', 'points': []}, status=404)
+    return JsonResponse({'points': points})
+
+def delivery_slots(request):
+    """Grille des créneaux disponibles pour les 7 prochains jours"""
+    return JsonResponse({'days': get_availability_grid(request.GET.get('method', 'standard'))})
+
+@login_required
+@require_POST
+def hold_delivery_slot(request):
+    """Retenir une place sur un créneau pendant le checkout"""
+    if not request.session.session_key:
+        request.session.save()
+    try:
+        hold = hold_slot(int(request.POST.get('slot_id', 0)), request.session.session_key)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Créneau invalide'}, status=400)
+    except SlotUnavailableError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=409)
+    return JsonResponse({
+        'success': True,
+        'slot_id': hold.slot_id,
+        'date': hold.slot.date.isoformat(),
+        'expires_at': hold.expires_at.isoformat(),
+    })
 
 def order_confirmation(request, order_number):
     """Confirmation de commande"""
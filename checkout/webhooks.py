@@ -0,0 +1,223 @@
+import logging
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import BooleanField, Case, F, Q, Value, When
+from django.utils import timezone
+
+from .delivery_slots import sync_order_slots
+from .emails import enqueue_order_emails
+from .models import Order, StripeEvent
+from .order_stats import sync_order_stats
+from .orders import sync_order_reservations
+from .order_status import publish_order_updates
+from .payment_intents import forget_cart_intent
+
+
+logger = logging.getLogger(__name__)
+
+# Emails mis en file dans la même transaction que le changement de statut
+TRANSITION_EMAILS = {
+    'payment_intent.succeeded': 'order_confirmation',
+    'payment_intent.payment_failed': 'payment_failed',
+}
+
+# Transitions appliquées par UPDATE conditionnel. Les gardes forment un ordre
+# monotone (pending < failed < paid < refunded) : rejouer les événements en
+# double ou dans le désordre aboutit toujours au même état final.
+TRANSITIONS = {
+    'payment_intent.payment_failed': {
+        'guard': Q(payment_status='pending'),
+        'values': {'payment_status': 'failed'},
+    },
+    'payment_intent.succeeded': {
+        'guard': Q(payment_status__in=['pending', 'failed']),
+        'values': {
+            'payment_status': 'paid',
+            'order_status': Case(
+                When(order_status='pending', then=Value('confirmed')),
+                default=F('order_status'),
+            ),
+        },
+    },
+    'charge.refunded': {
+        'guard': ~Q(payment_status='refunded'),
+        'values': {'payment_status': 'refunded', 'order_status': 'refunded'},
+    },
+}
+
+
+def record_event(event):
+    """
+    Enregistrer un événement Stripe vérifié dans la boîte de réception
+
+    Une seule requête ; les doublons (même event id) sont ignorés par
+    l'index unique.
+    """
+    obj = event['data']['object']
+    if obj.get('object') == 'payment_intent':
+        payment_intent_id = obj.get('id', '')
+    else:
+        payment_intent_id = obj.get('payment_intent') or ''
+
+    StripeEvent.objects.bulk_create([
+        StripeEvent(
+            event_id=event['id'],
+            event_type=event['type'],
+            payment_intent_id=payment_intent_id,
+            order_number=(obj.get('metadata') or {}).get('order_id', ''),
+            stripe_created=datetime.fromtimestamp(event['created'], tz=dt_timezone.utc),
+            payload=event,
+        )
+    ], ignore_conflicts=True)
+
+
+def process_pending_events(batch_size=100, max_attempts=5):
+    """
+    Traiter un lot d'événements en attente
+
+    Le lot est appliqué d'un bloc. En cas d'erreur, chaque événement est
+    rejoué dans son propre point de sauvegarde : seuls ceux qui échouent
+    voient leur compteur de tentatives augmenter (puis passent en échec),
+    les autres sont appliqués normalement.
+
+    Returns:
+        int: Nombre d'événements pris dans le lot
+    """
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending')
+            .order_by('stripe_created', 'id')[:batch_size]
+        )
+        if not events:
+            return 0
+        event_ids = [event.pk for event in events]
+
+        try:
+            with transaction.atomic():
+                matched_ids, changed = apply_events(events)
+            errors = {}
+        except Exception:
+            logger.exception("Erreur lors du traitement d'un lot d'événements Stripe, reprise événement par événement")
+            matched_ids, changed, errors = apply_events_individually(events)
+
+        for event_id, error in errors.items():
+            StripeEvent.objects.filter(pk=event_id).update(
+                attempts=F('attempts') + 1,
+                last_error=str(error),
+                status=Case(
+                    When(attempts__gte=max_attempts - 1, then=Value('failed')),
+                    default=Value('pending'),
+                ),
+            )
+
+        now = timezone.now()
+        StripeEvent.objects.filter(pk__in=matched_ids).update(
+            status='processed', processed_at=now, attempts=F('attempts') + 1,
+        )
+        StripeEvent.objects.filter(pk__in=event_ids).exclude(pk__in=matched_ids).exclude(pk__in=list(errors)).update(
+            status='ignored', processed_at=now, attempts=F('attempts') + 1,
+        )
+        for event_type, order_ids in changed.items():
+            if event_type in TRANSITION_EMAILS:
+                enqueue_order_emails(TRANSITION_EMAILS[event_type], order_ids)
+            sync_order_stats(order_ids)
+            sync_order_slots(order_ids)
+            sync_order_reservations(order_ids)
+            publish_order_updates(order_ids)
+
+        # Intent payé : le panier dont il provient ne doit plus le resservir
+        paid = [
+            ((event.payload['data']['object'].get('metadata') or {}).get('cart_id'), event.payment_intent_id)
+            for event in events
+            if event.event_type == 'payment_intent.succeeded' and event.pk in matched_ids
+        ]
+
+        def forget_paid_intents():
+            for cart_id, payment_intent_id in paid:
+                if cart_id:
+                    forget_cart_intent(cart_id, payment_intent_id)
+        transaction.on_commit(forget_paid_intents)
+
+    logger.info(f"{len(events)} événements Stripe traités ({len(matched_ids)} appliqués, {len(errors)} en erreur)")
+    return len(events)
+
+
+def apply_events_individually(events):
+    """
+    Appliquer les événements un par un, chacun dans un point de sauvegarde
+
+    Returns:
+        tuple: (ids des événements rattachés à une commande,
+                {type d'événement: [pk des commandes modifiées]},
+                {id de l'événement en erreur: exception})
+    """
+    matched_ids = []
+    changed = {}
+    errors = {}
+    for event in sorted(events, key=lambda e: (e.stripe_created, e.pk)):
+        try:
+            with transaction.atomic():
+                event_matched, event_changed = apply_events([event])
+        except Exception as e:
+            logger.exception(f"Événement Stripe {event.event_id} en erreur")
+            errors[event.pk] = e
+            continue
+        matched_ids.extend(event_matched)
+        for event_type, order_ids in event_changed.items():
+            changed.setdefault(event_type, []).extend(order_ids)
+    return matched_ids, changed, errors
+
+
+def apply_events(events):
+    """
+    Appliquer un lot d'événements aux commandes
+
+    Une requête de lecture et un UPDATE par type d'événement, quelle que
+    soit la taille du lot.
+
+    Returns:
+        tuple: (ids des événements rattachés à une commande,
+                {type d'événement: [pk des commandes modifiées]})
+    """
+    by_type = {}
+    for event in sorted(events, key=lambda e: (e.payment_intent_id, e.stripe_created, e.pk)):
+        if event.event_type in TRANSITIONS:
+            by_type.setdefault(event.event_type, []).append(event)
+
+    matched_ids = []
+    changed = {}
+    for event_type, transition in TRANSITIONS.items():
+        type_events = by_type.get(event_type)
+        if not type_events:
+            continue
+
+        order_numbers = {e.order_number for e in type_events if e.order_number}
+        intent_ids = {e.payment_intent_id for e in type_events if e.payment_intent_id}
+        rows = list(
+            Order.objects.select_for_update()
+            .filter(Q(order_number__in=order_numbers) | Q(stripe_payment_intent_id__in=intent_ids))
+            .annotate(eligible=Case(
+                When(transition['guard'], then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ))
+            .values_list('pk', 'order_number', 'stripe_payment_intent_id', 'eligible')
+        )
+        known_numbers = {number for _, number, _, _ in rows}
+        known_intents = {intent for _, _, intent, _ in rows if intent}
+        matched_ids.extend(
+            e.pk for e in type_events
+            if e.order_number in known_numbers or e.payment_intent_id in known_intents
+        )
+
+        order_ids = [pk for pk, _, _, eligible in rows if eligible]
+        if order_ids:
+            Order.objects.filter(pk__in=order_ids).filter(transition['guard']).update(
+                updated_at=timezone.now(), **transition['values']
+            )
+            changed[event_type] = order_ids
+
+    return matched_ids, changed
+
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='weight_grams',
+            field=models.PositiveIntegerField(default=0, verbose_name='Poids (g)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_weight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='volume_ml',
+            field=models.PositiveIntegerField(default=0, verbose_name='Volume (ml)'),
+        ),
+    ]
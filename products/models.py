@@ -3,6 +3,8 @@ from django.urls import reverse
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
 import uuid
 
 
@@ -104,6 +106,8 @@ class Product(models.Model):
     stock_quantity = models.PositiveIntegerField(default=0, verbose_name="Stock")
     min_order_quantity = models.PositiveIntegerField(default=1, verbose_name="Quantité minimum")
     max_order_quantity = models.PositiveIntegerField(default=50, verbose_name="Quantité maximum")
+    weight_grams = models.PositiveIntegerField(default=0, verbose_name="Poids (g)")
+    volume_ml = models.PositiveIntegerField(default=0, verbose_name="Volume (ml)")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -245,3 +249,72 @@ class Wishlist(models.Model):
 
     def __str__(self):
         return f"Liste de souhaits de {self.user.username}"
+
+
+@receiver(m2m_changed, sender=Wishlist.products.through)
+def refresh_wishlist_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    """Mettre à jour l'ensemble en cache des produits de la liste de souhaits"""
+    from django.db import transaction
+    from .wishlist import refresh_wishlist_ids
+
+    if reverse and action == 'pre_clear':
+        # Produit retiré de toutes les listes : noter les utilisateurs avant suppression
+        instance._wishlist_user_ids = set(instance.wishlist_set.values_list('user_id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        user_ids = {instance.user_id}
+    elif action == 'post_clear':
+        user_ids = getattr(instance, '_wishlist_user_ids', set())
+    else:
+        user_ids = set(Wishlist.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+
+    def refresh():
+        for user_id in user_ids:
+            refresh_wishlist_ids(user_id)
+    transaction.on_commit(refresh)
+
+
+@receiver(post_delete, sender=Wishlist)
+def clear_wishlist_cache(sender, instance, **kwargs):
+    from django.db import transaction
+    from .wishlist import refresh_wishlist_ids
+    transaction.on_commit(lambda: refresh_wishlist_ids(instance.user_id))
+
+
+@receiver(pre_delete, sender=Product)
+def note_product_wishlist_users(sender, instance, **kwargs):
+    # La suppression en cascade des lignes de liste n'émet pas m2m_changed
+    instance._wishlist_user_ids = set(instance.wishlist_set.values_list('user_id', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def refresh_deleted_product_wishlists(sender, instance, **kwargs):
+    """Retirer le produit supprimé des listes en cache"""
+    from django.db import transaction
+    from .wishlist import refresh_wishlist_ids
+
+    user_ids = getattr(instance, '_wishlist_user_ids', set())
+
+    def refresh():
+        for user_id in user_ids:
+            refresh_wishlist_ids(user_id)
+    if user_ids:
+        transaction.on_commit(refresh)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Flavor)
+@receiver(post_delete, sender=Flavor)
+@receiver(post_save, sender=ProductFlavor)
+@receiver(post_delete, sender=ProductFlavor)
+@receiver(m2m_changed, sender=ProductFlavor)
+@receiver(m2m_changed, sender=Product.allergens.through)
+def refresh_recommendation_catalog(sender, **kwargs):
+    """Recharger le catalogue des recommandations (parfums, allergènes, produits actifs)"""
+    if kwargs.get('action', 'post_').startswith('post_'):
+        from .recommendations import bump_catalog_version
+        bump_catalog_version()
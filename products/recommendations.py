@@ -0,0 +1,325 @@
+"""
+Recommandations de produits par utilisateur
+
+Le catalogue actif est chargé une fois en matrices NumPy : parfums
+disponibles par produit (lignes normalisées), masque d'allergènes en bits
+(un mot de 64 bits par tranche de 64 allergènes), catégorie et popularité
+récente. Le score d'un utilisateur est calculé en une passe vectorisée sur
+tous les produits à partir de ses parfums préférés, de ses achats et de la
+popularité ; les produits dont le masque d'allergènes croise ses
+restrictions alimentaires sont exclus, quel que soit leur score.
+
+Le classement est mis en cache par utilisateur sous la version du
+catalogue et une version propre à l'utilisateur : une modification de
+produit change la première, une modification des préférences ou une
+commande comptée change la seconde. Les versions sont lues avant le
+calcul : un classement calculé pendant une modification est aussitôt
+périmé. Une fois chaud, un appel coûte une lecture de cache (et la
+requête des produits affichés).
+"""
+import time
+import uuid
+from array import array
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from checkout.models import OrderItem
+from users.models import UserProfile
+
+from .models import Allergen, Flavor, Product, ProductFlavor
+
+
+CATALOG_VERSION_CACHE_KEY = 'recommendations:catalog:version'
+CATALOG_CACHE_KEY = 'recommendations:catalog:{}'
+CATALOG_TIMEOUT = 60 * 60
+RECOMMENDATIONS_CACHE_KEY = 'recommendations:user:{}'
+USER_VERSION_CACHE_KEY = 'recommendations:user:version:{}'
+RECOMMENDATIONS_TIMEOUT = 60 * 60
+# Classement conservé par utilisateur (les exclusions de page se font dessus)
+RECOMMENDATIONS_SIZE = 24
+POPULARITY_DAYS = getattr(settings, 'RECOMMENDATION_POPULARITY_DAYS', 90)
+
+# Poids des composantes du score (chacune ramenée entre 0 et 1)
+WEIGHTS = {
+    'favorite_flavors': 1.0,
+    'purchased_flavors': 0.6,
+    'purchased_categories': 0.3,
+    'popularity': 0.4,
+    'featured': 0.05,
+}
+
+# Catalogue du processus, tant que la version en cache ne change pas
+_local_catalog = None
+
+
+@dataclass
+class Catalog:
+    """Produits actifs et leurs caractéristiques, en tableaux alignés sur product_ids"""
+    version: str
+    built_at: float
+    product_ids: np.ndarray
+    flavor_ids: np.ndarray
+    allergen_ids: np.ndarray
+    category_ids: np.ndarray
+    flavor_matrix: np.ndarray
+    allergen_masks: np.ndarray
+    category_index: np.ndarray
+    popularity: np.ndarray
+    featured: np.ndarray
+
+
+def _positions(sorted_ids, ids):
+    """Indices des `ids` dans le tableau trié `sorted_ids` (-1 si absent)"""
+    ids = np.asarray(ids, dtype=np.int64)
+    if not len(sorted_ids) or not len(ids):
+        return np.full(len(ids), -1, dtype=np.int64)
+    positions = np.searchsorted(sorted_ids, ids).clip(max=len(sorted_ids) - 1)
+    return np.where(sorted_ids[positions] == ids, positions, -1)
+
+
+def _allergen_bits(allergen_ids, ids, words):
+    """Masque en bits d'un ensemble d'allergènes : (mot, bit) par allergène connu"""
+    positions = _positions(allergen_ids, ids)
+    positions = positions[positions >= 0]
+    mask = np.zeros(words, dtype=np.uint64)
+    np.bitwise_or.at(mask, positions // 64, np.left_shift(np.uint64(1), (positions % 64).astype(np.uint64)))
+    return mask
+
+
+def build_catalog(version):
+    """Charger le catalogue actif en matrices (quatre requêtes, quelle que soit sa taille)"""
+    rows = list(
+        Product.objects.filter(is_active=True).order_by('pk').values_list('pk', 'category_id', 'is_featured')
+    )
+    product_ids = np.array([pk for pk, _, _ in rows], dtype=np.int64)
+    category_ids, category_index = np.unique(
+        np.array([category_id for _, category_id, _ in rows], dtype=np.int64), return_inverse=True,
+    )
+    featured = np.array([is_featured for _, _, is_featured in rows], dtype=np.float32)
+
+    flavor_ids = np.array(sorted(Flavor.objects.filter(is_active=True).values_list('pk', flat=True)), dtype=np.int64)
+    allergen_ids = np.array(sorted(Allergen.objects.values_list('pk', flat=True)), dtype=np.int64)
+
+    flavor_matrix = np.zeros((len(product_ids), len(flavor_ids)), dtype=np.float32)
+    pairs = np.array(
+        ProductFlavor.objects.filter(is_available=True).values_list('product_id', 'flavor_id'),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    rows_index, columns = _positions(product_ids, pairs[:, 0]), _positions(flavor_ids, pairs[:, 1])
+    known = (rows_index >= 0) & (columns >= 0)
+    flavor_matrix[rows_index[known], columns[known]] = 1
+    # Lignes normalisées : un produit aux vingt parfums n'écrase pas un parfum unique
+    norms = np.linalg.norm(flavor_matrix, axis=1, keepdims=True)
+    np.divide(flavor_matrix, norms, out=flavor_matrix, where=norms > 0)
+
+    words = max(1, -(-len(allergen_ids) // 64))
+    allergen_masks = np.zeros((len(product_ids), words), dtype=np.uint64)
+    pairs = np.array(
+        Product.allergens.through.objects.values_list('product_id', 'allergen_id'), dtype=np.int64,
+    ).reshape(-1, 2)
+    rows_index, positions = _positions(product_ids, pairs[:, 0]), _positions(allergen_ids, pairs[:, 1])
+    known = (rows_index >= 0) & (positions >= 0)
+    np.bitwise_or.at(
+        allergen_masks,
+        (rows_index[known], positions[known] // 64),
+        np.left_shift(np.uint64(1), (positions[known] % 64).astype(np.uint64)),
+    )
+
+    popularity = np.zeros(len(product_ids), dtype=np.float32)
+    sold = np.array(
+        OrderItem.objects.filter(
+            order__in_customer_stats=True,
+            order__created_at__gte=timezone.now() - timedelta(days=POPULARITY_DAYS),
+        ).values('product_id').order_by().annotate(units=Sum('quantity')).values_list('product_id', 'units'),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    rows_index = _positions(product_ids, sold[:, 0])
+    known = rows_index >= 0
+    popularity[rows_index[known]] = np.log1p(sold[known, 1])
+    if popularity.max(initial=0) > 0:
+        popularity /= popularity.max()
+
+    return Catalog(
+        version=version,
+        built_at=time.time(),
+        product_ids=product_ids,
+        flavor_ids=flavor_ids,
+        allergen_ids=allergen_ids,
+        category_ids=category_ids,
+        flavor_matrix=flavor_matrix,
+        allergen_masks=allergen_masks,
+        category_index=category_index.ravel(),
+        popularity=popularity,
+        featured=featured,
+    )
+
+
+def _catalog_version():
+    version = cache.get(CATALOG_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(CATALOG_VERSION_CACHE_KEY)
+    return version
+
+
+def get_catalog(version=None):
+    """Catalogue de la version courante : mémoire du processus, puis cache, puis base"""
+    global _local_catalog
+    version = version or _catalog_version()
+    catalog = _local_catalog
+    if catalog is not None and catalog.version == version and time.time() - catalog.built_at < CATALOG_TIMEOUT:
+        return catalog
+    catalog = cache.get(CATALOG_CACHE_KEY.format(version))
+    if catalog is None or time.time() - catalog.built_at >= CATALOG_TIMEOUT:
+        catalog = build_catalog(version)
+        cache.set(CATALOG_CACHE_KEY.format(version), catalog, CATALOG_TIMEOUT)
+    _local_catalog = catalog
+    return catalog
+
+
+def bump_catalog_version():
+    """Invalider le catalogue et tous les classements, une fois la transaction validée"""
+    transaction.on_commit(lambda: cache.set(CATALOG_VERSION_CACHE_KEY, uuid.uuid4().hex, None))
+
+
+def invalidate_recommendations(user_ids):
+    """Changer la version du classement de ces utilisateurs, une fois la transaction validée"""
+    keys = [USER_VERSION_CACHE_KEY.format(user_id) for user_id in user_ids if user_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.set_many({key: uuid.uuid4().hex for key in keys}, None))
+
+
+def restricted_allergens(user_id):
+    """Allergènes des restrictions alimentaires de l'utilisateur (sous-requête)"""
+    return UserProfile.dietary_restrictions.through.objects.filter(
+        userprofile__user_id=user_id,
+    ).values_list('allergen_id', flat=True)
+
+
+def exclude_restricted(queryset, user):
+    """Retirer d'une liste de produits ceux qui contiennent un allergène interdit à l'utilisateur"""
+    if not user.is_authenticated:
+        return queryset
+    return queryset.exclude(allergens__in=restricted_allergens(user.pk))
+
+
+def _unit(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def score_products(catalog, favorite_flavor_ids=(), purchases=(), restricted_allergen_ids=()):
+    """
+    Score de chaque produit du catalogue pour un utilisateur
+
+    Args:
+        purchases: couples (product_id, flavor_id ou None, quantité)
+
+    Returns:
+        numpy.ndarray: Scores alignés sur catalog.product_ids (-inf : produit exclu)
+    """
+    favorites = np.zeros(len(catalog.flavor_ids), dtype=np.float32)
+    positions = _positions(catalog.flavor_ids, list(favorite_flavor_ids))
+    favorites[positions[positions >= 0]] = 1
+
+    purchased_flavors = np.zeros(len(catalog.flavor_ids), dtype=np.float32)
+    purchased_categories = np.zeros(len(catalog.category_ids), dtype=np.float32)
+    if purchases:
+        purchases = np.array([(p, f or 0, q) for p, f, q in purchases], dtype=np.int64).reshape(-1, 3)
+        positions = _positions(catalog.flavor_ids, purchases[:, 1])
+        known = positions >= 0
+        np.add.at(purchased_flavors, positions[known], purchases[known, 2])
+        rows = _positions(catalog.product_ids, purchases[:, 0])
+        known = rows >= 0
+        np.add.at(purchased_categories, catalog.category_index[rows[known]], purchases[known, 2])
+        if purchased_categories.max(initial=0) > 0:
+            purchased_categories /= purchased_categories.max()
+
+    scores = (
+        WEIGHTS['favorite_flavors'] * (catalog.flavor_matrix @ _unit(favorites))
+        + WEIGHTS['purchased_flavors'] * (catalog.flavor_matrix @ _unit(purchased_flavors))
+        + WEIGHTS['purchased_categories'] * purchased_categories[catalog.category_index]
+        + WEIGHTS['popularity'] * catalog.popularity
+        + WEIGHTS['featured'] * catalog.featured
+    ).astype(np.float64)
+
+    if len(restricted_allergen_ids):
+        mask = _allergen_bits(catalog.allergen_ids, list(restricted_allergen_ids), catalog.allergen_masks.shape[1])
+        scores[(catalog.allergen_masks & mask).any(axis=1)] = -np.inf
+    return scores
+
+
+def top_products(catalog, scores, size=RECOMMENDATIONS_SIZE):
+    """Identifiants des `size` meilleurs produits (hors exclus), du meilleur au moins bon"""
+    candidates = np.flatnonzero(np.isfinite(scores))
+    if len(candidates) > size:
+        candidates = candidates[np.argpartition(-scores[candidates], size - 1)[:size]]
+    # Tri stable : à score égal, le produit le plus populaire puis le plus récent
+    order = np.lexsort((-catalog.product_ids[candidates], -catalog.popularity[candidates], -scores[candidates]))
+    return catalog.product_ids[candidates[order]].tolist()
+
+
+def compute_recommendations(user_id, catalog):
+    """Classement d'un utilisateur (trois requêtes : préférences, restrictions, achats)"""
+    if user_id is None:
+        return top_products(catalog, score_products(catalog))
+    favorites = UserProfile.favorite_flavors.through.objects.filter(
+        userprofile__user_id=user_id,
+    ).values_list('flavor_id', flat=True)
+    restrictions = restricted_allergens(user_id)
+    purchases = list(
+        OrderItem.objects.filter(order__user_id=user_id, order__in_customer_stats=True)
+        .values('product_id', 'flavor_id').order_by().annotate(units=Sum('quantity'))
+        .values_list('product_id', 'flavor_id', 'units')
+    )
+    return top_products(catalog, score_products(catalog, list(favorites), purchases, list(restrictions)))
+
+
+def _pack(product_ids):
+    return array('q', product_ids).tobytes()
+
+
+def _unpack(data):
+    product_ids = array('q')
+    product_ids.frombytes(data)
+    return product_ids.tolist()
+
+
+def get_recommended_ids(user, limit=4, exclude=()):
+    """
+    Identifiants des produits recommandés, du plus au moins pertinent
+
+    Une lecture de cache (classement et versions) une fois chaud ; les
+    visiteurs partagent le classement par popularité.
+    """
+    user_id = user.pk if user.is_authenticated else None
+    key = RECOMMENDATIONS_CACHE_KEY.format(user_id if user_id is not None else 'anonymous')
+    user_version_key = USER_VERSION_CACHE_KEY.format(user_id)
+    cached = cache.get_many([key, CATALOG_VERSION_CACHE_KEY, user_version_key])
+    catalog_version = cached.get(CATALOG_VERSION_CACHE_KEY) or _catalog_version()
+    version = (catalog_version, cached.get(user_version_key) if user_id is not None else None)
+
+    entry = cached.get(key)
+    if entry is not None and entry[0] == version:
+        product_ids = _unpack(entry[1])
+    else:
+        # Versions lues avant le calcul : une invalidation concurrente rend l'entrée aussitôt périmée
+        product_ids = compute_recommendations(user_id, get_catalog(catalog_version))
+        cache.set(key, (version, _pack(product_ids)), RECOMMENDATIONS_TIMEOUT)
+
+    exclude = set(exclude)
+    return [product_id for product_id in product_ids if product_id not in exclude][:limit]
+
+
+def recommended_products(user, limit=4, exclude=()):
+    """Produits recommandés, dans l'ordre du classement (une requête)"""
+    product_ids = get_recommended_ids(user, limit, exclude)
+    products = Product.objects.filter(pk__in=product_ids, is_active=True).select_related('category').in_bulk()
+    return [products[product_id] for product_id in product_ids if product_id in products]
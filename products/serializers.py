@@ -1,10 +1,12 @@
 from rest_framework import serializers
 from .models import (
     Product, Category, Flavor, Allergen, CustomizationOption,
-    ProductReview, ProductImage, ProductFlavor
+    ProductReview, ProductImage, ProductFlavor, Wishlist
 )
 from django.db.models import Avg
 
+from .wishlist import MAX_BULK_PRODUCTS
+
 
 class AllergenSerializer(serializers.ModelSerializer):
     class Meta:
@@ -168,4 +170,25 @@ class CustomizationResponseSerializer(serializers.Serializer):
     customizations = serializers.ListField(
         child=serializers.DictField(),
         required=False
-    ) 
\ No newline at end of file
+    ) 
+
+
+class WishlistItemSerializer(serializers.ModelSerializer):
+    """Produit de la liste de souhaits (sans requête supplémentaire par ligne)"""
+    name = serializers.CharField(source='product.name', read_only=True)
+    slug = serializers.CharField(source='product.slug', read_only=True)
+    current_price = serializers.DecimalField(source='product.current_price', max_digits=10, decimal_places=2, read_only=True)
+    is_on_sale = serializers.BooleanField(source='product.is_on_sale', read_only=True)
+    url = serializers.CharField(source='product.get_absolute_url', read_only=True)
+
+    class Meta:
+        model = Wishlist.products.through
+        fields = ['id', 'product_id', 'name', 'slug', 'current_price', 'is_on_sale', 'url']
+
+
+class WishlistBulkSerializer(serializers.Serializer):
+    product_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_PRODUCTS,
+    )
@@ -1,3 +1,84 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from . import recommendations
+from .models import Allergen, Category, Product
+from .recommendations import get_recommended_ids
+
+
+class RecommendationRestrictionsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Glaces")
+        self.nuts = Allergen.objects.create(name="Fruits à coque")
+        self.milk = Allergen.objects.create(name="Lait")
+        self.allergens = {}
+        for index, allergens in enumerate([[self.nuts], [self.milk], [self.nuts, self.milk], [], [], [self.milk]]):
+            product = Product.objects.create(
+                name=f"Glace {index}", description="Glace", category=category,
+                base_price=10, stock_quantity=10, is_featured=bool(allergens),
+            )
+            product.allergens.set(allergens)
+            self.allergens[product.pk] = {allergen.pk for allergen in allergens}
+        self.user = User.objects.create_user('restricted', 'restricted@example.com', 'password')
+        self.profile = self.user.profile
+
+    def assertNoRestrictedProducts(self, restricted):
+        product_ids = get_recommended_ids(self.user, limit=len(self.allergens))
+        self.assertTrue(product_ids)
+        for product_id in product_ids:
+            self.assertFalse(self.allergens[product_id] & restricted, product_id)
+        return product_ids
+
+    def test_restricted_allergens_are_never_recommended(self):
+        self.profile.dietary_restrictions.set([self.nuts])
+        product_ids = self.assertNoRestrictedProducts({self.nuts.pk})
+        self.assertEqual(
+            set(product_ids),
+            {pk for pk, allergens in self.allergens.items() if self.nuts.pk not in allergens},
+        )
+
+    def test_restriction_change_with_warm_cache(self):
+        self.profile.dietary_restrictions.set([self.nuts])
+        self.assertNoRestrictedProducts({self.nuts.pk})
+
+        # Classement en cache : le changement de restriction doit l'invalider
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.dietary_restrictions.set([self.milk])
+        self.assertNoRestrictedProducts({self.milk.pk})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.dietary_restrictions.add(self.nuts)
+        product_ids = self.assertNoRestrictedProducts({self.nuts.pk, self.milk.pk})
+        self.assertEqual(set(product_ids), {pk for pk, allergens in self.allergens.items() if not allergens})
+
+    def test_restriction_change_during_a_recompute(self):
+        self.profile.dietary_restrictions.set([self.nuts])
+        compute = recommendations.compute_recommendations
+
+        def compute_then_change_restrictions(user_id, catalog):
+            # Classement calculé avec les anciennes restrictions, modifiées avant son écriture en cache
+            product_ids = compute(user_id, catalog)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.profile.dietary_restrictions.set([self.milk])
+            return product_ids
+
+        with mock.patch.object(recommendations, 'compute_recommendations',
+                               side_effect=compute_then_change_restrictions):
+            get_recommended_ids(self.user, limit=len(self.allergens))
+        self.assertNoRestrictedProducts({self.milk.pk})
 
-# Create your tests here.
+    def test_home_fallback_excludes_restricted_products(self):
+        self.profile.dietary_restrictions.set([self.nuts])
+        self.client.force_login(self.user)
+        with mock.patch('caravela.views.recommended_products', return_value=[]):
+            response = self.client.get(reverse('home'))
+        self.assertFalse(response.context['personalized'])
+        shown = [product.pk for product in response.context['featured_products']]
+        self.assertTrue(shown)
+        for product_id in shown:
+            self.assertNotIn(self.nuts.pk, self.allergens[product_id])
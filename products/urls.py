@@ -10,6 +10,7 @@ router.register(r'api/products', views.ProductViewSet, basename='api-product')
 router.register(r'api/categories', views.CategoryViewSet, basename='api-category')
 router.register(r'api/flavors', views.FlavorViewSet, basename='api-flavor')
 router.register(r'api/customizations', views.CustomizationOptionViewSet, basename='api-customization')
+router.register(r'api/wishlist', views.WishlistViewSet, basename='api-wishlist')
 
 # URLs classiques Django
 urlpatterns = [
@@ -1,3 +1,5 @@
+from functools import wraps
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse
 from django.core.paginator import Paginator
@@ -8,19 +10,43 @@ from django.views.generic import ListView, DetailView
 from rest_framework import viewsets, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 # from cacheops import cached_as, cached
 from .models import Product, Category, Flavor, Allergen, CustomizationOption, ProductReview
 from django.contrib.auth.decorators import login_required, user_passes_test
 from .forms import ProductForm
 from .serializers import (
     ProductSerializer, CategorySerializer, FlavorSerializer,
-    AllergenSerializer, CustomizationOptionSerializer, ProductReviewSerializer
+    AllergenSerializer, CustomizationOptionSerializer, ProductReviewSerializer,
+    WishlistBulkSerializer, WishlistItemSerializer,
 )
+from .recommendations import RECOMMENDATIONS_SIZE, recommended_products
+from .wishlist import WishlistItem, get_user_wishlist, get_wishlist_ids, wishlist_membership
+
+
+def cache_page_for_anonymous(timeout):
+    """
+    cache_page réservé aux visiteurs anonymes
+
+    L'en-tête de base.html (points, panier, notifications) et les
+    recommandations sont propres à l'utilisateur connecté : sa page n'est
+    ni lue ni écrite dans le cache partagé.
+    """
+    def decorator(view):
+        cached_view = cache_page(timeout)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            return cached_view(request, *args, **kwargs)
+        return wrapper
+    return decorator
 
 
 # Vues classiques Django
-@cache_page(60 * 15)  # Cache 15 minutes
+@cache_page_for_anonymous(60 * 15)  # Cache 15 minutes
 def product_list(request):
     """Liste des produits"""
     products = Product.objects.filter(is_active=True).order_by('name')
@@ -41,7 +67,7 @@ def product_list(request):
     return render(request, 'products/product_list.html', context)
 
 
-@cache_page(60 * 15)  # Cache 15 minutes
+@cache_page_for_anonymous(60 * 15)  # Cache 15 minutes
 def category_list(request):
     """Liste des catégories"""
     categories = Category.objects.filter(is_active=True).order_by('name')
@@ -53,7 +79,7 @@ def category_list(request):
     return render(request, 'products/category_list.html', context)
 
 
-@cache_page(60 * 30)  # Cache 30 minutes
+@cache_page_for_anonymous(60 * 30)  # Cache 30 minutes
 def product_detail(request, slug):
     """Détail d'un produit"""
     product = get_object_or_404(Product, slug=slug, is_active=True)
@@ -73,6 +99,7 @@ def product_detail(request, slug):
     context = {
         'product': product,
         'similar_products': similar_products,
+        'recommended_products': recommended_products(request.user, 4, exclude=[product.id]),
         'reviews': reviews,
         'customization_options': customization_options,
     }
@@ -80,7 +107,7 @@ def product_detail(request, slug):
     return render(request, 'products/product_detail.html', context)
 
 
-@cache_page(60 * 60)  # Cache 1 heure
+@cache_page_for_anonymous(60 * 60)  # Cache 1 heure
 def category_detail(request, slug):
     """Détail d'une catégorie"""
     category = get_object_or_404(Category, slug=slug, is_active=True)
@@ -185,6 +212,22 @@ class ProductViewSet(viewsets.ReadOnlyModelViewSet):
         serializer = self.get_serializer(products, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def recommended(self, request):
+        """
+        Produits recommandés pour l'utilisateur (popularité pour un visiteur)
+
+        ?limit=4 et ?exclude=12,15 (produit affiché, panier).
+        """
+        try:
+            limit = min(int(request.query_params.get('limit', 4)), RECOMMENDATIONS_SIZE)
+            exclude = [int(value) for value in request.query_params.get('exclude', '').split(',') if value]
+        except ValueError:
+            return Response({'error': 'Paramètres invalides'}, status=400)
+        products = recommended_products(request.user, limit, exclude=exclude)
+        serializer = self.get_serializer(products, many=True)
+        return Response(serializer.data)
+
     @action(detail=False, methods=['get'])
     def on_sale(self, request):
         """Obtenir les produits en promotion"""
@@ -237,6 +280,76 @@ class CustomizationOptionViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
 
 
+class WishlistPagination(CursorPagination):
+    page_size = 20
+    ordering = '-id'
+
+
+class WishlistViewSet(viewsets.GenericViewSet):
+    """API de la liste de souhaits de l'utilisateur connecté"""
+    serializer_class = WishlistItemSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = WishlistPagination
+
+    def get_queryset(self):
+        return WishlistItem.objects.filter(wishlist__user=self.request.user).select_related('product')
+
+    def list(self, request):
+        """Produits de la liste, du plus récent au plus ancien (pagination par curseur)"""
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def ids(self, request):
+        """
+        Identifiants des produits de la liste (cœurs des fiches produit)
+
+        Avec ?product_ids=1,2,3 : présence de chaque produit demandé.
+        Une lecture de cache, aucune requête.
+        """
+        requested = request.query_params.get('product_ids')
+        if requested:
+            try:
+                product_ids = [int(value) for value in requested.split(',') if value]
+            except ValueError:
+                return Response({'error': 'Identifiants invalides'}, status=400)
+            return Response({'membership': wishlist_membership(request.user, product_ids)})
+        return Response({'product_ids': sorted(get_wishlist_ids(request.user.pk))})
+
+    @action(detail=False, methods=['post'])
+    def add(self, request):
+        """Ajouter plusieurs produits en une fois"""
+        from users.activity import record_activity
+
+        serializer = WishlistBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        product_ids = set(
+            Product.objects.filter(pk__in=serializer.validated_data['product_ids'], is_active=True)
+            .values_list('pk', flat=True)
+        )
+        added = set()
+        if product_ids:
+            # La base fait foi (add() ignore les produits déjà présents), pas le cache
+            wishlist = get_user_wishlist(request.user)
+            added = product_ids - set(wishlist.products.filter(pk__in=product_ids).values_list('pk', flat=True))
+            wishlist.products.add(*product_ids)
+            for product_id in added:
+                record_activity(request.user, 'wishlist_add', metadata={'product_id': product_id}, request=request)
+        return Response({'added': sorted(added), 'product_ids': sorted(get_wishlist_ids(request.user.pk))})
+
+    @action(detail=False, methods=['post'])
+    def remove(self, request):
+        """Retirer plusieurs produits en une fois"""
+        serializer = WishlistBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        product_ids = set(serializer.validated_data['product_ids'])
+        wishlist = get_user_wishlist(request.user)
+        removed = set(wishlist.products.filter(pk__in=product_ids).values_list('pk', flat=True))
+        # remove() ignore les produits absents : le cache ne décide pas de l'écriture
+        wishlist.products.remove(*product_ids)
+        return Response({'removed': sorted(removed), 'product_ids': sorted(get_wishlist_ids(request.user.pk))})
+
+
 # Vues AJAX pour la personnalisation
 def get_product_flavors(request, product_id):
     """Obtenir les parfums disponibles pour un produit"""
@@ -0,0 +1,64 @@
+from array import array
+
+from django.core.cache import cache
+
+from .models import Wishlist
+
+
+WISHLIST_CACHE_KEY = 'wishlist:ids:{}'
+WISHLIST_TIMEOUT = 60 * 60 * 24 * 7
+MAX_BULK_PRODUCTS = 100
+
+WishlistItem = Wishlist.products.through
+
+
+def get_user_wishlist(user):
+    """Liste de souhaits de l'utilisateur (créée au premier ajout)"""
+    wishlist = Wishlist.objects.filter(user=user).order_by('pk').first()
+    if wishlist is None:
+        wishlist = Wishlist.objects.create(user=user)
+    return wishlist
+
+
+def _pack(product_ids):
+    # Tableau trié d'entiers 64 bits : 8 octets par produit en cache
+    return array('q', sorted(product_ids)).tobytes()
+
+
+def _unpack(data):
+    ids = array('q')
+    ids.frombytes(data)
+    return frozenset(ids)
+
+
+def refresh_wishlist_ids(user_id):
+    """Recalculer l'ensemble des produits de la liste et le mettre en cache"""
+    product_ids = (
+        WishlistItem.objects.filter(wishlist__user_id=user_id)
+        .values_list('product_id', flat=True)
+        .distinct()
+    )
+    product_ids = frozenset(product_ids)
+    cache.set(WISHLIST_CACHE_KEY.format(user_id), _pack(product_ids), WISHLIST_TIMEOUT)
+    return product_ids
+
+
+def get_wishlist_ids(user_id):
+    """Identifiants des produits de la liste : une lecture de cache, aucune requête une fois chaud"""
+    data = cache.get(WISHLIST_CACHE_KEY.format(user_id))
+    if data is None:
+        return refresh_wishlist_ids(user_id)
+    return _unpack(data)
+
+
+def wishlist_membership(user, product_ids):
+    """
+    Présence de chaque produit dans la liste de l'utilisateur
+
+    Returns:
+        dict: {product_id: bool} (tout à False pour un visiteur)
+    """
+    if not user.is_authenticated:
+        return {product_id: False for product_id in product_ids}
+    wishlist_ids = get_wishlist_ids(user.pk)
+    return {product_id: product_id in wishlist_ids for product_id in product_ids}
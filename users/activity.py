@@ -0,0 +1,276 @@
+import atexit
+import logging
+import os
+import threading
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import UserActivity, UserActivityDaily
+
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = 'users_useractivity_p'
+DELETE_CHUNK_SIZE = 5000
+
+
+def get_client_ip(request):
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR') or None
+
+
+class ActivityBuffer:
+    """
+    Tampon des événements d'activité, écrits par lots en arrière-plan
+
+    record_activity() ne fait qu'ajouter l'objet à une liste : la requête
+    n'attend jamais la base. Un thread dédié vide le tampon avec un seul
+    bulk_create dès que `max_size` événements sont en attente ou toutes les
+    `flush_interval` secondes. Le thread est relancé après un fork (workers
+    gunicorn) et le tampon est vidé à l'arrêt du processus.
+    """
+
+    def __init__(self, max_size, flush_interval):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._events = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._thread = None
+
+    def add(self, activity):
+        with self._lock:
+            self._events.append(activity)
+            full = len(self._events) >= self.max_size
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        return len(self._events)
+
+    def flush(self):
+        """Écrire les événements en attente ; retourne le nombre d'événements écrits"""
+        with self._lock:
+            batch, self._events = self._events, []
+        if not batch:
+            return 0
+        try:
+            try:
+                UserActivity.objects.bulk_create(batch, batch_size=self.max_size)
+            except IntegrityError:
+                # Compte supprimé (ou créé dans une transaction annulée) entre-temps :
+                # ses événements sont écartés, pas ceux des autres utilisateurs
+                existing = set(User.objects.filter(pk__in={a.user_id for a in batch}).values_list('pk', flat=True))
+                batch = [activity for activity in batch if activity.user_id in existing]
+                UserActivity.objects.bulk_create(batch, batch_size=self.max_size)
+        except DatabaseError:
+            # Journal d'activité non critique : le lot est abandonné plutôt que de bloquer
+            logger.exception(f"Écriture de {len(batch)} activités utilisateur impossible")
+            return 0
+        return len(batch)
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # Connexion propre au thread : ne pas la garder ouverte entre deux lots
+                connection.close()
+
+
+_buffer = ActivityBuffer(
+    max_size=getattr(settings, 'ACTIVITY_BUFFER_SIZE', 200),
+    flush_interval=getattr(settings, 'ACTIVITY_FLUSH_INTERVAL_MS', 2000) / 1000,
+)
+atexit.register(_buffer.flush)
+
+
+def record_activity(user, activity_type, description='', metadata=None, request=None):
+    """Journaliser une activité utilisateur (écriture différée, groupée par lots)"""
+    activity = UserActivity(
+        user_id=user.pk,
+        activity_type=activity_type,
+        description=description,
+        metadata=metadata or {},
+        created_at=timezone.now(),
+    )
+    if request is not None:
+        activity.ip_address = get_client_ip(request)
+        activity.user_agent = request.META.get('HTTP_USER_AGENT', '')[:500]
+    _buffer.add(activity)
+
+
+def flush_activity():
+    return _buffer.flush()
+
+
+# Partitions mensuelles (PostgreSQL)
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass",
+            [UserActivity._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """Partitions mensuelles existantes : {premier jour du mois: nom de la table}"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass",
+            [UserActivity._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return {
+        datetime.strptime(name[len(PARTITION_PREFIX):], '%Y%m').date(): name
+        for name in names
+        if name.startswith(PARTITION_PREFIX)
+    }
+
+
+def create_partition_sql(month):
+    table = connection.ops.quote_name(UserActivity._meta.db_table)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {connection.ops.quote_name(partition_name(month))} "
+        f"PARTITION OF {table} FOR VALUES FROM ('{month.isoformat()}') "
+        f"TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def ensure_partitions(months_ahead=2):
+    """Créer les partitions du mois courant et des `months_ahead` mois suivants"""
+    if not is_partitioned():
+        return []
+    current = month_start(timezone.localdate())
+    existing = list_partitions()
+    created = []
+    with connection.cursor() as cursor:
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            if month not in existing:
+                cursor.execute(create_partition_sql(month))
+                created.append(partition_name(month))
+    return created
+
+
+# Rétention : agrégats quotidiens puis suppression des événements détaillés
+
+def local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rollup_activity(start, end):
+    """
+    Agréger les journées (heure locale) qui recoupent [start, end)
+
+    Une journée déjà agrégée n'est jamais recalculée : ses événements
+    détaillés ont pu être en partie purgés depuis (suppression par paquets
+    interrompue, partition voisine supprimée) et un nouveau calcul ferait
+    baisser ses totaux. Les autres journées sont lues en entier, y compris
+    au-delà de `end` (partition suivante, encore présente). Sans `start`,
+    toutes les journées antérieures à `end` sont concernées.
+    """
+    last_day = timezone.localtime(end - timedelta(microseconds=1)).date()
+    events = UserActivity.objects.filter(created_at__lt=local_midnight(last_day + timedelta(days=1)))
+    done = UserActivityDaily.objects.filter(day__lte=last_day)
+    if start is not None:
+        first_day = timezone.localtime(start).date()
+        events = events.filter(created_at__gte=local_midnight(first_day))
+        done = done.filter(day__gte=first_day)
+    done = set(done.values_list('day', flat=True).distinct())
+
+    rows = (
+        events.annotate(day=TruncDate('created_at'))
+        .values('day', 'activity_type')
+        .annotate(events=Count('id'), unique_users=Count('user_id', distinct=True))
+        .order_by()
+    )
+    rollups = [
+        UserActivityDaily(day=row['day'], activity_type=row['activity_type'],
+                          events=row['events'], unique_users=row['unique_users'])
+        for row in rows
+        if row['day'] not in done
+    ]
+    UserActivityDaily.objects.bulk_create(rollups, batch_size=1000, ignore_conflicts=True)
+    return len({rollup.day for rollup in rollups})
+
+
+def apply_retention(retention_months=6):
+    """
+    Agréger puis purger les événements antérieurs à la fenêtre de rétention
+
+    Sur PostgreSQL partitionné, chaque mois expiré est agrégé puis sa
+    partition est supprimée (DROP TABLE, sans DELETE ligne à ligne ni
+    VACUUM). Ailleurs, les événements sont supprimés par paquets.
+
+    Returns:
+        dict: {'days': jours agrégés, 'deleted': événements ou partitions supprimés}
+    """
+    cutoff = add_months(month_start(timezone.localdate()), -retention_months)
+    cutoff_at = local_midnight(cutoff)
+    stats = {'days': 0, 'deleted': 0}
+
+    if is_partitioned():
+        for month, name in sorted(list_partitions().items()):
+            if month >= cutoff:
+                break
+            # Bornes des partitions en UTC (fuseau de la connexion avec USE_TZ)
+            start = datetime.combine(month, time.min, tzinfo=dt_timezone.utc)
+            end = datetime.combine(add_months(month, 1), time.min, tzinfo=dt_timezone.utc)
+            with transaction.atomic():
+                stats['days'] += rollup_activity(start, end)
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE {connection.ops.quote_name(name)}")
+            stats['deleted'] += 1
+        return stats
+
+    expired = UserActivity.objects.filter(created_at__lt=cutoff_at)
+    with transaction.atomic():
+        stats['days'] = rollup_activity(None, cutoff_at)
+    while True:
+        ids = list(expired.order_by().values_list('pk', flat=True)[:DELETE_CHUNK_SIZE])
+        if not ids:
+            break
+        stats['deleted'] += UserActivity.objects.filter(pk__in=ids).delete()[0]
+    return stats
@@ -0,0 +1,139 @@
+import uuid
+from dataclasses import dataclass, field
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from checkout.models import Cart, CartItem
+
+from .loyalty import TIER_VERSION_CACHE_KEY
+from .models import LOYALTY_DISCOUNTS, Notification
+from .notifications import UNREAD_CACHE_KEY, UNREAD_TIMEOUT, get_unread_count
+
+
+CONTEXT_CACHE_KEY = 'user_context:{}'
+CONTEXT_VERSION_CACHE_KEY = 'user_context:version:{}'
+CONTEXT_TIMEOUT = 60 * 60
+
+DEFAULT_PREFERENCES = {
+    'email_notifications': True,
+    'push_notifications': True,
+    'preferred_shipping_method': 'standard',
+    'default_ice_cream_size': 'medium',
+}
+
+
+@dataclass
+class UserContext:
+    """Données de l'en-tête communes à toutes les pages (base.html)"""
+    is_authenticated: bool = False
+    loyalty_tier: str = 'bronze'
+    loyalty_points: int = 0
+    cart_items: int = 0
+    unread_notifications: int = 0
+    preferences: dict = field(default_factory=lambda: dict(DEFAULT_PREFERENCES))
+
+    @property
+    def loyalty_discount(self):
+        return LOYALTY_DISCOUNTS.get(self.loyalty_tier, 0)
+
+
+def bump_user_context(user_ids):
+    """Invalider le contexte en cache de ces utilisateurs, une fois la transaction validée"""
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    if user_ids:
+        transaction.on_commit(lambda: cache.set_many(
+            {CONTEXT_VERSION_CACHE_KEY.format(user_id): uuid.uuid4().hex for user_id in user_ids},
+            None,
+        ))
+
+
+def _query_user_context(user_id):
+    latest_cart = Cart.objects.filter(user_id=OuterRef(OuterRef('pk'))).order_by('-updated_at').values('pk')[:1]
+    cart_items = (
+        CartItem.objects.filter(cart_id=Subquery(latest_cart))
+        .order_by()
+        .values('cart_id')
+        .annotate(total=Sum('quantity'))
+        .values('total')[:1]
+    )
+    unread = (
+        Notification.objects.filter(user_id=OuterRef('pk'), is_read=False)
+        .order_by()
+        .values('user_id')
+        .annotate(total=Count('pk'))
+        .values('total')[:1]
+    )
+    row = (
+        User.objects.filter(pk=user_id)
+        .annotate(
+            cart_items=Coalesce(Subquery(cart_items, output_field=IntegerField()), 0),
+            unread=Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+        )
+        .values(
+            'profile__loyalty_tier', 'profile__loyalty_points', 'cart_items', 'unread',
+            *[f'preferences__{name}' for name in DEFAULT_PREFERENCES],
+        )
+        .first()
+    )
+    if row is None:
+        return None
+    preferences = {
+        name: row[f'preferences__{name}'] if row[f'preferences__{name}'] is not None else default
+        for name, default in DEFAULT_PREFERENCES.items()
+    }
+    return UserContext(
+        is_authenticated=True,
+        loyalty_tier=row['profile__loyalty_tier'] or 'bronze',
+        loyalty_points=row['profile__loyalty_points'] or 0,
+        cart_items=row['cart_items'],
+        unread_notifications=row['unread'],
+        preferences=preferences,
+    )
+
+
+def load_user_context(user):
+    """
+    Contexte de l'utilisateur : une lecture de cache, une requête au plus
+
+    Le profil, les préférences et le nombre d'articles du panier sont mis en
+    cache sous une version propre à l'utilisateur, changée par les écritures
+    concernées ; les niveaux recalculés en masse changent la version globale
+    des niveaux. Le compteur de notifications non lues a son propre cache,
+    entretenu par incréments. Toutes les clés sont lues en un seul get_many.
+    """
+    if not user.is_authenticated:
+        return UserContext()
+
+    context_key = CONTEXT_CACHE_KEY.format(user.pk)
+    version_key = CONTEXT_VERSION_CACHE_KEY.format(user.pk)
+    unread_key = UNREAD_CACHE_KEY.format(user.pk)
+    cached = cache.get_many([context_key, version_key, unread_key, TIER_VERSION_CACHE_KEY])
+    version = (cached.get(version_key), cached.get(TIER_VERSION_CACHE_KEY))
+
+    entry = cached.get(context_key)
+    if entry is not None and entry[0] == version:
+        context = entry[1]
+        unread = cached.get(unread_key)
+        if unread is None:
+            unread = get_unread_count(user.pk)
+        context.unread_notifications = max(unread, 0)
+        return context
+
+    context = _query_user_context(user.pk)
+    if context is None:
+        return UserContext()
+    # Version lue avant la requête : une écriture concurrente rend l'entrée aussitôt périmée
+    cache.set(context_key, (version, context), CONTEXT_TIMEOUT)
+    cache.add(unread_key, context.unread_notifications, UNREAD_TIMEOUT)
+    return context
+
+
+def get_user_context(request):
+    """Contexte partagé par la vue et les templates de la requête (chargé une seule fois)"""
+    if not hasattr(request, '_user_context'):
+        request._user_context = load_user_context(request.user)
+    return request._user_context
@@ -0,0 +1,8 @@
+from django.utils.functional import SimpleLazyObject
+
+from .context import get_user_context
+
+
+def user_context(request):
+    """Contexte utilisateur de base.html, chargé seulement si le template l'utilise"""
+    return {'user_context': SimpleLazyObject(lambda: get_user_context(request))}
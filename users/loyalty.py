@@ -0,0 +1,204 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThanOrEqual
+from django.utils import timezone
+
+from .models import LOYALTY_TIER_THRESHOLDS, LoyaltyTransaction, UserProfile, loyalty_tier_for
+
+
+TIER_CACHE_KEY = 'loyalty:tier:{}:{}'
+TIER_VERSION_CACHE_KEY = 'loyalty:tiers_version'
+TIER_TIMEOUT = 60 * 60
+
+
+class InsufficientPointsError(Exception):
+    """Solde de points insuffisant pour l'utilisation demandée"""
+
+
+def tier_case(points):
+    """Expression SQL du niveau de fidélité pour un nombre de points (CASE sur les seuils)"""
+    return Case(
+        *[When(GreaterThanOrEqual(points, threshold), then=Value(tier)) for tier, threshold in LOYALTY_TIER_THRESHOLDS],
+        default=Value('bronze'),
+    )
+
+
+def points_validity():
+    return timedelta(days=getattr(settings, 'LOYALTY_POINTS_VALIDITY_DAYS', 365))
+
+
+def record_points(user_id, points, kind='earn', order=None, description=''):
+    """
+    Enregistrer un mouvement de points et mettre à jour le solde
+
+    Le solde et le niveau sont modifiés par un seul UPDATE (incrément F et
+    CASE sur le nouveau solde) : deux commandes terminées en même temps ne
+    perdent aucun point. Une utilisation n'est appliquée que si le solde la
+    couvre.
+
+    Raises:
+        InsufficientPointsError: Si le solde est insuffisant
+
+    Returns:
+        tuple: (nouveau solde, nouveau niveau)
+    """
+    from .context import bump_user_context
+
+    new_balance = F('loyalty_points') + points
+    with transaction.atomic():
+        profiles = UserProfile.objects.filter(user_id=user_id)
+        if points < 0:
+            profiles = profiles.filter(loyalty_points__gte=-points)
+        if not profiles.update(loyalty_points=new_balance, loyalty_tier=tier_case(new_balance),
+                               updated_at=timezone.now()):
+            raise InsufficientPointsError("Solde de points insuffisant")
+        LoyaltyTransaction.objects.create(
+            user_id=user_id,
+            kind=kind,
+            points=points,
+            order=order,
+            description=description,
+            expires_at=timezone.now() + points_validity() if kind == 'earn' else None,
+        )
+        balance, tier = UserProfile.objects.filter(user_id=user_id).values_list('loyalty_points', 'loyalty_tier').get()
+        bump_user_context([user_id])
+    cache.set(_tier_cache_key(user_id), tier, TIER_TIMEOUT)
+    return balance, tier
+
+
+def _tier_version():
+    version = cache.get(TIER_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(TIER_VERSION_CACHE_KEY, 1, None)
+        version = cache.get(TIER_VERSION_CACHE_KEY, 1)
+    return version
+
+
+def _tier_cache_key(user_id):
+    return TIER_CACHE_KEY.format(_tier_version(), user_id)
+
+
+def get_loyalty_tier(user_id):
+    """Niveau de fidélité en cache (une requête au premier accès)"""
+    cache_key = _tier_cache_key(user_id)
+    tier = cache.get(cache_key)
+    if tier is None:
+        points = UserProfile.objects.filter(user_id=user_id).values_list('loyalty_points', flat=True).first()
+        tier = loyalty_tier_for(points or 0)
+        cache.set(cache_key, tier, TIER_TIMEOUT)
+    return tier
+
+
+def invalidate_tier_cache():
+    """Changer de version : tous les niveaux en cache sont relus"""
+    try:
+        cache.incr(TIER_VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(TIER_VERSION_CACHE_KEY, 2, None)
+
+
+def expire_points(now=None):
+    """
+    Faire expirer en masse les points arrivés à échéance
+
+    Les utilisations sont imputées aux gains les plus anciens (FIFO) : seule
+    la part non utilisée d'un gain échu expire, et les points gagnés plus
+    récemment restent intacts. Le total à expirer est recalculé sur tout le
+    registre de l'utilisateur, moins les expirations déjà passées, ce qui
+    rend le traitement rejouable. Un INSERT groupé pour les mouvements
+    d'expiration, un UPDATE pour marquer les gains échus et un UPDATE (CASE)
+    pour les soldes et les niveaux, recalculés sur le nouveau solde comme
+    dans record_points.
+
+    Returns:
+        int: Nombre d'utilisateurs concernés
+    """
+    from .context import bump_user_context
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = LoyaltyTransaction.objects.filter(kind='earn', is_expired=False, expires_at__lte=now)
+        user_ids = set(due.values_list('user_id', flat=True).distinct())
+        if not user_ids:
+            return 0
+        balances = dict(
+            UserProfile.objects.select_for_update()
+            .filter(user_id__in=user_ids)
+            .values_list('user_id', 'loyalty_points')
+        )
+        ledger = LoyaltyTransaction.objects.filter(user_id__in=user_ids).order_by()
+        used = dict(
+            ledger.filter(points__lt=0, kind__in=['redeem', 'adjust'])
+            .values('user_id').annotate(total=Sum('points')).values_list('user_id', 'total')
+        )
+        expired = dict(
+            ledger.filter(kind='expire').values('user_id').annotate(total=Sum('points')).values_list('user_id', 'total')
+        )
+        lots = (
+            ledger.filter(kind='earn')
+            .order_by('user_id', 'expires_at', 'created_at', 'pk')
+            .values_list('user_id', 'points', 'is_expired', 'expires_at')
+        )
+
+        # Part non utilisée des gains échus (déjà expirés ou échus maintenant), en FIFO
+        remaining_use = {user_id: -used.get(user_id, 0) for user_id in user_ids}
+        unused_due = dict.fromkeys(user_ids, 0)
+        for user_id, points, is_expired, expires_at in lots:
+            consumed = min(points, remaining_use[user_id])
+            remaining_use[user_id] -= consumed
+            if is_expired or (expires_at is not None and expires_at <= now):
+                unused_due[user_id] += points - consumed
+
+        amounts = {
+            user_id: min(unused - (-expired.get(user_id, 0)), balances.get(user_id, 0))
+            for user_id, unused in unused_due.items()
+        }
+        amounts = {user_id: points for user_id, points in amounts.items() if points > 0}
+
+        due.update(is_expired=True)
+        if amounts:
+            LoyaltyTransaction.objects.bulk_create([
+                LoyaltyTransaction(user_id=user_id, kind='expire', points=-points, description="Expiration des points")
+                for user_id, points in amounts.items()
+            ], batch_size=1000)
+            new_balance = Case(
+                *[When(user_id=user_id, then=F('loyalty_points') - points) for user_id, points in amounts.items()],
+                default=F('loyalty_points'),
+                output_field=IntegerField(),
+            )
+            UserProfile.objects.filter(user_id__in=amounts).update(
+                loyalty_points=new_balance,
+                loyalty_tier=tier_case(new_balance),
+                updated_at=now,
+            )
+            bump_user_context(amounts)
+    cache.delete_many([_tier_cache_key(user_id) for user_id in amounts])
+    return len(amounts)
+
+
+def recompute_tiers():
+    """Recalculer le niveau de tous les profils en une requête"""
+    updated = UserProfile.objects.exclude(loyalty_tier=tier_case(F('loyalty_points'))).update(
+        loyalty_tier=tier_case(F('loyalty_points')),
+    )
+    invalidate_tier_cache()
+    return updated
+
+
+def rebuild_balances():
+    """Reconstruire tous les soldes à partir du registre (audit, réparation)"""
+    ledger_total = Subquery(
+        LoyaltyTransaction.objects.filter(user_id=OuterRef('user_id'))
+        .values('user_id')
+        .annotate(total=Sum('points'))
+        .values('total')[:1],
+        output_field=IntegerField(),
+    )
+    updated = UserProfile.objects.update(loyalty_points=Coalesce(ledger_total, Value(0)))
+    recompute_tiers()
+    return updated
@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compter les requêtes d\'une connexion et vérifier qu\'elle ne réécrit pas le profil utilisateur'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-queries', type=int, default=None,
+                            help='Échouer si la connexion dépasse ce nombre de requêtes')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user('benchmark-login', 'benchmark-login@example.com', 'benchmark-password')
+                client = Client()
+                with CaptureQueriesContext(connection) as context:
+                    client.force_login(user)
+                queries = [query['sql'] for query in context.captured_queries]
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        profile_writes = [sql for sql in queries if sql.startswith('UPDATE') and 'users_userprofile' in sql]
+        for sql in queries:
+            self.stdout.write(f"  {sql[:120]}")
+        self.stdout.write(f"{len(queries)} requêtes, dont {len(profile_writes)} écriture(s) du profil")
+
+        if profile_writes:
+            raise CommandError("La connexion réécrit le profil utilisateur")
+        if options['max_queries'] is not None and len(queries) > options['max_queries']:
+            raise CommandError(f"{len(queries)} requêtes (maximum {options['max_queries']})")
+        self.stdout.write(self.style.SUCCESS("Aucune écriture du profil à la connexion"))
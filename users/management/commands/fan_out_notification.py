@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from users.models import Notification
+from users.notifications import SEGMENTS, fan_out, segment_user_ids
+
+
+class Command(BaseCommand):
+    help = "Envoyer une notification à tous les utilisateurs d'un segment"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--segment', choices=sorted(SEGMENTS), default='newsletter')
+        parser.add_argument('--type', dest='notification_type', default='promotion',
+                            choices=[value for value, _ in Notification.NOTIFICATION_TYPES])
+        parser.add_argument('--title', required=True)
+        parser.add_argument('--message', required=True)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = fan_out(
+            segment_user_ids(options['segment']),
+            options['notification_type'],
+            options['title'],
+            options['message'],
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"{created} notifications créées"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from users.loyalty import expire_points, rebuild_balances, recompute_tiers
+
+
+class Command(BaseCommand):
+    help = 'Traitement nocturne de la fidélité : expiration des points puis recalcul des niveaux'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Reconstruire les soldes à partir du registre')
+
+    def handle(self, *args, **options):
+        expired = expire_points()
+        self.stdout.write(f"Points expirés pour {expired} utilisateurs")
+        if options['rebuild']:
+            self.stdout.write(f"{rebuild_balances()} soldes reconstruits")
+        self.stdout.write(self.style.SUCCESS(f"{recompute_tiers()} niveaux modifiés"))
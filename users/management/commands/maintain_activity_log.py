@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.activity import apply_retention, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = "Maintenance du journal d'activité : partitions à venir, agrégats quotidiens et purge"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=2, help='Partitions mensuelles à créer à l\'avance')
+        parser.add_argument(
+            '--retention-months', type=int,
+            default=getattr(settings, 'ACTIVITY_RETENTION_MONTHS', 6),
+            help='Mois d\'événements détaillés conservés',
+        )
+
+    def handle(self, *args, **options):
+        for name in ensure_partitions(options['months_ahead']):
+            self.stdout.write(f"Partition créée : {name}")
+        stats = apply_retention(options['retention_months'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['days']} agrégats quotidiens, {stats['deleted']} suppressions"
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.notifications import enqueue_notification_digests
+
+
+class Command(BaseCommand):
+    help = 'Regrouper les notifications non envoyées en un email récapitulatif par utilisateur'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Tourner en continu (worker)')
+        parser.add_argument('--interval', type=float, default=3600, help='Secondes entre deux passages')
+
+    def handle(self, *args, **options):
+        while True:
+            total_emails = total_notifications = 0
+            while True:
+                emails, notifications = enqueue_notification_digests()
+                if not notifications:
+                    break
+                total_emails += emails
+                total_notifications += notifications
+            self.stdout.write(f"{total_emails} récapitulatifs en file ({total_notifications} notifications)")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
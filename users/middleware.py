@@ -0,0 +1,39 @@
+from .activity import record_activity
+
+
+# Vues journalisées : nom de la route -> type d'activité
+TRACKED_VIEWS = {
+    'products:product_detail': 'product_view',
+    'checkout:add_to_cart': 'add_to_cart',
+}
+
+
+class UserActivityMiddleware:
+    """
+    Journaliser les vues produit et ajouts au panier des utilisateurs connectés
+
+    Placé en middleware plutôt que dans les vues : la page produit est servie
+    depuis le cache (cache_page) sans exécuter la vue. L'écriture est différée
+    et groupée par users.activity.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        match = request.resolver_match
+        if (
+            match is not None
+            and match.view_name in TRACKED_VIEWS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            record_activity(
+                request.user,
+                TRACKED_VIEWS[match.view_name],
+                request.path,
+                metadata=dict(match.kwargs),
+                request=request,
+            )
+        return response
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def record_opening_balances(apps, schema_editor):
+    # Solde existant repris comme premier mouvement : le registre permet de reconstruire les soldes
+    UserProfile = apps.get_model('users', 'UserProfile')
+    LoyaltyTransaction = apps.get_model('users', 'LoyaltyTransaction')
+    LoyaltyTransaction.objects.bulk_create([
+        LoyaltyTransaction(user_id=user_id, kind='adjust', points=points, description="Solde d'ouverture")
+        for user_id, points in UserProfile.objects.filter(loyalty_points__gt=0).values_list('user_id', 'loyalty_points')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('checkout', '0012_order_item_customizations'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoyaltyTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('earn', 'Gain'), ('redeem', 'Utilisation'), ('expire', 'Expiration'), ('adjust', 'Ajustement')], max_length=20, verbose_name='Type')),
+                ('points', models.IntegerField(verbose_name='Points')),
+                ('description', models.CharField(blank=True, max_length=255, verbose_name='Description')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='Expire le')),
+                ('is_expired', models.BooleanField(default=False, verbose_name='Expiré')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loyalty_transactions', to='checkout.order', verbose_name='Commande')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loyalty_transactions', to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+            ],
+            options={
+                'verbose_name': 'Mouvement de points',
+                'verbose_name_plural': 'Mouvements de points',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'created_at'], name='users_loyal_user_id_80a12c_idx'), models.Index(fields=['is_expired', 'expires_at'], name='users_loyal_is_expi_3d259d_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
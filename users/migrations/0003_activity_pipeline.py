@@ -0,0 +1,81 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def partition_activity_table(apps, schema_editor):
+    """
+    PostgreSQL : convertir users_useractivity en table partitionnée par mois
+
+    La clé primaire devient (id, created_at), la clé de partition devant en
+    faire partie. Une partition est créée pour chaque mois déjà présent et
+    pour les deux mois à venir ; une partition par défaut reçoit le reste.
+    Sans effet sur les autres bases (SQLite en développement).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    execute = schema_editor.execute
+    execute("ALTER TABLE users_useractivity RENAME TO users_useractivity_old")
+    execute(
+        "CREATE TABLE users_useractivity (LIKE users_useractivity_old INCLUDING DEFAULTS INCLUDING IDENTITY) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    execute("ALTER TABLE users_useractivity ADD PRIMARY KEY (id, created_at)")
+    execute(
+        "ALTER TABLE users_useractivity ADD CONSTRAINT users_useractivity_user_id_fk "
+        "FOREIGN KEY (user_id) REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED"
+    )
+    execute("CREATE INDEX users_useractivity_user_id_idx ON users_useractivity (user_id)")
+    execute("CREATE INDEX users_useractivity_created_at_idx ON users_useractivity (created_at)")
+    execute(
+        "DO $$ DECLARE month date; BEGIN "
+        "FOR month IN SELECT generate_series("
+        "  date_trunc('month', LEAST((SELECT MIN(created_at) FROM users_useractivity_old), now())),"
+        "  date_trunc('month', now()) + interval '2 months', interval '1 month')::date LOOP "
+        "  EXECUTE format('CREATE TABLE users_useractivity_p%s PARTITION OF users_useractivity "
+        "    FOR VALUES FROM (%L) TO (%L)', to_char(month, 'YYYYMM'), month, month + interval '1 month'); "
+        "END LOOP; END $$"
+    )
+    execute("CREATE TABLE users_useractivity_default PARTITION OF users_useractivity DEFAULT")
+    execute("INSERT INTO users_useractivity SELECT * FROM users_useractivity_old")
+    execute(
+        "SELECT setval(pg_get_serial_sequence('users_useractivity', 'id'), "
+        "COALESCE((SELECT MAX(id) FROM users_useractivity_old), 0) + 1, false)"
+    )
+    execute("DROP TABLE users_useractivity_old")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_loyalty_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserActivityDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Jour')),
+                ('activity_type', models.CharField(choices=[('login', 'Connexion'), ('product_view', 'Vue produit'), ('add_to_cart', 'Ajout au panier'), ('purchase', 'Achat'), ('review', 'Avis'), ('wishlist_add', 'Ajout liste de souhaits'), ('coupon_used', 'Utilisation coupon')], max_length=20, verbose_name="Type d'activité")),
+                ('events', models.PositiveIntegerField(default=0, verbose_name='Événements')),
+                ('unique_users', models.PositiveIntegerField(default=0, verbose_name='Utilisateurs distincts')),
+            ],
+            options={
+                'verbose_name': 'Activité quotidienne',
+                'verbose_name_plural': 'Activités quotidiennes',
+                'ordering': ['-day', 'activity_type'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='useractivity',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddConstraint(
+            model_name='useractivitydaily',
+            constraint=models.UniqueConstraint(fields=('day', 'activity_type'), name='unique_activity_day_type'),
+        ),
+        migrations.RunPython(partition_activity_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_volume'),
+        ('users', '0004_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='favorite_flavor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.flavor', verbose_name='Parfum le plus commandé'),
+        ),
+    ]
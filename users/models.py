@@ -1,11 +1,34 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import m2m_changed, post_save
 from django.dispatch import receiver
 from django.utils import timezone
 from datetime import timedelta
 
 
+# Seuils des niveaux de fidélité, du plus élevé au plus bas
+LOYALTY_TIER_THRESHOLDS = [
+    ('platinum', 1000),
+    ('gold', 500),
+    ('silver', 200),
+]
+
+LOYALTY_DISCOUNTS = {
+    'bronze': 0,
+    'silver': 5,
+    'gold': 10,
+    'platinum': 15,
+}
+
+
+def loyalty_tier_for(points):
+    for tier, threshold in LOYALTY_TIER_THRESHOLDS:
+        if points >= threshold:
+            return tier
+    return 'bronze'
+
+
 class UserProfile(models.Model):
     """Profil utilisateur étendu"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile', verbose_name="Utilisateur")
@@ -39,10 +62,12 @@ class UserProfile(models.Model):
         verbose_name="Niveau de fidélité"
     )
     
-    # Statistiques
+    # Statistiques (commandes payées, tenues à jour par checkout.order_stats)
     total_orders = models.PositiveIntegerField(default=0, verbose_name="Total des commandes")
     total_spent = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Total dépensé")
     last_order_date = models.DateTimeField(blank=True, null=True, verbose_name="Date de dernière commande")
+    favorite_flavor = models.ForeignKey('products.Flavor', on_delete=models.SET_NULL, blank=True, null=True,
+                                        related_name='+', verbose_name="Parfum le plus commandé")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -54,38 +79,107 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"Profil de {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        # Champs différés lus à la demande : valeurs de la base, pas des modifications
+        if hasattr(self, '_loaded_values'):
+            self._loaded_values.update({
+                field.attname: self.__dict__[field.attname] for field in self._meta.concrete_fields
+                if field.attname in self.__dict__ and (fields is None or field.attname in fields or field.name in fields)
+            })
+
+    def get_dirty_fields(self):
+        """
+        Champs modifiés depuis le chargement (tous si le profil n'a pas été chargé de la base)
+
+        Un champ différé (.only(), .defer()) qui a été affecté depuis est
+        considéré comme modifié.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        return [
+            field.name for field in self._meta.concrete_fields
+            if (getattr(self, field.attname) != loaded[field.attname] if field.attname in loaded
+                else field.attname in self.__dict__)
+        ]
+
+    def save(self, *args, **kwargs):
+        # Enregistrement partiel : seuls les champs modifiés sont écrits, et
+        # rien du tout si aucun ne l'a été.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            dirty = self.get_dirty_fields()
+            if dirty is not None:
+                if not dirty:
+                    return
+                kwargs['update_fields'] = dirty + ['updated_at']
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+        }
+
     @property
     def age(self):
         if self.birth_date:
             return (timezone.now().date() - self.birth_date).days // 365
         return None
 
-    def add_loyalty_points(self, points):
-        """Ajouter des points de fidélité"""
-        self.loyalty_points += points
-        self.update_loyalty_tier()
-        self.save()
+    def add_loyalty_points(self, points, kind='earn', order=None, description=''):
+        """Ajouter (ou retirer) des points de fidélité via le registre"""
+        from .loyalty import record_points
+        self.loyalty_points, self.loyalty_tier = record_points(
+            self.user_id, points, kind=kind, order=order, description=description,
+        )
+        # Valeurs déjà en base : un save() ultérieur ne doit pas les réécrire
+        if hasattr(self, '_loaded_values'):
+            self._loaded_values.update(loyalty_points=self.loyalty_points, loyalty_tier=self.loyalty_tier)
 
     def update_loyalty_tier(self):
         """Mettre à jour le niveau de fidélité basé sur les points"""
-        if self.loyalty_points >= 1000:
-            self.loyalty_tier = 'platinum'
-        elif self.loyalty_points >= 500:
-            self.loyalty_tier = 'gold'
-        elif self.loyalty_points >= 200:
-            self.loyalty_tier = 'silver'
-        else:
-            self.loyalty_tier = 'bronze'
+        self.loyalty_tier = loyalty_tier_for(self.loyalty_points)
 
     def get_loyalty_discount(self):
-        """Obtenir la remise de fidélité"""
-        discounts = {
-            'bronze': 0,
-            'silver': 5,
-            'gold': 10,
-            'platinum': 15,
-        }
-        return discounts.get(self.loyalty_tier, 0)
+        """Obtenir la remise de fidélité (niveau lu en cache)"""
+        from .loyalty import get_loyalty_tier
+        return LOYALTY_DISCOUNTS.get(get_loyalty_tier(self.user_id), 0)
+
+
+class LoyaltyTransaction(models.Model):
+    """Registre des mouvements de points de fidélité (ajout seul)"""
+    KIND_CHOICES = [
+        ('earn', 'Gain'),
+        ('redeem', 'Utilisation'),
+        ('expire', 'Expiration'),
+        ('adjust', 'Ajustement'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='loyalty_transactions', verbose_name="Utilisateur")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Type")
+    points = models.IntegerField(verbose_name="Points")
+    order = models.ForeignKey('checkout.Order', on_delete=models.SET_NULL, blank=True, null=True,
+                              related_name='loyalty_transactions', verbose_name="Commande")
+    description = models.CharField(max_length=255, blank=True, verbose_name="Description")
+    expires_at = models.DateTimeField(blank=True, null=True, verbose_name="Expire le")
+    is_expired = models.BooleanField(default=False, verbose_name="Expiré")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Mouvement de points"
+        verbose_name_plural = "Mouvements de points"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            models.Index(fields=['is_expired', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.points:+d} ({self.get_kind_display()})"
 
 
 @receiver(post_save, sender=User)
@@ -96,9 +190,31 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Sauvegarder le profil utilisateur"""
-    instance.profile.save()
+def save_user_profile(sender, instance, created, **kwargs):
+    """
+    Sauvegarder le profil s'il a été chargé et modifié
+
+    Une connexion enregistre User (last_login) : le profil n'est alors ni
+    relu ni réécrit, sauf si le code appelant l'a chargé et modifié.
+    """
+    if not created and User.profile.is_cached(instance):
+        instance.profile.save()
+
+
+@receiver(user_logged_in)
+def record_login_activity(sender, request, user, **kwargs):
+    """Journaliser la connexion (écriture groupée en arrière-plan)"""
+    from .activity import record_activity
+    record_activity(user, 'login', "Connexion", request=request)
+
+
+def get_profile(user):
+    """Profil de l'utilisateur, créé à la volée pour les comptes qui n'en ont pas"""
+    if User.profile.is_cached(user):
+        return user.profile
+    profile, _ = UserProfile.objects.get_or_create(user=user)
+    user.profile = profile
+    return profile
 
 
 class UserActivity(models.Model):
@@ -119,7 +235,8 @@ class UserActivity(models.Model):
     metadata = models.JSONField(default=dict, blank=True, verbose_name="Métadonnées")
     ip_address = models.GenericIPAddressField(blank=True, null=True, verbose_name="Adresse IP")
     user_agent = models.TextField(blank=True, verbose_name="User Agent")
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Horodatage de l'événement (les écritures sont groupées et différées)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
         verbose_name = "Activité utilisateur"
@@ -130,6 +247,25 @@ class UserActivity(models.Model):
         return f"{self.user.username} - {self.get_activity_type_display()}"
 
 
+class UserActivityDaily(models.Model):
+    """Agrégat quotidien des activités, conservé après la purge des événements détaillés"""
+    day = models.DateField(verbose_name="Jour")
+    activity_type = models.CharField(max_length=20, choices=UserActivity.ACTIVITY_TYPES, verbose_name="Type d'activité")
+    events = models.PositiveIntegerField(default=0, verbose_name="Événements")
+    unique_users = models.PositiveIntegerField(default=0, verbose_name="Utilisateurs distincts")
+
+    class Meta:
+        verbose_name = "Activité quotidienne"
+        verbose_name_plural = "Activités quotidiennes"
+        ordering = ['-day', 'activity_type']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'activity_type'], name='unique_activity_day_type'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.activity_type}: {self.events}"
+
+
 class ReferralProgram(models.Model):
     """Programme de parrainage"""
     referrer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='referrals_sent', verbose_name="Parrain")
@@ -172,16 +308,22 @@ class Notification(models.Model):
         verbose_name = "Notification"
         verbose_name_plural = "Notifications"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'is_read']),
+            models.Index(fields=['is_sent', 'created_at']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.title}"
 
     def mark_as_read(self):
-        """Marquer comme lu"""
-        if not self.is_read:
-            self.is_read = True
-            self.read_at = timezone.now()
-            self.save()
+        """Marquer comme lu (UPDATE conditionnel, compteur non lu décrémenté)"""
+        if self.is_read:
+            return
+        from .notifications import mark_read
+        self.read_at = timezone.now()
+        self.is_read = True
+        mark_read(self.user_id, [self.pk], now=self.read_at)
 
 
 class UserPreference(models.Model):
@@ -229,3 +371,26 @@ class UserPreference(models.Model):
 
     def __str__(self):
         return f"Préférences de {self.user.username}"
+
+
+@receiver(m2m_changed, sender=UserProfile.favorite_flavors.through)
+@receiver(m2m_changed, sender=UserProfile.dietary_restrictions.through)
+def refresh_recommendations(sender, instance, action, reverse, **kwargs):
+    """Recalculer les recommandations après un changement de parfums préférés ou de restrictions"""
+    from products.recommendations import bump_catalog_version, invalidate_recommendations
+
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Parfum ou allergène modifié côté catalogue : rare, tous les classements sont recalculés
+        bump_catalog_version()
+    else:
+        invalidate_recommendations([instance.user_id])
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=UserPreference)
+def refresh_user_context(sender, instance, **kwargs):
+    """Recharger le contexte d'en-tête (niveau, points, préférences)"""
+    from .context import bump_user_context
+    bump_user_context([instance.user_id])
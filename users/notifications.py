@@ -0,0 +1,194 @@
+from itertools import groupby, islice
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from analytics.models import CustomerSegment
+from caravela.push import publish
+
+from .models import Notification
+
+
+UNREAD_CACHE_KEY = 'notifications:unread:{}'
+UNREAD_TIMEOUT = 60 * 60 * 24
+FANOUT_CHUNK_SIZE = 1000
+DIGEST_BATCH_SIZE = 5000
+DIGEST_MAX_ITEMS = 20
+DIGEST_TEMPLATE = 'users/emails/notification_digest.html'
+
+# Segments de diffusion : filtre sur les utilisateurs actifs
+SEGMENTS = {
+    'all': Q(),
+    'newsletter': Q(profile__newsletter_subscription=True),
+    'email_opt_in': ~Q(preferences__email_notifications=False),
+    # Segments RFM calculés par analytics.rfm
+    **{f'rfm_{code}': Q(customer_segment__segment=code) for code, _ in CustomerSegment.SEGMENTS},
+}
+
+
+def get_unread_count(user_id):
+    """
+    Nombre de notifications non lues (badge de l'en-tête)
+
+    Le compteur est calculé une seule fois puis entretenu par incréments :
+    l'en-tête n'exécute pas de COUNT(*) à chaque page.
+    """
+    key = UNREAD_CACHE_KEY.format(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        cache.add(key, count, UNREAD_TIMEOUT)
+    return max(count, 0)
+
+
+def _adjust_unread(user_ids, delta):
+    for user_id in user_ids:
+        try:
+            cache.incr(UNREAD_CACHE_KEY.format(user_id), delta)
+        except ValueError:
+            # Compteur absent du cache : il sera recalculé à la prochaine lecture
+            pass
+
+
+def adjust_unread(user_ids, delta):
+    """Décaler les compteurs non lus une fois la transaction validée"""
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: _adjust_unread(user_ids, delta))
+
+
+def publish_notification(user_ids, notification_type, title, message):
+    """Pousser la notification aux utilisateurs connectés une fois la transaction validée"""
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: publish(user_ids, 'notification', {
+        'notification_type': notification_type,
+        'title': title,
+        'message': message,
+    }))
+
+
+def notify(user_id, notification_type, title, message, metadata=None):
+    """Créer une notification pour un utilisateur"""
+    notification = Notification.objects.create(
+        user_id=user_id,
+        notification_type=notification_type,
+        title=title,
+        message=message,
+        metadata=metadata or {},
+    )
+    adjust_unread([user_id], 1)
+    publish_notification([user_id], notification_type, title, message)
+    return notification
+
+
+def segment_user_ids(segment):
+    """Identifiants des utilisateurs d'un segment, lus en flux (sans tout charger en mémoire)"""
+    return (
+        User.objects.filter(SEGMENTS[segment], is_active=True)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+        .iterator(chunk_size=FANOUT_CHUNK_SIZE)
+    )
+
+
+def fan_out(user_ids, notification_type, title, message, metadata=None, chunk_size=FANOUT_CHUNK_SIZE):
+    """
+    Créer la même notification pour une liste d'utilisateurs
+
+    Les identifiants sont consommés par paquets de `chunk_size` : un
+    bulk_create et une transaction par paquet, la mémoire reste constante
+    quelle que soit la taille du segment.
+
+    Returns:
+        int: Nombre de notifications créées
+    """
+    user_ids = iter(user_ids)
+    metadata = metadata or {}
+    created = 0
+    while True:
+        chunk = list(islice(user_ids, chunk_size))
+        if not chunk:
+            break
+        with transaction.atomic():
+            Notification.objects.bulk_create([
+                Notification(
+                    user_id=user_id,
+                    notification_type=notification_type,
+                    title=title,
+                    message=message,
+                    metadata=metadata,
+                )
+                for user_id in chunk
+            ], batch_size=chunk_size)
+            adjust_unread(chunk, 1)
+            # Un seul message par paquet : chaque serveur ne livre qu'à ses connexions
+            publish_notification(chunk, notification_type, title, message)
+        created += len(chunk)
+    return created
+
+
+def mark_read(user_id, notification_ids, now=None):
+    """Marquer des notifications comme lues ; retourne le nombre de notifications modifiées"""
+    updated = Notification.objects.filter(
+        user_id=user_id, pk__in=notification_ids, is_read=False,
+    ).update(is_read=True, read_at=now or timezone.now())
+    if updated:
+        adjust_unread([user_id], -updated)
+    return updated
+
+
+def mark_all_read(user_id):
+    """Tout marquer comme lu en un seul UPDATE et remettre le compteur à zéro"""
+    updated = Notification.objects.filter(user_id=user_id, is_read=False).update(
+        is_read=True, read_at=timezone.now(),
+    )
+    transaction.on_commit(lambda: cache.set(UNREAD_CACHE_KEY.format(user_id), 0, UNREAD_TIMEOUT))
+    return updated
+
+
+def enqueue_notification_digests(batch_size=DIGEST_BATCH_SIZE):
+    """
+    Regrouper les notifications non envoyées en un email par utilisateur
+
+    Les notifications sont verrouillées (skip_locked : deux workers ne
+    préparent pas le même récapitulatif), les emails sont mis en file dans
+    l'outbox et les notifications marquées envoyées par un seul UPDATE.
+
+    Returns:
+        tuple: (emails mis en file, notifications regroupées)
+    """
+    from checkout.models import OutboundEmail
+
+    with transaction.atomic():
+        rows = list(
+            Notification.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(is_sent=False)
+            .exclude(user__preferences__email_notifications=False)
+            .exclude(user__email='')
+            .order_by('user_id', 'created_at')
+            .values_list('pk', 'user_id', 'user__email', 'user__first_name', 'title', 'message')[:batch_size]
+        )
+        if not rows:
+            return 0, 0
+
+        emails = []
+        for (user_id, email, first_name), items in groupby(rows, key=lambda row: row[1:4]):
+            items = list(items)
+            emails.append(OutboundEmail(
+                to_email=email,
+                subject=f"Vos {len(items)} nouvelles notifications - La Caravela",
+                template_name=DIGEST_TEMPLATE,
+                context={
+                    'first_name': first_name,
+                    'notifications': [
+                        {'title': title, 'message': message}
+                        for _, _, _, _, title, message in items[:DIGEST_MAX_ITEMS]
+                    ],
+                    'remaining': max(len(items) - DIGEST_MAX_ITEMS, 0),
+                },
+            ))
+        OutboundEmail.objects.bulk_create(emails)
+        Notification.objects.filter(pk__in=[row[0] for row in rows]).update(is_sent=True)
+    return len(emails), len(rows)
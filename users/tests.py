@@ -1,3 +1,74 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .loyalty import expire_points, get_loyalty_tier, record_points
+from .models import LoyaltyTransaction, UserProfile
+
+
+class LoginQueriesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('login', 'login@example.com', 'password')
+
+    def test_login_does_not_write_profile(self):
+        client = Client()
+        with self.assertNumQueries(15), CaptureQueriesContext(connection) as context:
+            client.force_login(self.user)
+        profile_writes = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('UPDATE') and 'users_userprofile' in query['sql']
+        ]
+        self.assertEqual(profile_writes, [])
+
+
+class ProfileDirtyFieldsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dirty', 'dirty@example.com', 'password')
+
+    def test_unchanged_profile_is_not_saved(self):
+        profile = UserProfile.objects.get(user=self.user)
+        with self.assertNumQueries(0):
+            profile.save()
+
+    def test_assigned_deferred_field_is_saved(self):
+        profile = UserProfile.objects.only('pk', 'user').get(user=self.user)
+        profile.phone = '0600000000'
+        profile.save()
+        self.assertEqual(UserProfile.objects.get(pk=profile.pk).phone, '0600000000')
+
+    def test_deferred_field_read_on_access_is_not_saved(self):
+        profile = UserProfile.objects.defer('phone').get(user=self.user)
+        UserProfile.objects.filter(pk=profile.pk).update(phone='0611111111')
+        self.assertEqual(profile.phone, '0611111111')
+        profile.newsletter_subscription = False
+        with CaptureQueriesContext(connection) as context:
+            profile.save()
+        self.assertNotIn('"phone"', context.captured_queries[-1]['sql'])
+
+
+class LoyaltyExpiryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('fidele', 'fidele@example.com', 'password')
+
+    def test_fifo_expiry_downgrades_tier_once(self):
+        record_points(self.user.pk, 600, description="Ancienne commande")
+        LoyaltyTransaction.objects.filter(user=self.user).update(expires_at=timezone.now() - timedelta(days=1))
+        record_points(self.user.pk, 300, description="Commande récente")
+        # L'utilisation est imputée au gain le plus ancien : 400 points de ce gain expirent
+        self.assertEqual(record_points(self.user.pk, -200, kind='redeem'), (700, 'gold'))
+        self.assertEqual(get_loyalty_tier(self.user.pk), 'gold')
+
+        self.assertEqual(expire_points(), 1)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual((profile.loyalty_points, profile.loyalty_tier), (300, 'silver'))
+        self.assertEqual(get_loyalty_tier(self.user.pk), 'silver')
+
+        # Rejouer ne fait rien expirer de plus
+        self.assertEqual(expire_points(), 0)
+        self.assertEqual(UserProfile.objects.get(user=self.user).loyalty_points, 300)
@@ -6,6 +6,10 @@ app_name = 'users'
 urlpatterns = [
     path('profile/', views.profile_view, name='profile'),
     path('orders/', views.orders_view, name='orders'),
+    path('api/orders/', views.orders_api, name='orders_api'),
     path('wishlist/', views.wishlist_view, name='wishlist'),
+    path('notifications/unread-count/', views.notifications_unread_count, name='notifications_unread_count'),
+    path('notifications/mark-all-read/', views.notifications_mark_all_read, name='notifications_mark_all_read'),
+    path('events/', views.events_stream, name='events'),
     path('', views.custom_logout_view, name='logout'),
 ] 
\ No newline at end of file
@@ -1,7 +1,22 @@
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
 from django.contrib import messages
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+
+from caravela.push import hub
+from checkout.order_history import InvalidCursorError, order_history_page, serialize_order
+
+from .models import UserProfile
+from .notifications import get_unread_count, mark_all_read
 
 
 @login_required
@@ -30,10 +45,89 @@ def profile_view(request):
 @login_required
 def orders_view(request):
     """Vue des commandes de l'utilisateur"""
-    return render(request, 'users/orders.html')
+    try:
+        orders, next_cursor = order_history_page(request.user, cursor=request.GET.get('cursor'))
+    except InvalidCursorError:
+        return redirect('users:orders')
+    # Statistiques tenues à jour à chaque changement de statut : simple lecture du profil
+    profile = UserProfile.objects.select_related('favorite_flavor').filter(user=request.user).first()
+    return render(request, 'users/orders.html', {
+        'orders': orders,
+        'next_cursor': next_cursor,
+        'profile': profile,
+    })
+
+
+@login_required
+def orders_api(request):
+    """Historique de commandes en JSON (pagination par curseur)"""
+    try:
+        page_size = int(request.GET.get('page_size', 10))
+        orders, next_cursor = order_history_page(request.user, cursor=request.GET.get('cursor'), page_size=page_size)
+    except (InvalidCursorError, ValueError):
+        return JsonResponse({'error': 'Paramètres invalides'}, status=400)
+    return JsonResponse({
+        'results': [serialize_order(order) for order in orders],
+        'next_cursor': next_cursor,
+    })
 
 
 @login_required
 def wishlist_view(request):
     """Vue de la liste de souhaits"""
-    return render(request, 'users/wishlist.html')
\ No newline at end of file
+    return render(request, 'users/wishlist.html')
+
+
+@login_required
+def notifications_unread_count(request):
+    """Compteur de notifications non lues (badge de l'en-tête)"""
+    return JsonResponse({'unread': get_unread_count(request.user.pk)})
+
+
+@login_required
+@require_POST
+def notifications_mark_all_read(request):
+    """Tout marquer comme lu"""
+    return JsonResponse({'success': True, 'updated': mark_all_read(request.user.pk)})
+
+
+def _sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _event_stream(user_id, unread):
+    keepalive = getattr(settings, 'PUSH_KEEPALIVE_SECONDS', 25)
+    # Durée maximale d'une connexion : EventSource se reconnecte seul
+    deadline = time.monotonic() + getattr(settings, 'PUSH_STREAM_MAX_SECONDS', 300)
+    async with hub.subscribe(user_id) as queue:
+        yield "retry: 5000\n\n"
+        yield _sse('unread', {'unread': unread})
+        while time.monotonic() < deadline:
+            try:
+                event = await asyncio.wait_for(queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield _sse(event['type'], event['data'])
+
+
+async def events_stream(request):
+    """
+    Flux SSE des notifications et changements de statut de commande
+
+    Remplace l'interrogation périodique : une connexion ouverte ne coûte
+    qu'une coroutine en attente dans le processus ASGI. Sous WSGI (runserver,
+    gunicorn sync), Django lirait le flux en entier avant de répondre : le
+    point d'entrée est alors refusé.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'Flux temps réel indisponible sur ce serveur'}, status=503)
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return JsonResponse({'error': 'Authentification requise'}, status=401)
+    unread = await sync_to_async(get_unread_count)(user.pk)
+    response = StreamingHttpResponse(_event_stream(user.pk, unread), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Pas de mise en tampon côté proxy (nginx)
+    response['X-Accel-Buffering'] = 'no'
+    return response